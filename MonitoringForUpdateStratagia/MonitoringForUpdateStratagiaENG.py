@@ -2,13 +2,36 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackContext, CallbackQueryHandler
 from datetime import datetime, timedelta
+from collections import namedtuple
 from dotenv import load_dotenv
-import requests
+from aiohttp import web
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
 import logging
+import multiprocessing
 import aiohttp
 import asyncio
+import contextlib
+import tempfile
+import shutil
+import threading
+import traceback
+import random
+import json
+import sqlite3
+import time
+import posixpath
+import hashlib
+import importlib.util
+import py_compile
+import marshal
+import types
+import hmac
+import secrets
+import signal
+import codecs
 import pytz
 import re
+import sys
 import os
 
 # Setting up logging
@@ -27,14 +50,303 @@ FILE_URL = os.getenv("FILE_URL")  # URL for downloading the file
 LOCAL_FILE_PATH = os.getenv("LOCAL_FILE_PATH")  # Local file path
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL"))  # Update check interval
 RETRY_LIMIT = int(os.getenv("RETRY_LIMIT"))  # Retry limit for downloading
-RETRY_DELAY = int(os.getenv("RETRY_DELAY"))  # Delay between retries
+RETRY_DELAY = int(os.getenv("RETRY_DELAY"))  # Longest delay between retries
 REPO_URL = os.getenv("REPO_URL")  # GitHub repository URL
 REMOTE_FILE_PATH = os.getenv("REMOTE_FILE_PATH")  # Path to the file in the repository
 TIMEZONE = os.getenv("TIMEZONE")  # Timezone
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "20"))  # Total number of pooled HTTP connections
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "4"))  # Number of pooled connections per host
+HTTP_KEEPALIVE_TIMEOUT = int(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))  # How long an idle connection is kept open
+DNS_CACHE_TTL = int(os.getenv("DNS_CACHE_TTL", "300"))  # How long resolved host names are cached
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "100"))  # Maximum number of queued Telegram messages
+CHECK_MODE = os.getenv("CHECK_MODE", "version").lower()  # "version" compares version strings, "blob" compares git blob SHAs first
+TARGETS_FILE = os.getenv("TARGETS_FILE")  # JSON file with the list of monitored files (optional)
+MAX_CONCURRENT_CHECKS = int(os.getenv("MAX_CONCURRENT_CHECKS", "4"))  # How many files are checked at the same time
+FREQTRADE_INSTANCES_FILE = os.getenv("FREQTRADE_INSTANCES_FILE")  # JSON file with the list of Freqtrade instances to reload (optional)
+RELOAD_TIMEOUT = int(os.getenv("RELOAD_TIMEOUT", "30"))  # How long to wait for the reload of one Freqtrade instance
+FREQTRADE_API_URL = os.getenv("FREQTRADE_API_URL")  # Freqtrade REST API address, e.g. http://127.0.0.1:8080 (optional, Telegram is used without it)
+FREQTRADE_API_USERNAME = os.getenv("FREQTRADE_API_USERNAME")  # Freqtrade REST API username
+FREQTRADE_API_PASSWORD = os.getenv("FREQTRADE_API_PASSWORD")  # Freqtrade REST API password
+STRATEGY_CHECK = os.getenv("STRATEGY_CHECK", "true").lower() == "true"  # Compile and import a downloaded strategy in a worker process before it replaces the live file
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR") or os.path.join(os.path.dirname(os.path.abspath(LOCAL_FILE_PATH)), ".snapshots")  # Store of the downloaded versions on the Update volume
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "10"))  # How many versions of every file are kept for a rollback
+SNAPSHOT_LINK = os.getenv("SNAPSHOT_LINK", "hardlink").lower()  # How the live file points to its version: "hardlink" or "symlink"
+STATE_DB = os.getenv("STATE_DB") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "monitor_state.sqlite3")  # SQLite database with the state that survives a restart, kept out of the strategies folder
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8000"))  # Port of the built-in web server, 0 disables it
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")  # Secret of the GitHub push webhook
+WEBHOOK_FALLBACK_INTERVAL = int(os.getenv("WEBHOOK_FALLBACK_INTERVAL", "21600"))  # Polling interval while the webhook is configured
+TELEGRAM_MODE = os.getenv("TELEGRAM_MODE", "polling").lower()  # How the bot receives Telegram updates: "polling" or "webhook"
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")  # Public HTTPS address of /telegram on the web server, e.g. https://example.com/telegram
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET") or secrets.token_urlsafe(32)  # Secret token of the Telegram webhook, a random one if not set
+ADAPTIVE_POLLING = os.getenv("ADAPTIVE_POLLING", "false").lower() == "true"  # Adapt the check interval to the commit activity of the repository
+POLL_MIN_INTERVAL = int(os.getenv("POLL_MIN_INTERVAL", "60"))  # Shortest adaptive check interval
+POLL_MAX_INTERVAL = int(os.getenv("POLL_MAX_INTERVAL", "14400"))  # Longest adaptive check interval
+POLL_ACTIVE_WINDOW = int(os.getenv("POLL_ACTIVE_WINDOW", "3600"))  # How long after a commit the shortest interval is used
+POLL_JITTER = float(os.getenv("POLL_JITTER", "0.1"))  # Random spread of the adaptive interval (0.1 = ±10%)
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0.5"))  # Event loop stalls longer than this (seconds) are logged with the blocking stack
+VERSION_CACHE_TTL = float(os.getenv("VERSION_CACHE_TTL", "30"))  # How long (seconds) a remote version answers repeated lookups without a request
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")  # GitHub token for API requests (optional, raises the limit from 60 to 5000 requests per hour)
+GITHUB_INTERACTIVE_RESERVE = int(os.getenv("GITHUB_INTERACTIVE_RESERVE", "10"))  # API requests kept for periodic checks, buttons are refused below it
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "3"))  # Seconds before alternative sources join a slow download
+HEDGE_SOURCES = [source.strip() for source in os.getenv("HEDGE_SOURCES", "contents,jsdelivr").lower().split(",") if source.strip()]  # Built-in alternative sources
+DOWNLOAD_MIRRORS = [url.strip() for url in os.getenv("DOWNLOAD_MIRRORS", "").split(",") if url.strip()]  # URL templates of own mirrors with {repo} and {path}
+GITHUB_API_MODE = os.getenv("GITHUB_API_MODE", "rest").lower()  # "graphql" gets the version and the commits for /start and the buttons in one request
+GRAPHQL_URL = os.getenv("GRAPHQL_URL", "https://api.github.com/graphql")  # GitHub GraphQL endpoint
+
+# The GitHub GraphQL API answers only with a token, without one every status request would fail
+if GITHUB_API_MODE == "graphql" and not GITHUB_TOKEN:
+    logger.warning("GITHUB_API_MODE=graphql needs GITHUB_TOKEN, the REST API is used.")
+    GITHUB_API_MODE = "rest"
 
 # Version bot
 BOT_VERSION = "v1.15"
 
+# Pattern of the version string returned by the strategy's version() method
+VERSION_PATTERN = re.compile(r'return\s+[\'\"](v[\d.]+)[\'\"]')
+STREAM_CHUNK_SIZE = 16 * 1024  # Size of the chunks read from the remote file
+VERSION_SCAN_LIMIT = 256 * 1024  # How many bytes of a strategy file to read while looking for the version
+WRITE_BUFFER_SIZE = 256 * 1024  # Downloaded data is written to disk in blocks of this size off the event loop
+RETRY_BASE_DELAY = 2  # The first retry waits up to this many seconds, every next one up to twice as long
+GRAPHQL_COMMIT_COUNT = 100  # Commits requested with the GraphQL status, as many as one page of the REST API
+RELOAD_POLL_INTERVAL = 0.5  # How often a reloading Freqtrade instance is asked whether it is running again
+STRATEGY_CHECK_TIMEOUT = 300  # Longest time the compile and import check of a strategy may take
+CHECK_HISTORY_LIMIT = 1000  # How many checks of every file are kept in the state database
+POLL_BACKOFF_FACTOR = 0.25  # Outside the active window the interval is a quarter of the time since the last commit
+
+# Class name of a strategy file
+def strategy_class_name(file_path):
+    """Returns the class a strategy file is expected to define (Freqtrade names it after the file), None for other files."""
+    return os.path.splitext(os.path.basename(file_path))[0] if file_path.endswith(".py") else None
+
+# Load the list of monitored files
+def load_targets():
+    """Returns the monitored files from TARGETS_FILE, or a single target built from the .env settings."""
+    if not TARGETS_FILE:
+        return [{
+            "name": posixpath.basename(REMOTE_FILE_PATH),
+            "repo": REPO_URL,
+            "remote_path": REMOTE_FILE_PATH,
+            "local_path": LOCAL_FILE_PATH,
+            "url": FILE_URL,
+            "interval": CHECK_INTERVAL,
+            "mode": CHECK_MODE,
+            "versioned": True,
+            "reload": True,
+            "adaptive": ADAPTIVE_POLLING,
+            "strategy_class": strategy_class_name(LOCAL_FILE_PATH),
+        }]
+    with open(TARGETS_FILE, encoding="utf-8") as f:
+        entries = json.load(f)
+    targets = []
+    for entry in entries:
+        repo = entry.get("repo", REPO_URL)
+        remote_path = entry["remote_path"]
+        versioned = entry.get("versioned", remote_path.endswith(".py"))
+        targets.append({
+            "name": entry.get("name", posixpath.basename(remote_path)),
+            "repo": repo,
+            "remote_path": remote_path,
+            "local_path": entry["local_path"],
+            "url": entry.get("url", f"https://raw.githubusercontent.com/{repo}/main/{remote_path}"),
+            "interval": int(entry.get("interval", CHECK_INTERVAL)),
+            "mode": entry.get("mode", CHECK_MODE).lower() if versioned else "blob",
+            "versioned": versioned,
+            "reload": entry.get("reload", True),
+            "adaptive": entry.get("adaptive", ADAPTIVE_POLLING),
+            "strategy_class": entry.get("strategy_class", strategy_class_name(entry["local_path"])),
+        })
+    return targets
+
+# Monitored files
+TARGETS = load_targets()
+
+# Load the list of Freqtrade instances
+def load_freqtrade_instances():
+    """Returns the Freqtrade instances from FREQTRADE_INSTANCES_FILE, or the single instance from .env."""
+    if not FREQTRADE_INSTANCES_FILE:
+        return [{"name": "Freqtrade", "token": FREQTRADE_BOT_TOKEN, "chat_id": FREQTRADE_CHAT_ID,
+                 "api_url": FREQTRADE_API_URL, "username": FREQTRADE_API_USERNAME, "password": FREQTRADE_API_PASSWORD}]
+    with open(FREQTRADE_INSTANCES_FILE, encoding="utf-8") as f:
+        entries = json.load(f)
+    return [{
+        "name": entry.get("name", f"Freqtrade {number}"),
+        "token": entry.get("token", FREQTRADE_BOT_TOKEN),
+        "chat_id": str(entry.get("chat_id", FREQTRADE_CHAT_ID)),
+        "api_url": entry.get("api_url"),
+        "username": entry.get("username", FREQTRADE_API_USERNAME),
+        "password": entry.get("password", FREQTRADE_API_PASSWORD),
+    } for number, entry in enumerate(entries, 1)]
+
+# Freqtrade instances that share the strategies volume
+FREQTRADE_INSTANCES = load_freqtrade_instances()
+
+# Shared HTTP session for all GitHub requests, created on startup and closed on shutdown
+HTTP_SESSION = None
+
+# Connection pool statistics
+HTTP_STATS = {
+    "requests": 0,
+    "connections_created": 0,
+    "connections_reused": 0,
+    "dns_lookups": 0,
+    "dns_cache_hits": 0,
+}
+
+# Prometheus metrics served on /metrics
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+CHECK_DURATION = Histogram("monitor_check_duration_seconds", "Duration of an update check cycle", ["target"], buckets=DURATION_BUCKETS)
+CHECKS_TOTAL = Counter("monitor_checks_total", "Update checks", ["target"])
+CHECK_ERRORS = Counter("monitor_check_errors_total", "Update checks that failed", ["target"])
+UPDATES_TOTAL = Counter("monitor_updates_total", "Updates downloaded", ["target"])
+LAST_CHECK_TIME = Gauge("monitor_last_check_timestamp_seconds", "Unix time of the last finished check", ["target"])
+NEXT_CHECK_TIME = Gauge("monitor_next_check_timestamp_seconds", "Unix time of the next scheduled check", ["target"])
+HTTP_REQUEST_DURATION = Histogram("monitor_http_request_duration_seconds", "Time until the response headers arrive", ["host"])
+HTTP_RESPONSES = Counter("monitor_http_responses_total", "HTTP responses by status (error = no response)", ["host", "status"])
+HTTP_RECEIVED_BYTES = Counter("monitor_http_received_bytes_total", "Response body bytes received", ["host"])
+DOWNLOAD_RESUMES = Counter("monitor_download_resumes_total", "Downloads continued from a partial file with a Range request")
+DOWNLOAD_DURATION = Histogram("monitor_download_duration_seconds", "Duration of a download that replaced a file, including retries", buckets=DURATION_BUCKETS)
+TELEGRAM_LATENCY = Histogram("monitor_telegram_send_duration_seconds", "Latency of a Telegram sendMessage call")
+TELEGRAM_ERRORS = Counter("monitor_telegram_errors_total", "Telegram messages that failed or hit the rate limit", ["reason"])
+RELOAD_DURATION = Histogram("monitor_reload_duration_seconds", "Round trip of a Freqtrade reload command", ["instance"], buckets=DURATION_BUCKETS)
+GITHUB_RATE_REMAINING = Gauge("monitor_github_rate_limit_remaining", "GitHub API requests left in the current rate limit window")
+GITHUB_RATE_DEFERRED = Counter("monitor_github_requests_deferred_total", "GitHub API requests not sent because of the rate limit", ["priority"])
+HEDGE_WINS = Counter("monitor_download_source_wins_total", "Downloads won by each source", ["source"])
+VERSION_LOOKUPS = Counter("monitor_version_lookups_total", "Remote version lookups by source (memo, shared, request)", ["source"])
+STRATEGY_CHECK_DURATION = Histogram("monitor_strategy_check_duration_seconds", "Duration of the pre-reload strategy check by step (compile, import)", ["step"], buckets=DURATION_BUCKETS)
+STRATEGY_CHECK_ERRORS = Counter("monitor_strategy_check_errors_total", "Downloaded strategies that failed to compile or import", ["target"])
+SNAPSHOT_STORE_BYTES = Gauge("monitor_snapshot_store_bytes", "Disk space used by the stored versions")
+RELOAD_ERRORS = Counter("monitor_reload_errors_total", "Freqtrade reloads that failed or timed out", ["instance"])
+LOOP_LAG = Histogram("monitor_event_loop_lag_seconds", "Delay of a timer in the event loop",
+                     buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+LOOP_STALLS = Counter("monitor_event_loop_stalls_total", "Event loop stalls longer than LOOP_STALL_THRESHOLD")
+LOOP_LAG_INTERVAL = 1.0  # How often the event loop lag is measured
+
+# Record the start of an HTTP request
+async def on_http_request_start(session, context, params):
+    """Remembers when the request was sent."""
+    context.started = asyncio.get_running_loop().time()
+
+# Record the response of an HTTP request
+async def on_http_request_end(session, context, params):
+    """Records the latency and the status of the response per host."""
+    host = params.url.host
+    HTTP_REQUEST_DURATION.labels(host).observe(asyncio.get_running_loop().time() - context.started)
+    HTTP_RESPONSES.labels(host, str(params.response.status)).inc()
+
+# Record a failed HTTP request
+async def on_http_request_exception(session, context, params):
+    """Counts requests that got no response."""
+    HTTP_RESPONSES.labels(params.url.host, "error").inc()
+
+# Count the received body bytes
+async def on_http_chunk_received(session, context, params):
+    """Counts the bytes of the response body per host."""
+    HTTP_RECEIVED_BYTES.labels(params.url.host).inc(len(params.chunk))
+
+# Count an event of the HTTP client
+def http_stats_counter(key):
+    """Returns a trace callback that increments the given HTTP_STATS counter."""
+    async def callback(session, context, params):
+        HTTP_STATS[key] += 1
+    return callback
+
+# Create the pooled HTTP session
+def create_http_session():
+    """Creates an HTTP session with connection pooling, keep-alive and a DNS cache."""
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+    )
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(http_stats_counter("requests"))
+    trace_config.on_connection_create_end.append(http_stats_counter("connections_created"))
+    trace_config.on_connection_reuseconn.append(http_stats_counter("connections_reused"))
+    trace_config.on_dns_resolvehost_end.append(http_stats_counter("dns_lookups"))
+    trace_config.on_dns_cache_hit.append(http_stats_counter("dns_cache_hits"))
+    trace_config.on_request_start.append(on_http_request_start)
+    trace_config.on_request_end.append(on_http_request_end)
+    trace_config.on_request_exception.append(on_http_request_exception)
+    trace_config.on_response_chunk_received.append(on_http_chunk_received)
+    return aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+
+# Get the shared HTTP session
+def get_http_session():
+    """Returns the shared HTTP session, creating it on first use."""
+    global HTTP_SESSION
+    if HTTP_SESSION is None or HTTP_SESSION.closed:
+        HTTP_SESSION = create_http_session()
+    return HTTP_SESSION
+
+# Connection pool statistics for the logs
+def format_http_stats():
+    """Returns the connection pool statistics as a single line."""
+    return (f"HTTP requests: {HTTP_STATS['requests']}, connections created: {HTTP_STATS['connections_created']}, "
+            f"reused: {HTTP_STATS['connections_reused']}, DNS lookups: {HTTP_STATS['dns_lookups']}, "
+            f"DNS cache hits: {HTTP_STATS['dns_cache_hits']}")
+
+# GitHub API rate limit from the last response: limit, remaining requests and reset time (Unix time)
+GITHUB_BUDGET = {"limit": None, "remaining": None, "reset": 0.0}
+
+# Raised instead of sending a GitHub API request that would exceed the rate limit
+class GitHubRateLimitError(Exception):
+    def __init__(self, reset):
+        super().__init__(f"GitHub API rate limit reached until {datetime.fromtimestamp(reset, pytz.timezone(TIMEZONE)).strftime('%H:%M:%S')}")
+        self.reset = reset
+
+# Check the GitHub API budget before a request
+def check_github_budget(interactive):
+    """Raises GitHubRateLimitError if the request should not be sent."""
+    remaining, reset = GITHUB_BUDGET["remaining"], GITHUB_BUDGET["reset"]
+    if remaining is None or time.time() >= reset:
+        return
+    # Buttons stop GITHUB_INTERACTIVE_RESERVE requests earlier, the rest is kept for the update checks
+    floor = GITHUB_INTERACTIVE_RESERVE if interactive else 0
+    if remaining <= floor:
+        GITHUB_RATE_DEFERRED.labels("interactive" if interactive else "periodic").inc()
+        raise GitHubRateLimitError(reset)
+
+# Remember the GitHub API budget from the response headers
+def update_github_budget(response):
+    """Reads the X-RateLimit-* and Retry-After headers of a GitHub API response."""
+    headers = response.headers
+    if "X-RateLimit-Remaining" in headers:
+        GITHUB_BUDGET["limit"] = int(headers.get("X-RateLimit-Limit", 0))
+        GITHUB_BUDGET["remaining"] = int(headers["X-RateLimit-Remaining"])
+        GITHUB_BUDGET["reset"] = float(headers.get("X-RateLimit-Reset", 0))
+        GITHUB_RATE_REMAINING.set(GITHUB_BUDGET["remaining"])
+    if response.status in (403, 429) and (GITHUB_BUDGET["remaining"] == 0 or "Retry-After" in headers):
+        # Primary or secondary rate limit, nothing is sent until the reset
+        if "Retry-After" in headers:
+            GITHUB_BUDGET["reset"] = time.time() + int(headers["Retry-After"])
+        GITHUB_BUDGET["remaining"] = 0
+        GITHUB_RATE_REMAINING.set(0)
+        logger.warning(f"GitHub API rate limit reached, requests are deferred until "
+                       f"{datetime.fromtimestamp(GITHUB_BUDGET['reset'], pytz.timezone(TIMEZONE)).strftime('%H:%M:%S')}")
+
+# Request to the GitHub API
+@contextlib.asynccontextmanager
+async def github_api_get(url, headers=None, interactive=False):
+    """Sends a GET request to the GitHub API with the token and rate limit tracking, used as "async with"."""
+    # Nothing is sent while the budget is exhausted
+    check_github_budget(interactive)
+    headers = dict(headers or {})
+    headers.setdefault("Accept", "application/vnd.github+json")
+    if GITHUB_TOKEN:
+        headers["Authorization"] = f"Bearer {GITHUB_TOKEN}"
+    async with get_http_session().get(url, headers=headers) as response:
+        update_github_budget(response)
+        yield response
+
+# GitHub API budget for the status list
+def format_github_budget():
+    """Returns the remaining GitHub API requests as a single line."""
+    if GITHUB_BUDGET["remaining"] is None:
+        return "🔑 GitHub API: no requests yet"
+    reset = datetime.fromtimestamp(GITHUB_BUDGET["reset"], pytz.timezone(TIMEZONE)).strftime('%H:%M:%S')
+    return f"🔑 GitHub API: {GITHUB_BUDGET['remaining']}/{GITHUB_BUDGET['limit']} requests left, reset at {reset}"
+
 # Logging incoming messages
 async def log_telegram_message(update: Update):
     """Logs incoming messages in Telegram."""
@@ -43,82 +355,590 @@ async def log_telegram_message(update: Update):
     elif update.callback_query:
         logger.info(f"Incoming callback from {update.callback_query.from_user.username} ({update.callback_query.from_user.id}): {update.callback_query.data}")
 
+# Outbound Telegram queue and the worker that delivers it
+NOTIFY_QUEUE = None
+NOTIFY_WORKER = None
+TELEGRAM_SEND_ATTEMPTS = 5  # How many times a message is retried after a 429 response
+LAST_SENT_AT = {}  # Time of the last message sent to each chat
+
+# Notifier statistics
+NOTIFY_STATS = {
+    "sent": 0,
+    "failed": 0,
+    "dropped": 0,
+    "rate_limited": 0,
+    "latency_total": 0.0,
+    "latency_max": 0.0,
+}
+
+# Start the Telegram notifier
+def start_telegram_notifier():
+    """Creates the outbound queue and starts the worker if it is not running yet."""
+    global NOTIFY_QUEUE, NOTIFY_WORKER
+    if NOTIFY_QUEUE is None:
+        NOTIFY_QUEUE = asyncio.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+    if NOTIFY_WORKER is None or NOTIFY_WORKER.done():
+        NOTIFY_WORKER = asyncio.create_task(telegram_notifier_worker())
+
+# Stop the Telegram notifier
+async def stop_telegram_notifier(timeout=10):
+    """Waits for the queued messages to be delivered and stops the worker."""
+    if NOTIFY_WORKER is None:
+        return
+    try:
+        await asyncio.wait_for(NOTIFY_QUEUE.join(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Telegram queue was not drained, {NOTIFY_QUEUE.qsize()} messages are lost.")
+    NOTIFY_WORKER.cancel()
+
 # Logging sent messages
-def send_telegram_message(token, chat_id, message):
+async def send_telegram_message(token, chat_id, message):
+    """Queues a message for Telegram without blocking the event loop."""
+    start_telegram_notifier()
+    try:
+        NOTIFY_QUEUE.put_nowait((token, chat_id, message))
+    except asyncio.QueueFull:
+        NOTIFY_STATS["dropped"] += 1
+        logger.error(f"Telegram queue is full, message dropped: {message}")
+
+# Deliver queued messages one by one
+async def telegram_notifier_worker():
+    """Takes messages from the queue and delivers them to Telegram."""
+    while True:
+        token, chat_id, message = await NOTIFY_QUEUE.get()
+        try:
+            await deliver_telegram_message(token, chat_id, message)
+        except Exception as e:
+            NOTIFY_STATS["failed"] += 1
+            TELEGRAM_ERRORS.labels("failed").inc()
+            logger.error(f"Error sending message to Telegram: {e}")
+        finally:
+            NOTIFY_QUEUE.task_done()
+
+# Send one message honouring Telegram rate limits
+async def deliver_telegram_message(token, chat_id, message):
     """Sends a message to Telegram and logs the response."""
     url = f"https://api.telegram.org/bot{token}/sendMessage"
     payload = {"chat_id": chat_id, "text": message}
-    response = requests.post(url, json=payload)
-    logger.info(f"Sending message: {message}")
-    logger.info(f"Response from Telegram API: {response.text}")
-    response.raise_for_status()  # Will raise an exception if there is an error
+    loop = asyncio.get_running_loop()
+    # Telegram allows about one message per second in a private chat and 20 per minute in a group
+    chat_interval = 3.0 if str(chat_id).startswith("-") else 1.0
+    for attempt in range(1, TELEGRAM_SEND_ATTEMPTS + 1):
+        pause = LAST_SENT_AT.get(chat_id, 0) + chat_interval - loop.time()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        started = loop.time()
+        async with get_http_session().post(url, json=payload) as response:
+            LAST_SENT_AT[chat_id] = loop.time()
+            result = await response.json(content_type=None)
+            logger.info(f"Sending message: {message}")
+            logger.info(f"Response from Telegram API: {result}")
+            if response.status == 429:
+                # Telegram tells how long to wait before the next attempt
+                retry_after = result.get("parameters", {}).get("retry_after", 1)
+                NOTIFY_STATS["rate_limited"] += 1
+                TELEGRAM_ERRORS.labels("rate_limited").inc()
+                logger.warning(f"Telegram rate limit reached, retrying in {retry_after} sec.")
+                await asyncio.sleep(retry_after)
+                continue
+            if response.status >= 400:
+                # The URL contains the bot token, so it is not included in the error
+                raise RuntimeError(f"Telegram API error {response.status}: {result.get('description')}")
+        latency = loop.time() - started
+        TELEGRAM_LATENCY.observe(latency)
+        NOTIFY_STATS["sent"] += 1
+        NOTIFY_STATS["latency_total"] += latency
+        NOTIFY_STATS["latency_max"] = max(NOTIFY_STATS["latency_max"], latency)
+        return
+    raise RuntimeError(f"Telegram rate limit: message not sent after {TELEGRAM_SEND_ATTEMPTS} attempts")
 
-# Function to restart Freqtrade
-async def reload_freqtrade(update: Update, context: CallbackContext):
-    """Sends a command to restart Freqtrade in another bot."""
-    logger.info("Processing the 'Restart Freqtrade' button.")
+# Notifier statistics for the logs
+def format_notifier_stats():
+    """Returns the queue depth and send latency of the Telegram notifier as a single line."""
+    depth = NOTIFY_QUEUE.qsize() if NOTIFY_QUEUE else 0
+    average = NOTIFY_STATS["latency_total"] / NOTIFY_STATS["sent"] if NOTIFY_STATS["sent"] else 0.0
+    return (f"Telegram queue: {depth}, sent: {NOTIFY_STATS['sent']}, failed: {NOTIFY_STATS['failed']}, "
+            f"dropped: {NOTIFY_STATS['dropped']}, 429 responses: {NOTIFY_STATS['rate_limited']}, "
+            f"latency avg/max: {average * 1000:.0f}/{NOTIFY_STATS['latency_max'] * 1000:.0f} ms")
+
+# Credentials of the Freqtrade REST API
+def freqtrade_api_auth(instance):
+    """Returns the basic auth of the instance or None if no username is configured."""
+    return aiohttp.BasicAuth(instance["username"], instance["password"] or "") if instance["username"] else None
+
+# Send the reload command to one Freqtrade instance
+async def send_reload_command(instance):
+    """Asks the instance to reload its configuration and returns "api" or "telegram"."""
+    if instance["api_url"]:
+        try:
+            url = f"{instance['api_url'].rstrip('/')}/api/v1/reload_config"
+            async with get_http_session().post(url, auth=freqtrade_api_auth(instance)) as response:
+                response.raise_for_status()
+            return "api"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if not instance["token"]:
+                raise
+            logger.warning(f"REST API of {instance['name']} is not available, sending /reload_config through Telegram: {e}")
+    # Telegram is the fallback when the REST API is not configured or does not accept the command
+    await deliver_telegram_message(instance["token"], instance["chat_id"], "/reload_config")
+    return "telegram"
+
+# Wait until a reloaded Freqtrade instance runs again
+async def wait_for_freqtrade(instance):
+    """Polls /api/v1/ping and /api/v1/show_config until the bot is running again."""
+    base_url = instance["api_url"].rstrip("/")
+    session = get_http_session()
+    while True:
+        await asyncio.sleep(RELOAD_POLL_INTERVAL)
+        try:
+            async with session.get(f"{base_url}/api/v1/ping") as response:
+                if response.status != 200:
+                    continue
+            async with session.get(f"{base_url}/api/v1/show_config", auth=freqtrade_api_auth(instance)) as response:
+                if response.status != 200:
+                    continue
+                config = await response.json()
+        # The API server restarts together with the bot, errors only mean "not yet"
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            continue
+        if config.get("state") == "running":
+            return f"{config.get('strategy')} {config.get('strategy_version') or ''}".strip()
+
+# Reload one Freqtrade instance
+async def reload_instance(instance):
+    """Reloads one Freqtrade instance and returns (name, error, elapsed, strategy)."""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    strategy = None
     try:
-        # Sending the restart command
-        send_telegram_message(FREQTRADE_BOT_TOKEN, FREQTRADE_CHAT_ID, "/reload_config")
-        message = "The Freqtrade restart command has been sent."
+        # Sent directly rather than through the notifier queue, so the instances reload in parallel
+        path = await asyncio.wait_for(send_reload_command(instance), RELOAD_TIMEOUT)
+        if path == "api":
+            strategy = await asyncio.wait_for(wait_for_freqtrade(instance), RELOAD_TIMEOUT - (loop.time() - started))
+        error = None
+    except asyncio.TimeoutError:
+        error = f"no response in {RELOAD_TIMEOUT} sec"
+    except Exception as e:
+        error = str(e)
+    elapsed = loop.time() - started
+    RELOAD_DURATION.labels(instance["name"]).observe(elapsed)
+    if error:
+        RELOAD_ERRORS.labels(instance["name"]).inc()
+    return instance["name"], error, elapsed, strategy
 
-        # Check if callback_query exists and send a response
-        if update and update.callback_query:
-            await update.callback_query.message.reply_text(message)
+# Reload all Freqtrade instances at once
+async def reload_all_instances():
+    """Reloads every Freqtrade instance concurrently and returns one summary message and the results."""
+    results = await asyncio.gather(*(reload_instance(instance) for instance in FREQTRADE_INSTANCES))
+    failed = [result for result in results if result[1]]
+    lines = [f"🔄 Freqtrade reload: {len(results) - len(failed)}/{len(results)} succeeded"]
+    for name, error, elapsed, strategy in results:
+        if error:
+            lines.append(f"❌ {name}: {error}")
+            logger.error(f"Error sending restart command to {name}: {error}")
+        elif strategy:
+            lines.append(f"✅ {name}: running again in {elapsed:.1f} sec, {strategy}")
         else:
-            logger.warning("Restart initiated without interaction from Telegram.")
+            lines.append(f"✅ {name} ({elapsed:.1f} sec)")
+    return "\n".join(lines), results
 
-        logger.info("The Freqtrade restart command was successfully sent.")
-    except Exception as e:
-        logger.error(f"Error sending restart command: {e}")
+# Function to restart Freqtrade
+async def reload_freqtrade(update: Update, context: CallbackContext):
+    """Sends a command to restart Freqtrade to every configured instance."""
+    logger.info("Processing the 'Restart Freqtrade' button.")
+    summary, results = await reload_all_instances()
+    logger.info(summary)
+    if len(results) == 1:
+        # A single instance keeps the short answer
+        name, error, elapsed, strategy = results[0]
+        if error:
+            summary = f"❌ Failed to send the command: {error}"
+        elif strategy:
+            summary = f"✅ Freqtrade reloaded and running again in {elapsed:.1f} sec. Strategy: {strategy}"
+        else:
+            summary = "The Freqtrade restart command has been sent."
 
-        # Send an error message if callback_query exists
-        if update and update.callback_query:
-            await update.callback_query.message.reply_text(f"❌ Failed to send the command: {e}")
+    # Check if callback_query exists and send a response
+    if update and update.callback_query:
+        await update.callback_query.message.reply_text(summary)
+    else:
+        logger.warning("Restart initiated without interaction from Telegram.")
+        if len(results) > 1 or results[0][1] or results[0][3]:
+            await send_telegram_message(TELEGRAM_TOKEN, CHAT_ID, summary)  # One summary instead of a message per instance
 
 # Asynchronous file download with retries
-async def download_file_with_retries(url, save_path, retries=RETRY_LIMIT, delay=RETRY_DELAY):
+async def download_file_with_retries(url, save_path, retries=RETRY_LIMIT, delay=RETRY_DELAY, known_version=None, versioned=True):
     """Asynchronous version of file download with retries."""
-    async with aiohttp.ClientSession() as session:
-        for attempt in range(1, retries + 1):
+    started = time.monotonic()
+    for attempt in range(1, retries + 1):
+        try:
+            logger.info(f"Attempt {attempt}/{retries} to download...")
+            status, version, saved = await fetch_shared_file_content(url, known_version, save_path, versioned)
+            if not saved:
+                logger.info(f"Nothing to download. Remote version: {version}")
+                return version, False
+            logger.info("File downloaded successfully.")
+            DOWNLOAD_DURATION.observe(time.monotonic() - started)
+            return version, True
+        except StrategyCheckError:
+            raise  # Downloading the same file again does not help
+        except Exception as e:
+            logger.error(f"Attempt {attempt}/{retries} failed: {e}")
+            if attempt < retries:
+                # Exponential backoff with full jitter, capped by delay
+                pause = random.uniform(0, min(delay, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+                logger.info(f"Next attempt in {pause:.1f} s.")
+                await asyncio.sleep(pause)
+            else:
+                # A partial file is kept, the next check continues it
+                logger.error("All attempts exhausted.")
+                raise
+
+# Validators (ETag / Last-Modified) and the last known version for each watched URL
+REMOTE_FILE_CACHE = {}
+
+# Last remote version of each URL and when it was received: (monotonic time, version)
+VERSION_MEMO = {}
+
+# Version lookups in progress keyed by URL, concurrent callers await the same task
+VERSION_INFLIGHT = {}
+
+# Partially downloaded files keyed by save_path: URL, validator, version, temporary file, size and hash of the bytes written
+PARTIAL_DOWNLOADS = {}
+
+# Forget a partially downloaded file
+def discard_partial_download(save_path):
+    """Removes the resume record of save_path and its temporary file."""
+    partial = PARTIAL_DOWNLOADS.pop(save_path, None)
+    if partial and partial["temp_path"] and os.path.exists(partial["temp_path"]):
+        os.remove(partial["temp_path"])
+
+# Remove the downloads interrupted by a restart
+def remove_stale_downloads():
+    """Deletes the .<name>.*.tmp files left next to the monitored files. Runs in a worker thread."""
+    # The resume records are only kept in memory, after a restart nothing continues these files
+    for target in TARGETS:
+        directory = os.path.dirname(os.path.abspath(target["local_path"]))
+        prefix = f".{os.path.basename(target['local_path'])}."
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(directory, name))
+                    logger.info(f"Removed the interrupted download {name}.")
+                except OSError as e:
+                    logger.warning(f"Error removing the interrupted download {name}: {e}")
+
+# Check that a 206 response continues the partial file
+def resumes_partial(response, partial):
+    """Returns True if the response body starts right after the bytes already written."""
+    match = re.match(r"bytes (\d+)-", response.headers.get("Content-Range", ""))
+    return response.status == 206 and match is not None and int(match.group(1)) == partial["size"]
+
+# Read the remote file only up to the version string
+async def read_until_version(response):
+    """Reads the response chunk by chunk and stops as soon as the version string is found."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    head = bytearray()
+    text = ""
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        head += chunk
+        scan_from = max(0, len(text) - 128)  # The version string may be split between chunks
+        text += decoder.decode(chunk)
+        match = VERSION_PATTERN.search(text, scan_from)
+        if match:
+            return head, match.group(1)
+        if len(head) >= VERSION_SCAN_LIMIT:
+            break
+    return head, None
+
+# SHA-256 of a local file
+def file_sha256(file_path):
+    """Returns the SHA-256 of the file or None if it does not exist."""
+    if not os.path.exists(file_path):
+        return None
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE * 4), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Write the rest of a file and flush it to disk
+def write_and_sync(f, data):
+    """Writes the data and waits until the file is on disk. Runs in a worker thread."""
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+
+# Move a finished temporary file into place
+def replace_and_sync(temp_path, save_path):
+    """Replaces save_path with temp_path and persists the rename. Runs in a worker thread."""
+    directory = os.path.dirname(os.path.abspath(save_path))
+    # Keep the permissions of the current file, mkstemp creates it readable only by the owner
+    mode = os.stat(save_path).st_mode if os.path.exists(save_path) else 0o644
+    os.chmod(temp_path, mode & 0o777)
+    os.replace(temp_path, save_path)
+    sync_directory(directory)  # Persist the rename itself
+
+# Persist the renames in a directory
+def sync_directory(directory):
+    """Flushes the directory entry changes to disk. Runs in a worker thread."""
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+# Raised instead of replacing the live file with a strategy that failed the check
+class StrategyCheckError(Exception):
+    def __init__(self, error, version, blob_sha):
+        super().__init__(error)
+        self.version = version
+        self.blob_sha = blob_sha
+
+# Check a downloaded strategy before it replaces the live file
+async def check_download(temp_path, save_path):
+    """Runs check_strategy on the temporary file of a monitored strategy, raising StrategyCheckError if it fails."""
+    target = next((target for target in TARGETS if target["local_path"] == save_path), None)
+    if target is None or not target["strategy_class"] or not STRATEGY_CHECK:
+        return
+    blob_sha = await asyncio.to_thread(compute_blob_sha, temp_path, os.path.getsize(temp_path))
+    rejected = REJECTED_DOWNLOADS.get(target["name"])
+    if rejected and rejected["blob_sha"] == blob_sha:
+        error = rejected["error"]  # The same file failed before, it is not checked again
+    else:
+        error = await check_strategy(target, temp_path)
+    if error:
+        if target["versioned"]:
+            version = await asyncio.to_thread(extract_version_from_file, temp_path)
+            LOCAL_VERSION_CACHE.pop(temp_path, None)
+        else:
+            version = blob_sha[:7]
+        raise StrategyCheckError(error, version, blob_sha)
+
+# Write the downloaded file atomically
+async def save_stream_atomically(head, chunks, save_path, partial=None):
+    """Streams the file into a temporary file next to save_path and moves it into place."""
+    directory = os.path.dirname(os.path.abspath(save_path))
+    # A resume record that already has a temporary file is continued
+    if partial and partial["temp_path"]:
+        temp_path, digest, size = partial["temp_path"], partial["digest"], partial["size"]
+        f = open(temp_path, "ab")
+    else:
+        fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(save_path)}.", suffix=".tmp", dir=directory)
+        f = os.fdopen(fd, "wb")
+        digest, size = hashlib.sha256(), 0
+    keep = False
+    try:
+        with f:
+            buffer = bytearray(head)
             try:
-                logger.info(f"Attempt {attempt}/{retries} to download...")
-                async with session.get(url) as response:
-                    response.raise_for_status()  # Raises an error on unsuccessful response
-                    with open(save_path, "wb") as f:
-                        f.write(await response.read())
-                logger.info("File downloaded successfully.")
-                return
-            except Exception as e:
-                logger.error(f"Attempt {attempt}/{retries} failed: {e}")
-                if attempt < retries:
-                    await asyncio.sleep(delay)  # Delay before the next attempt
-                else:
-                    logger.error("All attempts exhausted.")
+                async for chunk in chunks:
+                    buffer += chunk
+                    if len(buffer) >= WRITE_BUFFER_SIZE:
+                        await asyncio.to_thread(f.write, bytes(buffer))
+                        digest.update(buffer)
+                        size += len(buffer)
+                        buffer.clear()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError):
+                if partial is None:
                     raise
+                # Keep what has arrived, the next attempt asks only for the rest
+                await asyncio.to_thread(write_and_sync, f, bytes(buffer))
+                digest.update(buffer)
+                partial.update(temp_path=temp_path, digest=digest, size=size + len(buffer))
+                keep = True
+                logger.info(f"Kept {partial['size']} bytes of {save_path} to resume the download.")
+                raise
+            await asyncio.to_thread(write_and_sync, f, bytes(buffer))
+            digest.update(buffer)
+            size += len(buffer)
+        # The temporary file is synced before os.replace, Freqtrade never sees a partially written strategy
+        if digest.hexdigest() == await asyncio.to_thread(file_sha256, save_path):
+            os.remove(temp_path)
+            logger.info(f"Downloaded file is identical to {save_path}, nothing to replace.")
+            return False
+        # A strategy that does not compile or import never becomes the live file
+        await check_download(temp_path, save_path)
+        await asyncio.to_thread(replace_and_sync, temp_path, save_path)
+        logger.info(f"Saved {size} bytes to {save_path} (sha256 {digest.hexdigest()[:12]}).")
+        return True
+    except BaseException:
+        if not keep and os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
 
 # Fetch the content of a remote file from GitHub
-async def fetch_file_content(repo_url, file_path):
-    """Fetches the content of a file from GitHub."""
-    api_url = f"https://raw.githubusercontent.com/{repo_url}/main/{file_path}"
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(api_url) as response:
+async def fetch_file_content(url, known_version=None, save_path=None, versioned=True):
+    """Fetches a remote file with a conditional request and returns (status, version, saved)."""
+    cached = REMOTE_FILE_CACHE.get(url, {})
+    headers = {}
+    partial = PARTIAL_DOWNLOADS.get(save_path) if save_path else None
+    if partial and (partial["url"] != url or not partial["temp_path"] or not os.path.exists(partial["temp_path"])):
+        discard_partial_download(save_path)
+        partial = None
+    if partial:
+        # A partial download is continued, If-Range makes a changed file come from the start
+        headers["Range"] = f"bytes={partial['size']}-"
+        headers["If-Range"] = partial["validator"]
+    # A 304 is only useful if the cached version is all the caller needs
+    elif cached and (save_path is None or (versioned and cached["version"] == known_version)):
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    session = get_http_session()
+    async with session.get(url, headers=headers) as response:
+        if response.status == 304:
+            logger.info(f"Remote file not modified (304). Version: {cached['version']}")
+            VERSION_MEMO[url] = (time.monotonic(), cached["version"])
+            return 304, cached["version"], False
+        if partial and resumes_partial(response, partial):
+            logger.info(f"Resuming the download of {save_path} from byte {partial['size']}.")
+            DOWNLOAD_RESUMES.inc()
+            saved = await save_stream_atomically(bytearray(), response.content.iter_chunked(STREAM_CHUNK_SIZE), save_path, partial)
+            PARTIAL_DOWNLOADS.pop(save_path, None)
+            return response.status, partial["version"] or "Unknown version", saved
+        if partial:
+            discard_partial_download(save_path)  # The file has changed or the server ignored the range
+            partial = None
+        response.raise_for_status()
+        if versioned:
+            head, version = await read_until_version(response)
+        else:
+            head, version = bytearray(), None
+        # Stored before the body: a file rejected by the strategy check is then answered with a 304
+        REMOTE_FILE_CACHE[url] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "version": version or "Unknown version",
+        }
+        VERSION_MEMO[url] = (time.monotonic(), version or "Unknown version")
+        if save_path is None or (versioned and (version is None or version == known_version)):
+            response.close()  # Close the connection without downloading the rest of the file
+            logger.info(f"Version lookup read {len(head)} bytes of the remote file.")
+            saved = False
+        else:
+            etag = response.headers.get("ETag")
+            # If-Range needs a strong ETag or the modification date
+            validator = etag if etag and not etag.startswith("W/") else response.headers.get("Last-Modified")
+            if validator:
+                partial = {"url": url, "validator": validator, "version": version, "temp_path": None, "digest": None, "size": 0}
+                PARTIAL_DOWNLOADS[save_path] = partial
+            saved = await save_stream_atomically(head, response.content.iter_chunked(STREAM_CHUNK_SIZE), save_path, partial)
+            PARTIAL_DOWNLOADS.pop(save_path, None)
+        return response.status, version or "Unknown version", saved
+
+# Sources of a monitored file
+def download_sources(target):
+    """Returns the sources the file can be downloaded from, the configured URL first."""
+    repo, path = target["repo"], target["remote_path"]
+    sources = [{"name": "primary", "url": target["url"], "api": False}]
+    # The GitHub contents API and jsDelivr serve the same blob from other hosts
+    if "contents" in HEDGE_SOURCES:
+        sources.append({"name": "contents", "url": f"https://api.github.com/repos/{repo}/contents/{path}?ref=main", "api": True})
+    if "jsdelivr" in HEDGE_SOURCES:
+        sources.append({"name": "jsdelivr", "url": f"https://cdn.jsdelivr.net/gh/{repo}@main/{path}", "api": False})
+    for number, template in enumerate(DOWNLOAD_MIRRORS, 1):
+        sources.append({"name": f"mirror{number}", "url": template.format(repo=repo, path=path), "api": False})
+    return sources
+
+# Download a file from one source
+async def download_from_source(source, save_path, expected_sha):
+    """Downloads the file into its own temporary file and checks its git blob SHA."""
+    directory = os.path.dirname(os.path.abspath(save_path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(save_path)}.{source['name']}.", suffix=".tmp", dir=directory)
+    try:
+        if source["api"]:
+            request = github_api_get(source["url"], {"Accept": "application/vnd.github.raw"})
+        else:
+            request = get_http_session().get(source["url"])
+        with os.fdopen(fd, "wb") as f:
+            async with request as response:
                 response.raise_for_status()
-                return await response.text()
-        except Exception as e:
-            logger.error(f"Error fetching the file: {e}")
-            return None
+                head = bytearray()
+                buffer = bytearray()
+                size = 0
+                async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    if len(head) < VERSION_SCAN_LIMIT:
+                        head += chunk[:VERSION_SCAN_LIMIT - len(head)]
+                    buffer += chunk
+                    size += len(chunk)
+                    if len(buffer) >= WRITE_BUFFER_SIZE:
+                        await asyncio.to_thread(f.write, bytes(buffer))
+                        buffer.clear()
+            await asyncio.to_thread(write_and_sync, f, bytes(buffer))
+        sha = await asyncio.to_thread(compute_blob_sha, temp_path, size)
+        if sha != expected_sha:
+            raise RuntimeError(f"blob SHA {sha[:7]} does not match the expected {expected_sha[:7]}")
+        match = VERSION_PATTERN.search(head.decode("utf-8", errors="replace"))
+        return temp_path, match.group(1) if match else None
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
 
-# Extract the version from the file content
-def extract_version_from_content(content):
-    """Extracts the version from the file content."""
+# Race the sources of a file
+async def hedged_download(target, expected_sha):
+    """Downloads a monitored file from the first source that delivers the expected blob."""
+    save_path = target["local_path"]
+    primary, *alternatives = download_sources(target)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    pending = {asyncio.ensure_future(download_from_source(primary, save_path, expected_sha)): primary["name"]}
+    hedged = not alternatives
+    winner = None
+    errors = []
     try:
-        match = re.search(r'return\s+[\'\"](v[\d.]+)[\'\"]', content)
-        return match.group(1) if match else "Unknown version"
-    except Exception as e:
-        logger.error(f"Error extracting version: {e}")
-        return "Version extraction error"
+        # The configured URL starts alone, the others join after HEDGE_DELAY seconds or when it fails
+        while winner is None:
+            if not hedged and (not pending or loop.time() - started >= HEDGE_DELAY):
+                logger.info(f"{primary['name']} is slow or failed, racing {[source['name'] for source in alternatives]}")
+                for source in alternatives:
+                    pending[asyncio.ensure_future(download_from_source(source, save_path, expected_sha))] = source["name"]
+                hedged = True
+            if not pending:
+                break
+            timeout = None if hedged else HEDGE_DELAY - (loop.time() - started)
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = pending.pop(task)
+                if task.exception():
+                    errors.append(f"{name}: {task.exception()}")
+                    logger.warning(f"Download from {name} failed: {task.exception()}")
+                elif winner is None:
+                    winner = (name,) + task.result()
+                else:
+                    os.remove(task.result()[0])  # Finished in the same round as the winner
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    if winner is None:
+        raise RuntimeError("all download sources failed: " + "; ".join(errors))
+
+    name, temp_path, version = winner
+    HEDGE_WINS.labels(name).inc()
+    logger.info(f"Downloaded from {name} in {loop.time() - started:.2f} sec, blob SHA {expected_sha[:12]} verified.")
+    if target["versioned"] and version is None:
+        os.remove(temp_path)
+        return "Unknown version", False
+    try:
+        await check_download(temp_path, save_path)
+        await asyncio.to_thread(replace_and_sync, temp_path, save_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    DOWNLOAD_DURATION.observe(loop.time() - started)
+    # The version lookups must not keep answering with the version before this download
+    REMOTE_FILE_CACHE[target["url"]] = {"etag": None, "last_modified": None, "version": version or "Unknown version"}
+    VERSION_MEMO[target["url"]] = (time.monotonic(), version or "Unknown version")
+    return version, True
+
+# Local versions keyed by file path: ((inode, size, mtime_ns), version)
+LOCAL_VERSION_CACHE = {}
 
 # Extract the version from the local file
 def extract_version_from_file(file_path):
@@ -126,67 +946,796 @@ def extract_version_from_file(file_path):
     if not os.path.exists(file_path):
         return "File not found"
     try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            content = file.read()
-            match = re.search(r'return\s+[\'\"](v[\d.]+)[\'\"]', content)
-            return match.group(1) if match else "Unknown version"
+        stat = os.stat(file_path)
+        # The version is reused until the file changes
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        cached = LOCAL_VERSION_CACHE.get(file_path)
+        if cached and cached[0] == key:
+            return cached[1]
+        with open(file_path, "rb") as file:
+            content = file.read(VERSION_SCAN_LIMIT).decode("utf-8", errors="replace")
+        match = VERSION_PATTERN.search(content)
+        version = match.group(1) if match else "Unknown version"
+        LOCAL_VERSION_CACHE[file_path] = (key, version)
+        return version
     except Exception as e:
         logger.error(f"Error extracting version: {e}")
     return "Unknown version"
 
+# Git blob SHA-1 of local files keyed by path: ((inode, size, mtime_ns), sha)
+LOCAL_BLOB_SHA_CACHE = {}
+
+# ETag and blob SHAs of the last GitHub trees API response for each tree URL
+REMOTE_TREE_CACHE = {}
+
+# Git blob SHA of the local file
+def git_blob_sha(file_path):
+    """Computes the git blob SHA-1 of a local file, cached until the file changes."""
+    if not os.path.exists(file_path):
+        return None
+    stat = os.stat(file_path)
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    cached = LOCAL_BLOB_SHA_CACHE.get(file_path)
+    if cached and cached[0] == key:
+        return cached[1]
+    sha = compute_blob_sha(file_path, stat.st_size)
+    LOCAL_BLOB_SHA_CACHE[file_path] = (key, sha)
+    return sha
+
+# Git blob SHA of a file without caching
+def compute_blob_sha(file_path, size):
+    """Hashes the file the way git does: SHA-1 of the blob header and the content."""
+    digest = hashlib.sha1(f"blob {size}\0".encode())
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE * 4), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Git blob SHA of the remote file
+async def fetch_remote_blob_sha(repo_url, file_path):
+    """Gets the git blob SHA of a file from the GitHub trees API."""
+    directory, name = posixpath.split(file_path)
+    tree = f"main:{directory}" if directory else "main"
+    api_url = f"https://api.github.com/repos/{repo_url}/git/trees/{tree}"
+    cached = REMOTE_TREE_CACHE.get(api_url, {})
+    headers = {}
+    # An unchanged tree costs a 304 without a body
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    async with github_api_get(api_url, headers) as response:
+        if response.status == 304:
+            return cached["shas"].get(name)
+        response.raise_for_status()
+        tree_data = await response.json()
+    shas = {entry["path"]: entry["sha"] for entry in tree_data.get("tree", []) if entry.get("type") == "blob"}
+    REMOTE_TREE_CACHE[api_url] = {"etag": response.headers.get("ETag"), "shas": shas}
+    return shas.get(name)
+
+# Make a version lookup visible to concurrent callers
+def publish_version_lookup(url, lookup):
+    """Starts the lookup as a task in VERSION_INFLIGHT until it finishes and returns the task."""
+    task = asyncio.ensure_future(lookup)
+    VERSION_INFLIGHT[url] = task
+    task.add_done_callback(lambda _: VERSION_INFLIGHT.pop(url, None))
+    return task
+
+# Version lookup of a check that may download the file
+async def fetch_shared_file_content(url, known_version, save_path, versioned):
+    """Runs fetch_file_content for the periodic check and the download button."""
+    if not versioned:
+        return await fetch_file_content(url, save_path=save_path, versioned=False)
+    # A running lookup (a button tap) that finds known_version saves the request
+    running = VERSION_INFLIGHT.get(url)
+    if running is not None:
+        try:
+            status, version, _ = await asyncio.shield(running)
+        except Exception:
+            pass  # The request below is retried by the caller if it fails too
+        else:
+            if version == known_version:
+                VERSION_LOOKUPS.labels("shared").inc()
+                return status, version, False
+    task = fetch_file_content(url, known_version=known_version, save_path=save_path)
+    # Taps while it runs await this request instead of sending their own
+    if url not in VERSION_INFLIGHT:
+        task = publish_version_lookup(url, task)
+    return await task
+
+# Remote version with request coalescing
+async def fetch_remote_version(url):
+    """Returns the remote version of url, sharing one request between concurrent callers."""
+    # A version received by any check, including the periodic one, is reused for VERSION_CACHE_TTL seconds
+    memo = VERSION_MEMO.get(url)
+    if memo and time.monotonic() - memo[0] < VERSION_CACHE_TTL:
+        VERSION_LOOKUPS.labels("memo").inc()
+        return memo[1]
+    task = VERSION_INFLIGHT.get(url)
+    if task is None:
+        VERSION_LOOKUPS.labels("request").inc()
+        task = publish_version_lookup(url, fetch_file_content(url))
+    else:
+        VERSION_LOOKUPS.labels("shared").inc()
+    # A caller that gives up must not cancel the request of the others
+    status, version, _ = await asyncio.shield(task)
+    return version
+
 # Get the version of the remote file
-async def check_remote_version():
+async def check_remote_version(target=None):
     """Checks the version of the file on GitHub."""
-    content = await fetch_file_content(REPO_URL, REMOTE_FILE_PATH)
-    if content:
-        version = extract_version_from_content(content)
+    target = target or TARGETS[0]
+    try:
+        # Asked for by /start and the buttons: the request stops short of the reserve of the periodic checks
+        status = await get_github_status(target["repo"], target["remote_path"], interactive=True) if GITHUB_API_MODE == "graphql" else None
+        version = status["version"] if status else await fetch_remote_version(target["url"])
         logger.info(f"Remote file version: {version}")
         return version
-    else:
-        logger.error("Failed to fetch file content.")
+    except Exception as e:
+        logger.error(f"Error fetching the file: {e}")
         return "Download error"
 
+# Compile and import a strategy file, runs in a worker process
+def compile_and_import_strategy(source_path, live_path, class_name):
+    """Writes the bytecode of source_path into __pycache__ of live_path and imports class_name from it."""
+    try:
+        started = time.perf_counter()
+        # The .pyc is written for the live path, so Freqtrade does not compile the file after the swap
+        cache_path = py_compile.compile(source_path, cfile=importlib.util.cache_from_source(live_path), dfile=live_path, doraise=True)
+        compiled = time.perf_counter()
+        with open(cache_path, "rb") as f:
+            code = marshal.loads(f.read()[16:])  # Skip the 16-byte .pyc header
+        module = types.ModuleType(f"strategy_check_{class_name}")
+        module.__file__ = live_path
+        sys.modules[module.__name__] = module
+        try:
+            exec(code, module.__dict__)  # Runs the bytecode that was just written
+            note = None
+            found = isinstance(getattr(module, class_name, None), type)
+        # The monitor has no Freqtrade, the class is then looked up in the bytecode
+        except ModuleNotFoundError as e:
+            note = f"import skipped, {e.name} is not installed"
+            found = any(isinstance(const, types.CodeType) and const.co_name == class_name for const in code.co_consts)
+        if not found:
+            raise RuntimeError(f"class {class_name} is not defined")
+        return compiled - started, time.perf_counter() - compiled, note
+    except RuntimeError:
+        raise
+    except py_compile.PyCompileError as e:
+        raise RuntimeError(f"{e.exc_type_name}: {e.exc_value}") from None
+    except Exception as e:
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+# Entry point of the strategy check process
+def run_strategy_check(connection, source_path, live_path, class_name):
+    """Sends the result of compile_and_import_strategy or its error back through the pipe."""
+    try:
+        connection.send((None, compile_and_import_strategy(source_path, live_path, class_name)))
+    except RuntimeError as e:
+        connection.send((str(e), None))
+    finally:
+        connection.close()
+
+# Check a strategy before Freqtrade loads it
+async def check_strategy(target, source_path=None):
+    """Compiles and imports source_path (the live file by default) in a separate process and returns None or the error."""
+    local_path, class_name = target["local_path"], target["strategy_class"]
+    if not STRATEGY_CHECK or not class_name:
+        return None
+    # A fresh process for every check, so nothing of the previous version stays imported
+    # Spawned, not forked: the monitor runs threads and holds the SQLite connection
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=run_strategy_check, args=(sender, source_path or local_path, local_path, class_name), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        if await asyncio.to_thread(receiver.poll, STRATEGY_CHECK_TIMEOUT):
+            error, result = receiver.recv()
+        else:
+            error = f"no result in {STRATEGY_CHECK_TIMEOUT} sec"
+    except EOFError:
+        error = "the check process exited without a result"
+    finally:
+        # A strategy that hangs while it is imported must not leave the process behind
+        if process.is_alive():
+            process.kill()
+        await asyncio.to_thread(process.join)
+    if error:
+        STRATEGY_CHECK_ERRORS.labels(target["name"]).inc()
+        logger.error(f"Strategy check of {local_path} failed: {error}")
+        return error
+    compile_seconds, import_seconds, note = result
+    STRATEGY_CHECK_DURATION.labels("compile").observe(compile_seconds)
+    STRATEGY_CHECK_DURATION.labels("import").observe(import_seconds)
+    logger.info(f"Strategy {class_name} compiled in {compile_seconds:.2f} sec, imported in {import_seconds:.2f} sec"
+                + (f" ({note})" if note else ""))
+    return None
+
+# Index of the snapshot store: stored versions and the files pinned by a rollback, loaded on first use
+SNAPSHOT_INDEX = None
+
+# The store is changed from worker threads of several checks
+SNAPSHOT_LOCK = threading.Lock()
+
+# Path of a stored version
+def snapshot_path(sha256):
+    """Returns the path of the version with the given SHA-256 in the store."""
+    return os.path.join(SNAPSHOT_DIR, f"{sha256}.snapshot")
+
+# Load the index of the snapshot store
+def load_snapshot_index():
+    """Returns the index, reading index.json on first use. Runs in a worker thread."""
+    global SNAPSHOT_INDEX
+    if SNAPSHOT_INDEX is None:
+        index_path = os.path.join(SNAPSHOT_DIR, "index.json")
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                SNAPSHOT_INDEX = json.load(f)
+        else:
+            SNAPSHOT_INDEX = {"snapshots": [], "pinned": {}}
+    return SNAPSHOT_INDEX
+
+# Save the index of the snapshot store
+def save_snapshot_index():
+    """Writes index.json atomically. Runs in a worker thread with SNAPSHOT_LOCK held."""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".index.", suffix=".tmp", dir=SNAPSHOT_DIR)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        write_and_sync(f, json.dumps(SNAPSHOT_INDEX, indent=2))
+    replace_and_sync(temp_path, os.path.join(SNAPSHOT_DIR, "index.json"))
+
+# Point the live file to a stored version
+def link_live_file(store_path, live_path):
+    """Atomically replaces live_path with a link to store_path. Runs in a worker thread."""
+    directory = os.path.dirname(os.path.abspath(live_path))
+    # Created next to the live file and moved over it, Freqtrade sees either the old or the new version
+    temp_path = os.path.join(directory, f".{os.path.basename(live_path)}.link")
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    if SNAPSHOT_LINK == "symlink":
+        os.symlink(os.path.relpath(store_path, directory), temp_path)
+    else:
+        try:
+            os.link(store_path, temp_path)
+        # The store is on another file system
+        except OSError:
+            shutil.copy2(store_path, temp_path)
+    os.replace(temp_path, live_path)
+    sync_directory(directory)
+
+# Add the live file to the snapshot store
+def store_snapshot(target, version):
+    """Stores the current file of the target by its SHA-256, links the live file to it and returns the SHA-256."""
+    live_path = target["local_path"]
+    if not os.path.exists(live_path):
+        return None
+    sha256 = file_sha256(live_path)
+    store_path = snapshot_path(sha256)
+    with SNAPSHOT_LOCK:
+        index = load_snapshot_index()
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        if not os.path.exists(store_path):
+            temp_path = f"{store_path}.tmp"
+            if os.path.lexists(temp_path):
+                os.remove(temp_path)
+            try:
+                # A hard link, keeping a version costs no copy
+                os.link(os.path.realpath(live_path), temp_path)
+            except OSError:
+                shutil.copy2(live_path, temp_path)
+            os.replace(temp_path, store_path)
+        if not (os.path.samefile(live_path, store_path) and (SNAPSHOT_LINK != "symlink" or os.path.islink(live_path))):
+            link_live_file(store_path, live_path)
+        index["snapshots"] = [entry for entry in index["snapshots"]
+                              if not (entry["target"] == target["name"] and entry["sha256"] == sha256)]
+        index["snapshots"].append({
+            "target": target["name"],
+            "sha256": sha256,
+            "version": version or sha256[:7],
+            "saved_at": time.time(),
+            "size": os.path.getsize(store_path),
+        })
+        evict_snapshots(index, target, sha256)
+        save_snapshot_index()
+    logger.info(f"Version {version or sha256[:7]} of {target['name']} is stored as {sha256[:12]}.")
+    return sha256
+
+# Apply the retention policy of the store
+def evict_snapshots(index, target, live_sha256):
+    """Keeps the SNAPSHOT_KEEP newest versions of the target, the live one and the pinned one."""
+    pinned = index["pinned"].get(target["name"], {}).get("sha256")
+    entries = sorted((entry for entry in index["snapshots"] if entry["target"] == target["name"]),
+                     key=lambda entry: entry["saved_at"], reverse=True)
+    evicted = [entry for entry in entries[SNAPSHOT_KEEP:] if entry["sha256"] not in (live_sha256, pinned)]
+    index["snapshots"] = [entry for entry in index["snapshots"] if entry not in evicted]
+    # A stored file is removed once no target refers to it
+    referenced = {entry["sha256"] for entry in index["snapshots"]}
+    for entry in evicted:
+        if entry["sha256"] not in referenced and os.path.exists(snapshot_path(entry["sha256"])):
+            os.remove(snapshot_path(entry["sha256"]))
+            logger.info(f"Stored version {entry['version']} of {entry['target']} is evicted.")
+    SNAPSHOT_STORE_BYTES.set(sum({entry["sha256"]: entry["size"] for entry in index["snapshots"]}.values()))
+
+# Stored versions of a file
+def list_snapshots(target):
+    """Returns the stored versions of the target, newest first, and the SHA-256 of the live file."""
+    with SNAPSHOT_LOCK:
+        entries = [entry for entry in load_snapshot_index()["snapshots"] if entry["target"] == target["name"]]
+    live_sha256 = file_sha256(target["local_path"])
+    return sorted(entries, key=lambda entry: entry["saved_at"], reverse=True), live_sha256
+
+# Roll a file back to a stored version
+def rollback_to_snapshot(target, sha256_prefix):
+    """Links the live file to the stored version, pins the target to it and returns the snapshot entry."""
+    with SNAPSHOT_LOCK:
+        index = load_snapshot_index()
+        entry = next((entry for entry in index["snapshots"]
+                      if entry["target"] == target["name"] and entry["sha256"].startswith(sha256_prefix)), None)
+        if entry is None or not os.path.exists(snapshot_path(entry["sha256"])):
+            return None
+        link_live_file(snapshot_path(entry["sha256"]), target["local_path"])
+        index["pinned"][target["name"]] = {"sha256": entry["sha256"], "version": entry["version"]}
+        save_snapshot_index()
+    logger.info(f"{target['name']} is rolled back to {entry['version']} ({entry['sha256'][:12]}).")
+    return entry
+
+# Resume the automatic updates of a file after a rollback
+def unpin_snapshot(target):
+    """Removes the rollback pin of the target. Returns True if it was pinned."""
+    with SNAPSHOT_LOCK:
+        index = load_snapshot_index()
+        if index["pinned"].pop(target["name"], None) is None:
+            return False
+        save_snapshot_index()
+    return True
+
+# Store the files found at startup
+async def snapshot_live_files():
+    """Adds the current version of every monitored file to the store, so the first update can be rolled back."""
+    for target in TARGETS:
+        try:
+            version = await asyncio.to_thread(extract_version_from_file, target["local_path"]) if target["versioned"] else None
+            await asyncio.to_thread(store_snapshot, target, version)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error storing the version of {target['name']}: {e}")
+
+# Downloaded files that failed the strategy check keyed by target name: version, blob SHA and error
+REJECTED_DOWNLOADS = {}
+
+# Remember a downloaded strategy that failed the check
+def remember_rejected_download(target, error):
+    """Stores the rejected file and returns False if the same file was already rejected."""
+    rejected = REJECTED_DOWNLOADS.get(target["name"])
+    if rejected and rejected["blob_sha"] == error.blob_sha:
+        return False
+    REJECTED_DOWNLOADS[target["name"]] = {"version": error.version, "blob_sha": error.blob_sha, "error": str(error)}
+    return True
+
 # Function to download the file and notify with a restart
-async def check_for_updates():
-    """Checks for updates on the remote server and downloads the file if an update is found."""
-    local_version = extract_version_from_file(LOCAL_FILE_PATH)
-    remote_version = await check_remote_version()
+async def check_for_updates(target=None):
+    """Checks one monitored file for updates and downloads it if an update is found."""
+    target = target or TARGETS[0]
+    # The file name is only added to the messages when several files are monitored
+    prefix = f"[{target['name']}] " if len(TARGETS) > 1 else ""
+    local_path = target["local_path"]
 
-    if remote_version == "Unknown version":
-        logger.warning("Remote version is unknown. Update will not be performed.")
-        send_telegram_message(TELEGRAM_TOKEN, CHAT_ID, "⚠️ Remote version is unknown. Please check the file manually.")
-        return
-    if local_version == "Unknown version":
-        logger.warning("Local version is unknown. Update will not be performed.")
-        send_telegram_message(TELEGRAM_TOKEN, CHAT_ID, "⚠️ Local version is unknown. Please check the file manually.")
-        return
+    # After a rollback the file stays on the chosen version until the download button is pressed
+    index = await asyncio.to_thread(load_snapshot_index)
+    pinned = index["pinned"].get(target["name"])
+    if pinned:
+        logger.info(f"{prefix}Pinned to {pinned['version']} after a rollback, the update check is skipped.")
+        return f"Pinned to {pinned['version']} after a rollback"
+
+    local_version = None
+    if target["versioned"]:
+        local_version = await asyncio.to_thread(extract_version_from_file, local_path)
+        if local_version == "Unknown version":
+            logger.warning(f"{prefix}Local version is unknown. Update will not be performed.")
+            await send_telegram_message(TELEGRAM_TOKEN, CHAT_ID, f"{prefix}⚠️ Local version is unknown. Please check the file manually.")
+            return "Local version is unknown"
+
+    # A version that failed the strategy check is not downloaded again
+    rejected = REJECTED_DOWNLOADS.get(target["name"])
+    known_version = rejected["version"] if rejected and target["versioned"] else local_version
+    downloaded = None
+    check_error = None
+    if target["mode"] == "blob":
+        # Compare git blob SHAs first, the file is only downloaded when they differ
+        try:
+            remote_sha = await fetch_remote_blob_sha(target["repo"], target["remote_path"])
+        except Exception as e:
+            logger.error(f"{prefix}Error fetching the blob SHA, falling back to the version check: {e}")
+            remote_sha = None
+        if remote_sha and remote_sha == await asyncio.to_thread(git_blob_sha, local_path):
+            if target["versioned"]:
+                VERSION_MEMO[target["url"]] = (time.monotonic(), local_version)  # The remote file is the local one
+            logger.info(f"{prefix}No updates found. Blob SHA {remote_sha[:12]} matches, local version: {local_version}")
+            return f"No updates ({local_version or remote_sha[:7]})"
+        if remote_sha and rejected and remote_sha == rejected["blob_sha"]:
+            logger.info(f"{prefix}Blob SHA {remote_sha[:12]} failed the strategy check before, the download is skipped.")
+            return f"Check failed ({rejected['version']})"
+        if remote_sha:
+            # The content differs, download it even if the version string is the same
+            logger.info(f"{prefix}Remote blob SHA {remote_sha[:12]} differs from the local file.")
+            known_version = None
+            try:
+                remote_version, downloaded = await hedged_download(target, remote_sha)
+            except StrategyCheckError as e:
+                check_error = e
+            except Exception as e:
+                logger.error(f"{prefix}Error downloading the file, retrying {target['url']}: {e}")
+
+    if downloaded is None and check_error is None:
+        # One request returns the remote version and, if it differs, the new file itself
+        try:
+            remote_version, downloaded = await download_file_with_retries(
+                target["url"], local_path, known_version=known_version, versioned=target["versioned"])
+        except StrategyCheckError as e:
+            check_error = e
+        except Exception as e:
+            logger.error(f"{prefix}Error checking for updates: {e}")
+            CHECK_ERRORS.labels(target["name"]).inc()
+            return f"Error: {e}"
+
+    if check_error:
+        # The live file is untouched and Freqtrade keeps running the current version
+        logger.warning(f"{prefix}Version {check_error.version} failed the strategy check, the live file is not replaced.")
+        if remember_rejected_download(target, check_error):
+            await notify_subscribers(f"{prefix}❌ The new version {check_error.version} did not pass the check and has not been installed. "
+                                     f"The current version stays in place, Freqtrade is not restarted: {check_error}")
+        return f"Check failed ({check_error.version})"
+
+    if target["versioned"] and remote_version == "Unknown version":
+        logger.warning(f"{prefix}Remote version is unknown. Update will not be performed.")
+        await send_telegram_message(TELEGRAM_TOKEN, CHAT_ID, f"{prefix}⚠️ Remote version is unknown. Please check the file manually.")
+        return "Remote version is unknown"
+
+    local_sha = await asyncio.to_thread(git_blob_sha, local_path)
+    if not downloaded and rejected and remote_version == rejected["version"]:
+        logger.info(f"{prefix}Remote version {remote_version} failed the strategy check before, the download is skipped.")
+        return f"Check failed ({remote_version})"
+    REJECTED_DOWNLOADS.pop(target["name"], None)  # The remote file has changed since it was rejected
+    if not downloaded:
+        logger.info(f"{prefix}No updates found. Local version: {local_version}")
+        return f"No updates ({local_version or local_sha[:7]})"
 
-    if local_version != remote_version:
-        # If versions don't match, download the new file
-        await download_file_with_retries(FILE_URL, LOCAL_FILE_PATH)
-        message = f"✅ Update found! New version: {remote_version} has been successfully downloaded.\n\n Restarting Freqtrade..."
-        send_telegram_message(TELEGRAM_TOKEN, CHAT_ID, message)
-        logger.info(f"Update downloaded. Local version is now: {remote_version}")
+    # Keep the new version for a rollback
+    try:
+        await asyncio.to_thread(store_snapshot, target, remote_version if target["versioned"] else None)
+    except OSError as e:
+        logger.error(f"{prefix}Error storing the downloaded version: {e}")
+
+    restart_note = "\n\n Restarting Freqtrade..." if target["reload"] else ""
+    if not target["versioned"]:
+        remote_version = local_sha[:7]
+        message = f"{prefix}✅ The file has changed on GitHub and has been downloaded (blob {remote_version}).{restart_note}"
+    elif remote_version == local_version:
+        message = f"{prefix}✅ The strategy file has changed on GitHub without a new version ({remote_version}) and has been downloaded.{restart_note}"
+    else:
+        message = f"{prefix}✅ Update found! New version: {remote_version} has been successfully downloaded.{restart_note}"
+    UPDATES_TOTAL.labels(target["name"]).inc()
+    await notify_subscribers(message)
+    logger.info(f"{prefix}Update downloaded. Local version is now: {remote_version}")
 
-        # After downloading the file, restart Freqtrade
+    # After downloading the file, restart Freqtrade
+    if target["reload"]:
         await reload_freqtrade(None, None)  # Empty values are passed here if no specific update is required via Telegram
+    return f"Downloaded {remote_version}"
+
+# Last check of every monitored file keyed by name: last_check, duration, result, interval, next_check
+TARGET_STATUS = {}
+
+# Events that wake up the check of a monitored file, keyed by name
+TARGET_WAKEUP = {}
+
+# Polling interval of a monitored file
+def polling_interval(target):
+    """Returns how long to wait between checks of a file."""
+    # With the GitHub webhook pushes trigger the checks, polling is only a safety net
+    if GITHUB_WEBHOOK_SECRET:
+        return max(target["interval"], WEBHOOK_FALLBACK_INTERVAL)
+    return target["interval"]
+
+# Check interval learned from the commit activity
+def adaptive_interval(target):
+    """Returns a check interval based on the time since the last commit to the repository."""
+    cache = get_commit_cache(target["repo"])
+    if not cache["by_date"]:
+        interval = target["interval"]
     else:
-        logger.info(f"No updates found. Local version: {local_version}")
+        newest = cache["by_date"][max(cache["by_date"])][0].date
+        quiet = (datetime.now(pytz.utc) - newest).total_seconds()
+        # A release usually comes in a burst of fixes, the interval grows with the quiet period
+        interval = POLL_MIN_INTERVAL if quiet < POLL_ACTIVE_WINDOW else quiet * POLL_BACKOFF_FACTOR
+    # Jitter keeps several files from being checked at the same moment
+    interval *= random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+    return int(min(max(interval, POLL_MIN_INTERVAL), POLL_MAX_INTERVAL))
 
-# Asynchronous task for periodic update check
-async def periodic_update_check():
-    """Periodically checks for updates."""
+# When the commit cache of a repository was last refreshed for the check interval, keyed by repository
+COMMIT_REFRESHED = {}
+
+# Commit cache refreshes in progress keyed by repository, the files of one repository await the same task
+COMMIT_REFRESH_INFLIGHT = {}
+
+# Time between two refreshes of the commit cache of one repository
+def commit_refresh_spacing():
+    """Returns how many seconds a refreshed commit cache is used for the check interval."""
+    spacing = POLL_MIN_INTERVAL
+    remaining, reset = GITHUB_BUDGET["remaining"], GITHUB_BUDGET["reset"]
+    if remaining is not None:
+        window = max(reset - time.time(), 0)
+        repos = len({target["repo"] for target in TARGETS if target["adaptive"]})
+        # A 304 counts against the rate limit too, the refreshes may use half of the requests above the reserve
+        usable = (remaining - GITHUB_INTERACTIVE_RESERVE) / 2
+        spacing = max(spacing, window * repos / usable if usable >= 1 else window)
+    return spacing
+
+# Refresh the commit cache for the check interval
+async def refresh_commits_for_interval(repo_url):
+    """Refreshes the commit cache of the repository at most once per commit_refresh_spacing()."""
+    # The files of one repository await the same refresh
+    task = COMMIT_REFRESH_INFLIGHT.get(repo_url)
+    if task is None:
+        if time.monotonic() - COMMIT_REFRESHED.get(repo_url, float("-inf")) < commit_refresh_spacing():
+            return
+        COMMIT_REFRESHED[repo_url] = time.monotonic()
+        task = asyncio.ensure_future(refresh_commit_cache(repo_url))
+        COMMIT_REFRESH_INFLIGHT[repo_url] = task
+        task.add_done_callback(lambda _: COMMIT_REFRESH_INFLIGHT.pop(repo_url, None))
+    await asyncio.shield(task)
+
+# Choose the interval before the next check
+async def next_poll_interval(target):
+    """Returns how long to wait before the next check of a file."""
+    if GITHUB_WEBHOOK_SECRET or not target["adaptive"]:
+        return polling_interval(target)
+    try:
+        await refresh_commits_for_interval(target["repo"])
+    except Exception as e:
+        logger.warning(f"Error fetching commits for the check interval, using the cached ones: {e}")
+    return adaptive_interval(target)
+
+# Check one monitored file in a loop
+async def monitor_target(target, semaphore):
+    """Checks a monitored file with its own interval."""
     timezone = pytz.timezone(TIMEZONE)  # Use the timezone from .env
+    prefix = f"[{target['name']}] " if len(TARGETS) > 1 else ""
+    # After a restart the check scheduled before it is kept
+    restored = TARGET_STATUS.get(target["name"])
+    if restored and restored["next_check"] > datetime.now(timezone):
+        logger.info(f"{prefix}Restored from the state database, next update check at: {restored['next_check'].strftime('%d-%m-%Y %H:%M:%S')}")
+        await wait_for_next_check(target, (restored["next_check"] - datetime.now(timezone)).total_seconds())
     while True:
-        await check_for_updates()  # Check for updates
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                result = await check_for_updates(target)  # Check for updates
+            except Exception as e:
+                logger.error(f"{prefix}Unexpected error while checking for updates: {e}")
+                CHECK_ERRORS.labels(target["name"]).inc()
+                result = f"Error: {e}"
+            duration = time.monotonic() - started
+        CHECK_DURATION.labels(target["name"]).observe(duration)
+        CHECKS_TOTAL.labels(target["name"]).inc()
+
         # Update the next check time considering the timezone
-        next_check_time = datetime.now(timezone) + timedelta(seconds=CHECK_INTERVAL)
-        next_check_time_str = next_check_time.strftime('%d-%m-%Y %H:%M:%S')
-        
+        interval = await next_poll_interval(target)
+        now = datetime.now(timezone)
+        next_check_time = now + timedelta(seconds=interval)
+        TARGET_STATUS[target["name"]] = {
+            "last_check": now,
+            "duration": duration,
+            "result": result,
+            "interval": interval,
+            "next_check": next_check_time,
+        }
+        LAST_CHECK_TIME.labels(target["name"]).set(now.timestamp())
+        NEXT_CHECK_TIME.labels(target["name"]).set(next_check_time.timestamp())
+
         # Output the next check time to the terminal (Docker)
-        logger.info(f"Next update check at: {next_check_time_str}")
-        
-        await asyncio.sleep(CHECK_INTERVAL)  # Wait for the specified interval
+        logger.info(f"{prefix}Check took {duration:.2f} sec. Next update check in {format_time_interval(interval)} at: {next_check_time.strftime('%d-%m-%Y %H:%M:%S')}")
+        await save_state(target["name"], TARGET_STATUS[target["name"]])
+        await wait_for_next_check(target, interval)
+
+# Wait for the next check of a monitored file
+async def wait_for_next_check(target, interval):
+    """Waits for the interval or until a GitHub push wakes the target up."""
+    prefix = f"[{target['name']}] " if len(TARGETS) > 1 else ""
+    wakeup = TARGET_WAKEUP.setdefault(target["name"], asyncio.Event())
+    try:
+        await asyncio.wait_for(wakeup.wait(), interval)
+        logger.info(f"{prefix}Update check triggered by a GitHub push.")
+    except asyncio.TimeoutError:
+        pass
+    wakeup.clear()  # Pushes received while waiting are covered by the next check
+
+# Asynchronous task for periodic update check
+async def periodic_update_check():
+    """Periodically checks all monitored files for updates, concurrently."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHECKS)
+    await asyncio.gather(log_periodic_stats(), *(monitor_target(target, semaphore) for target in TARGETS))
+
+# Measure the event loop lag
+async def measure_event_loop_lag():
+    """Sleeps for LOOP_LAG_INTERVAL and records how late the loop woke up."""
+    loop = asyncio.get_running_loop()
+    LOOP_HEARTBEAT.update(loop=loop, thread=threading.get_ident(), time=time.monotonic())
+    threading.Thread(target=loop_watchdog, name="loop-watchdog", daemon=True).start()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        LOOP_HEARTBEAT["time"] = time.monotonic()
+        LOOP_LAG.observe(max(0.0, loop.time() - started - LOOP_LAG_INTERVAL))
+
+# Last heartbeat of the event loop, written by measure_event_loop_lag
+LOOP_HEARTBEAT = {"loop": None, "thread": None, "time": None}
+
+# Report what blocks the event loop
+def loop_watchdog():
+    """Watches the heartbeat of the event loop from a separate thread."""
+    reported = None
+    while True:
+        time.sleep(LOOP_STALL_THRESHOLD / 2)
+        beat = LOOP_HEARTBEAT["time"]
+        stalled = time.monotonic() - beat - LOOP_LAG_INTERVAL
+        if stalled < LOOP_STALL_THRESHOLD or beat == reported:
+            continue
+        reported = beat  # Report every stall once
+        LOOP_STALLS.inc()
+        # The stack is taken while the loop is still blocked, so it shows the blocking code
+        frame = sys._current_frames().get(LOOP_HEARTBEAT["thread"])
+        task = asyncio.current_task(LOOP_HEARTBEAT["loop"])
+        stack = "".join(traceback.format_stack(frame)[-8:]) if frame else ""
+        logger.warning(f"Event loop blocked for {stalled:.2f} sec in task "
+                       f"{task.get_coro().__qualname__ if task else None}:\n{stack}")
+
+# Periodic statistics in the logs
+async def log_periodic_stats():
+    """Logs the connection pool and notifier statistics at the shortest check interval."""
+    interval = min(polling_interval(target) for target in TARGETS)
+    while True:
+        await asyncio.sleep(interval)
+        logger.info(format_http_stats())
+        logger.info(format_notifier_stats())
+
+# Built-in web server for GitHub webhooks
+WEB_RUNNER = None
+GITHUB_PUSH_COMMIT_LIMIT = 20  # GitHub lists at most 20 commits in a push payload
+
+# Check the signature of a GitHub webhook
+def verify_github_signature(body, signature):
+    """Checks the X-Hub-Signature-256 header against the HMAC of the body."""
+    if not GITHUB_WEBHOOK_SECRET or not signature:
+        return False
+    expected = "sha256=" + hmac.new(GITHUB_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    # Compared as bytes: compare_digest refuses str with non-ASCII characters
+    return hmac.compare_digest(expected.encode(), signature.encode(errors="surrogateescape"))
+
+# Monitored files touched by a push
+def targets_touched_by_push(payload):
+    """Returns the monitored files of the pushed repository that were added, modified or removed on main."""
+    repo = ((payload.get("repository") or {}).get("full_name") or "").lower()
+    if payload.get("ref") != "refs/heads/main":
+        return []
+    commits = payload.get("commits") or []
+    paths = set()
+    for commit in commits:
+        for key in ("added", "modified", "removed"):
+            paths.update(commit.get(key) or [])
+    # The commit list of a large push is truncated, so every file of the repository is checked
+    truncated = len(commits) >= GITHUB_PUSH_COMMIT_LIMIT
+    return [target for target in TARGETS
+            if target["repo"].lower() == repo and (truncated or target["remote_path"] in paths)]
+
+# Handler for GitHub push webhooks
+async def github_webhook(request):
+    """Verifies a GitHub webhook and wakes up the checks of the files touched by the push."""
+    body = await request.read()
+    if not verify_github_signature(body, request.headers.get("X-Hub-Signature-256")):
+        logger.warning(f"GitHub webhook from {request.remote} rejected: invalid signature.")
+        return web.json_response({"error": "invalid signature"}, status=401)
+
+    event = request.headers.get("X-GitHub-Event")
+    if event != "push":
+        logger.info(f"GitHub webhook '{event}' received and ignored.")
+        return web.json_response({"event": event, "triggered": []})
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return web.json_response({"error": "invalid payload"}, status=400)
+    try:
+        triggered = targets_touched_by_push(payload)
+    except (AttributeError, TypeError):
+        return web.json_response({"error": "invalid payload"}, status=400)  # Fields of the wrong type
+    for target in triggered:
+        TARGET_WAKEUP.setdefault(target["name"], asyncio.Event()).set()
+    names = [target["name"] for target in triggered]
+    logger.info(f"GitHub push {str(payload.get('after') or '')[:7]} to {payload.get('ref')}, checks triggered: {names or 'none'}")
+    return web.json_response({"event": event, "triggered": names}, status=202 if names else 200)
+
+# Handler for Telegram webhook updates
+async def telegram_webhook(request):
+    """Verifies the secret token of a Telegram update and puts it into the update queue of the bot."""
+    # Compared as bytes: compare_digest refuses str with non-ASCII characters
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode(errors="surrogateescape")
+    if not hmac.compare_digest(token, TELEGRAM_WEBHOOK_SECRET.encode()):
+        logger.warning(f"Telegram webhook from {request.remote} rejected: invalid secret token.")
+        return web.json_response({"error": "invalid secret token"}, status=401)
+    application = request.app["application"]
+    try:
+        data = await request.json()
+        update = Update.de_json(data, application.bot) if isinstance(data, dict) else None
+    except (ValueError, TypeError, KeyError, AttributeError):
+        update = None
+    if update is None:
+        return web.json_response({"error": "invalid update"}, status=400)
+    await application.update_queue.put(update)
+    return web.Response()
+
+# Handler for the Prometheus scrape
+async def prometheus_metrics(request):
+    """Returns all metrics in the Prometheus text format."""
+    return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+# Web application with all routes
+def create_web_app(application):
+    """Creates the aiohttp application served on WEBHOOK_PORT."""
+    app = web.Application()
+    app["application"] = application
+    app.router.add_post("/github", github_webhook)
+    app.router.add_post("/telegram", telegram_webhook)
+    app.router.add_get("/metrics", prometheus_metrics)
+    return app
+
+# Start the built-in web server
+async def start_web_server(application):
+    """Starts the web server inside the bot's event loop."""
+    global WEB_RUNNER
+    if not WEBHOOK_PORT:
+        return
+    WEB_RUNNER = web.AppRunner(create_web_app(application), access_log=None)
+    await WEB_RUNNER.setup()
+    await web.TCPSite(WEB_RUNNER, "0.0.0.0", WEBHOOK_PORT).start()
+    if not GITHUB_WEBHOOK_SECRET:
+        logger.warning("GITHUB_WEBHOOK_SECRET is not set, GitHub webhooks will be rejected.")
+    logger.info(f"Web server listening on port {WEBHOOK_PORT}.")
+
+# Stop the built-in web server
+async def stop_web_server():
+    """Stops the web server and closes its connections."""
+    global WEB_RUNNER
+    if WEB_RUNNER is not None:
+        await WEB_RUNNER.cleanup()
+        WEB_RUNNER = None
+
+# Status of all monitored files
+def format_target_status():
+    """Returns the list of monitored files with the result of the last check."""
+    lines = ["📋 Monitored files:", format_github_budget()]
+    for target in TARGETS:
+        status = TARGET_STATUS.get(target["name"])
+        interval = status["interval"] if status else polling_interval(target)
+        lines.append(f"\n📄 {target['name']} ({target['repo']}/{target['remote_path']})")
+        lines.append(f"🕒 Interval: {format_time_interval(interval)}{' (adaptive)' if target['adaptive'] and not GITHUB_WEBHOOK_SECRET else ''}")
+        if status is None:
+            lines.append("⏳ Not checked yet")
+            continue
+        lines.append(f"🔎 Last check: {status['last_check'].strftime('%d-%m-%Y %H:%M:%S')} ({status['duration']:.2f} sec)")
+        lines.append(f"📌 Result: {status['result']}")
+        lines.append(f"⏭️ Next check: {status['next_check'].strftime('%d-%m-%Y %H:%M:%S')}")
+    return "\n".join(lines)
+
+# Handler for the /status command and the "📋 Monitored files" button
+async def show_status(update: Update, context: CallbackContext):
+    """Shows the status of all monitored files."""
+    await log_telegram_message(update)
+    message = format_target_status()
+    if update.callback_query:
+        await update.callback_query.message.reply_text(message)
+    elif update.message:
+        await update.message.reply_text(message)
 
 # Version check handler function
 async def check_version(update: Update, context: CallbackContext):
@@ -194,7 +1743,7 @@ async def check_version(update: Update, context: CallbackContext):
     logger.info("Handling 'Check version' button.")
 
     # Get the version of the local file
-    local_version = extract_version_from_file(LOCAL_FILE_PATH)
+    local_version = await asyncio.to_thread(extract_version_from_file, TARGETS[0]["local_path"])
     logger.info(f"Local version: {local_version}")
 
     # Get the version of the remote file
@@ -234,58 +1783,203 @@ async def check_commits(update: Update, context: CallbackContext):
         await update.callback_query.message.reply_text(commits_message)
 
 
-async def get_commits_from_github(repo_url):
-    """Gets commits from a GitHub repository made on the last date they were pushed."""
+# Compact commit record, the date is parsed once when the commit is first seen
+CommitRecord = namedtuple("CommitRecord", ["sha", "date", "message"])
+
+# Commit cache for each repository: known SHAs, commits indexed by date and the ETag of the last request
+COMMIT_CACHE = {}
+COMMIT_CACHE_DAYS = 30  # How many days of commits are kept in memory
+
+# Get the commit cache of a repository
+def get_commit_cache(repo_url):
+    """Returns the commit cache of the repository, creating an empty one on first use."""
+    return COMMIT_CACHE.setdefault(repo_url, {"shas": set(), "by_date": {}, "url": None, "etag": None})
+
+# Fetch only the commits that are not in the cache yet
+async def refresh_commit_cache(repo_url, interactive=False):
+    """Requests commits newer than the newest cached one, adds them to the cache and returns their number."""
+    cache = get_commit_cache(repo_url)
 
     # Form the URL for the GitHub API request
     api_url = f"https://api.github.com/repos/{repo_url}/commits?per_page=100"  # Get 100 commits for analysis
+    if cache["by_date"]:
+        newest = cache["by_date"][max(cache["by_date"])][0].date
+        api_url += f"&since={newest.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+    headers = {}
+    if cache["url"] == api_url and cache["etag"]:
+        headers["If-None-Match"] = cache["etag"]
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            # Send the request to the GitHub API
-            async with session.get(api_url) as response:
-                response.raise_for_status()  # Check for successful response status
+    # Send the request to the GitHub API
+    async with github_api_get(api_url, headers, interactive=interactive) as response:
+        if response.status == 304:
+            return 0
+        response.raise_for_status()  # Check for successful response status
+        commits = await response.json()  # Parse the JSON response
+        etag = response.headers.get("ETag")
 
-                commits = await response.json()  # Parse the JSON response
+    records = [
+        CommitRecord(commit["sha"], datetime.fromisoformat(commit['commit']['author']['date'].replace('Z', '+00:00')), commit['commit']['message'])
+        for commit in commits
+    ]
+    cache["url"], cache["etag"] = api_url, etag
+    return add_commits_to_cache(repo_url, records)
+
+# Add commits to the cache
+def add_commits_to_cache(repo_url, records):
+    """Adds the commits that are not cached yet and returns how many were added."""
+    cache = get_commit_cache(repo_url)
+    added = 0
+    added_dates = set()
+    for record in records:
+        if record.sha in cache["shas"]:
+            continue  # "since" is inclusive, the newest cached commit comes back again
+        cache["shas"].add(record.sha)
+        cache["by_date"].setdefault(record.date.date(), []).append(record)
+        added_dates.add(record.date.date())
+        added += 1
 
-                if not commits:
-                    return ["No commits in the repository."]
+    # Keep every day sorted by date in descending order
+    for day in added_dates:
+        cache["by_date"][day].sort(key=lambda record: record.date, reverse=True)
 
-                # Sort commits by date in descending order
-                commits.sort(key=lambda x: x['commit']['author']['date'], reverse=True)
+    # Forget the oldest days
+    for day in sorted(cache["by_date"])[:-COMMIT_CACHE_DAYS]:
+        for record in cache["by_date"].pop(day):
+            cache["shas"].discard(record.sha)
+    return added
 
-                # Get the date of the last commit
-                last_commit_date = datetime.fromisoformat(commits[0]['commit']['author']['date'].replace('Z', '+00:00')).date()
+# Status of a file and its repository for every handler: (monotonic time, status) by (repository, path)
+GITHUB_STATUS_CACHE = {}
 
-                # Extract only the commits made on the last day
-                filtered_commits = [
-                    commit for commit in commits
-                    if datetime.fromisoformat(commit['commit']['author']['date'].replace('Z', '+00:00')).date() == last_commit_date
-                ]
+# GraphQL status requests in progress, concurrent callers await the same task
+GITHUB_STATUS_INFLIGHT = {}
 
-                # Create a list of commits with the necessary information
-                tz = pytz.timezone(TIMEZONE)
-                commit_list = [
-                    f"{commit['sha'][:7]} {commit['commit']['message']} at {datetime.fromisoformat(commit['commit']['author']['date'].replace('Z', '+00:00')).astimezone(tz).strftime('%H:%M:%S')}"
-                    for commit in filtered_commits
-                ]
+# Versions of the blobs seen in the GraphQL status keyed by blob SHA, a blob never changes
+BLOB_VERSIONS = {}
 
-                if not commit_list:
-                    return [f"No commits on {last_commit_date}."]
+# Latest commits of the default branch and the file blob in one request
+GRAPHQL_STATUS_QUERY = """
+query($owner: String!, $name: String!, $expression: String!, $count: Int!) {
+  repository(owner: $owner, name: $name) {
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          history(first: $count) {
+            nodes { oid messageHeadline authoredDate }
+          }
+        }
+      }
+    }
+    object(expression: $expression) {
+      ... on Blob { oid byteSize }
+    }
+  }
+}
+"""
 
-                # Header with emoji, date, and number of commits
-                header = f"📜 Latest commits from {last_commit_date} ({len(filtered_commits)} commits)"
+# Version of a blob
+async def fetch_blob_version(repo_url, blob_sha, interactive=False):
+    """Reads the blob as a raw stream only up to the version string."""
+    # Addressed by its SHA, the version matches the GraphQL status even if the raw file is still the previous one
+    api_url = f"https://api.github.com/repos/{repo_url}/git/blobs/{blob_sha}"
+    async with github_api_get(api_url, {"Accept": "application/vnd.github.raw"}, interactive) as response:
+        response.raise_for_status()
+        _, version = await read_until_version(response)
+    return version or "Unknown version"
+
+# Query the status of a file with GitHub GraphQL
+async def query_github_status(repo_url, file_path, interactive=False):
+    """Gets the latest commits and the blob SHA of a file in one request."""
+    owner, name = repo_url.split("/", 1)
+    variables = {"owner": owner, "name": name, "expression": f"HEAD:{file_path}", "count": GRAPHQL_COMMIT_COUNT}
+    headers = {"Authorization": f"Bearer {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
+    async with get_http_session().post(GRAPHQL_URL, json={"query": GRAPHQL_STATUS_QUERY, "variables": variables}, headers=headers) as response:
+        response.raise_for_status()
+        result = await response.json()
+    if result.get("errors"):
+        raise RuntimeError(result["errors"][0].get("message", "GraphQL error"))
+    repository = result["data"]["repository"]
+    blob = repository["object"] or {}
+    # Only the SHA of the blob is queried, its head is read when a new blob appears
+    if blob.get("oid") and blob["oid"] not in BLOB_VERSIONS:
+        BLOB_VERSIONS[blob["oid"]] = await fetch_blob_version(repo_url, blob["oid"], interactive)
+    records = [
+        CommitRecord(node["oid"], datetime.fromisoformat(node["authoredDate"].replace('Z', '+00:00')), node["messageHeadline"])
+        for node in repository["defaultBranchRef"]["target"]["history"]["nodes"]
+    ]
+    # The list of latest commits needs no request of its own
+    add_commits_to_cache(repo_url, records)
+    status = {"version": BLOB_VERSIONS.get(blob.get("oid"), "Unknown version"), "blob_sha": blob.get("oid"), "commits": records}
+    GITHUB_STATUS_CACHE[(repo_url, file_path)] = (time.monotonic(), status)
+    logger.info(f"GraphQL status of {repo_url}/{file_path}: version {status['version']}, blob {(status['blob_sha'] or '-')[:7]}, {len(records)} commits")
+    return status
 
-                # Return the header and the list of commits
-                return [header] + commit_list
+# Shared status of a file
+async def get_github_status(repo_url, file_path, interactive=False):
+    """Returns the GraphQL status of a file or None if it cannot be received."""
+    key = (repo_url, file_path)
+    cached = GITHUB_STATUS_CACHE.get(key)
+    if cached and time.monotonic() - cached[0] < VERSION_CACHE_TTL:
+        VERSION_LOOKUPS.labels("memo").inc()
+        return cached[1]
+    task = GITHUB_STATUS_INFLIGHT.get(key)
+    if task is None:
+        VERSION_LOOKUPS.labels("request").inc()
+        task = asyncio.ensure_future(query_github_status(repo_url, file_path, interactive))
+        GITHUB_STATUS_INFLIGHT[key] = task
+        task.add_done_callback(lambda _: GITHUB_STATUS_INFLIGHT.pop(key, None))
+    else:
+        VERSION_LOOKUPS.labels("shared").inc()
+    try:
+        return await asyncio.shield(task)
+    except Exception as e:
+        logger.warning(f"GraphQL status request failed, using the REST API: {e}")
+        return None
 
-        except aiohttp.ClientError as e:
-            logger.error(f"Error with GitHub API request: {e}")
+async def get_commits_from_github(repo_url, interactive=True):
+    """Gets commits from a GitHub repository made on the last date they were pushed."""
+    try:
+        # In the GraphQL mode the commits arrive with the status that /start has most likely requested already
+        file_path = next((target["remote_path"] for target in TARGETS if target["repo"] == repo_url), REMOTE_FILE_PATH)
+        if GITHUB_API_MODE == "graphql" and await get_github_status(repo_url, file_path, interactive):
+            logger.info("Commits are taken from the GraphQL status.")
+        else:
+            added = await refresh_commit_cache(repo_url, interactive=interactive)
+            logger.info(f"New commits received from GitHub: {added}")
+    except GitHubRateLimitError as e:
+        logger.warning(f"Commits are answered from the cache: {e}")
+        if not get_commit_cache(repo_url)["by_date"]:
+            return [f"⏳ {e}. Please try again later."]
+    except aiohttp.ClientError as e:
+        logger.error(f"Error with GitHub API request: {e}")
+        if not get_commit_cache(repo_url)["by_date"]:
             return ["Error fetching commits."]
-        except Exception as e:
-            logger.error(f"Unknown error: {e}")
+    except Exception as e:
+        logger.error(f"Unknown error: {e}")
+        if not get_commit_cache(repo_url)["by_date"]:
             return ["Failed to fetch commit data."]
 
+    cache = get_commit_cache(repo_url)
+    if not cache["by_date"]:
+        return ["No commits in the repository."]
+
+    # Commits made on the last day
+    last_commit_date = max(cache["by_date"])
+    latest_commits = cache["by_date"][last_commit_date]
+
+    # Create a list of commits with the necessary information
+    tz = pytz.timezone(TIMEZONE)
+    commit_list = [
+        f"{record.sha[:7]} {record.message} at {record.date.astimezone(tz).strftime('%H:%M:%S')}"
+        for record in latest_commits
+    ]
+
+    # Header with emoji, date, and number of commits
+    header = f"📜 Latest commits from {last_commit_date} ({len(latest_commits)} commits)"
+
+    # Return the header and the list of commits
+    return [header] + commit_list
+
 
 # Asynchronous file download from the server
 async def download_file(update: Update, context: CallbackContext):
@@ -293,31 +1987,79 @@ async def download_file(update: Update, context: CallbackContext):
     logger.info("Handling 'Download update' button.")
     try:
         # Get the version of the local file
-        local_version = extract_version_from_file(LOCAL_FILE_PATH)
+        local_version = await asyncio.to_thread(extract_version_from_file, TARGETS[0]["local_path"])
+
+        # A manual download ends the rollback pin
+        if await asyncio.to_thread(unpin_snapshot, TARGETS[0]):
+            logger.info("Automatic updates are resumed after the rollback.")
         
-        # Get the version of the file from the server
-        await download_file_with_retries(FILE_URL, LOCAL_FILE_PATH, retries=1, delay=0)
-        server_version = extract_version_from_file(LOCAL_FILE_PATH)
+        # Get the version of the file from the server and download it in the same request if it differs
+        server_version, downloaded = await download_file_with_retries(TARGETS[0]["url"], TARGETS[0]["local_path"], retries=1, delay=0, known_version=local_version)
         
-        if local_version == server_version:
+        if downloaded:
+            REJECTED_DOWNLOADS.pop(TARGETS[0]["name"], None)
+            await asyncio.to_thread(store_snapshot, TARGETS[0], server_version)
+            message = f"✅  New version ({server_version}) successfully downloaded!"
+            logger.info("New version successfully downloaded.")
+        elif local_version == server_version:
             # If the versions match, notify that no update is needed
             message = f"The local file version ({local_version}) is up to date. No update needed. ✅"
-            if update.callback_query:  # Check if callback_query exists
-                await update.callback_query.message.reply_text(message)
             logger.info("No update needed. Version is up to date.")
         else:
-            # If the versions are different, download the new version
-            await download_file_with_retries(FILE_URL, LOCAL_FILE_PATH)
-            message = f"✅  New version ({server_version}) successfully downloaded!"
-            if update.callback_query:  # Check if callback_query exists
-                await update.callback_query.message.reply_text(message)
-            logger.info("New version successfully downloaded.")
+            message = "⚠️ Remote version is unknown. Please check the file manually."
+            logger.warning("Remote version is unknown. Update will not be performed.")
+        if update.callback_query:  # Check if callback_query exists
+            await update.callback_query.message.reply_text(message)
     
+    except StrategyCheckError as e:
+        # The downloaded file did not replace the live one
+        remember_rejected_download(TARGETS[0], e)
+        logger.error(f"Version {e.version} failed the strategy check: {e}")
+        if update.callback_query:
+            await update.callback_query.message.reply_text(f"❌  The new version ({e.version}) did not pass the check, the current file stays in place: {e}")
     except Exception as e:
         logger.error(f"Error downloading file: {e}")
         if update.callback_query:  # Check if callback_query exists
             await update.callback_query.message.reply_text(f"❌  Failed to download the file: {e}")
 
+# Handler for the "⏪ Rollback" button
+async def show_snapshots(update: Update, context: CallbackContext):
+    """Shows the stored versions of the strategy as buttons."""
+    logger.info("Handling 'Rollback' button.")
+    entries, live_sha256 = await asyncio.to_thread(list_snapshots, TARGETS[0])
+    if not entries:
+        message, reply_markup = "No stored versions yet.", None
+    else:
+        tz = pytz.timezone(TIMEZONE)
+        message = f"⏪ Stored versions of {TARGETS[0]['name']} ({len(entries)}). Choose the version to roll back to:"
+        reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(
+                f"{'✅ ' if entry['sha256'] == live_sha256 else ''}{entry['version']} · "
+                f"{datetime.fromtimestamp(entry['saved_at'], tz).strftime('%d-%m-%Y %H:%M')}",
+                callback_data=f"rollback:{entry['sha256'][:16]}")]
+            for entry in entries
+        ])
+    if update.callback_query:
+        await update.callback_query.message.reply_text(message, reply_markup=reply_markup)
+
+# Handler for the version buttons of the rollback list
+async def rollback_snapshot(update: Update, context: CallbackContext):
+    """Rolls the strategy back to the chosen stored version and restarts Freqtrade."""
+    sha256_prefix = update.callback_query.data.split(":", 1)[1]
+    logger.info(f"Handling rollback to {sha256_prefix}.")
+    entry = await asyncio.to_thread(rollback_to_snapshot, TARGETS[0], sha256_prefix)
+    if entry is None:
+        await update.callback_query.message.reply_text("❌ This version is no longer stored.")
+        return
+    message = (f"⏪ {TARGETS[0]['name']} is rolled back to {entry['version']} without a download.\n"
+               "📌 Automatic updates of this file are paused, the 📥 Download update button resumes them.")
+    check_error = await check_strategy(TARGETS[0])
+    if check_error:
+        message += f"\n\n❌ The file did not pass the check, Freqtrade is not restarted: {check_error}"
+    await update.callback_query.message.reply_text(message)
+    if not check_error:
+        await reload_freqtrade(update, context)
+
 # Function to convert time into a readable format
 def format_time_interval(seconds):
     """Converts time interval into the format 'hours:minutes:seconds'."""
@@ -338,18 +2080,28 @@ async def start(update: Update, context: CallbackContext):
     logger.info("Bot received the /start command")
 
     # Get the local file version
-    local_version = extract_version_from_file(LOCAL_FILE_PATH)
+    local_version = await asyncio.to_thread(extract_version_from_file, TARGETS[0]["local_path"])
     
     # Log the local file version
     logger.info(f"Local version: {local_version}")
     
-    # Get the server file version
-    try:
-        server_file_content = await fetch_file_content(REPO_URL, REMOTE_FILE_PATH)
-        server_version = extract_version_from_content(server_file_content)
-    except Exception as e:
-        logger.error(f"Error while downloading file to get the version: {e}")
-        server_version = "Failed to get version from server"
+    # The last known version answers right away, even one saved before a restart; an older one is refreshed in the background
+    memo = VERSION_MEMO.get(TARGETS[0]["url"])
+    server_note = ""
+    if memo and time.monotonic() - memo[0] >= VERSION_CACHE_TTL:
+        server_version = memo[1]
+        checked_at = datetime.now(pytz.timezone(TIMEZONE)) - timedelta(seconds=time.monotonic() - memo[0])
+        server_note = f" (checked {checked_at.strftime('%d-%m-%Y %H:%M:%S')})"
+        refresh = asyncio.create_task(check_remote_version())
+        BACKGROUND_TASKS.add(refresh)
+        refresh.add_done_callback(BACKGROUND_TASKS.discard)
+    else:
+        # A version received less than VERSION_CACHE_TTL seconds ago answers without a request
+        try:
+            server_version = await check_remote_version()
+        except Exception as e:
+            logger.error(f"Error while downloading file to get the version: {e}")
+            server_version = "Failed to get version from server"
     
     # Log the server version
     logger.info(f"Server version: {server_version}")
@@ -361,7 +2113,9 @@ async def start(update: Update, context: CallbackContext):
         version_status = f"📥 New version found on GitHub: {server_version}"
 
     # Convert the interval into a more readable format
-    formatted_check_interval = format_time_interval(CHECK_INTERVAL)
+    status = TARGET_STATUS.get(TARGETS[0]["name"])
+    formatted_check_interval = format_time_interval(status["interval"] if status else polling_interval(TARGETS[0]))
+    next_check = status["next_check"].strftime('%d-%m-%Y %H:%M:%S') if status else "after the first check"
     
     # Form the welcome message
     start_message = (
@@ -370,14 +2124,17 @@ async def start(update: Update, context: CallbackContext):
         "This bot is designed for monitoring updates of the NostalgiaForInfinityX5 strategy.\n\n"
         f"📊  Initial Information:\n"
         f"📂  Local file version: {local_version}\n"
-        f"🌐  Server version: {server_version}\n"
+        f"🌐  Server version: {server_version}{server_note}\n"
         f"{version_status}\n"
-        f"🕒  Update check interval: {formatted_check_interval}\n\n"
+        f"🕒  Update check interval: {formatted_check_interval}\n"
+        f"⏭️  Next update check: {next_check}\n\n"
         "📌 Main functions:\n"
         "1️⃣ Check the current file version.\n"
         "2️⃣ Download strategy updates.\n"
         "3️⃣ Display the latest commits from GitHub.\n"
-        "4️⃣ Restart Freqtrade after updating.\n\n"
+        "4️⃣ Restart Freqtrade after updating.\n"
+        f"5️⃣ Show the status of the monitored files ({len(TARGETS)}).\n"
+        "6️⃣ Roll back to a stored version without a download.\n\n"
         "Use the buttons below to manage."
     )
 
@@ -386,28 +2143,283 @@ async def start(update: Update, context: CallbackContext):
         [InlineKeyboardButton("🔍 Check file version", callback_data='check_version')],
         [InlineKeyboardButton("📥 Download update", callback_data='download_file')],
         [InlineKeyboardButton("📜 Latest commits", callback_data='check_commits')],
-        [InlineKeyboardButton("🔄 Restart Freqtrade", callback_data='reload_freqtrade')]
+        [InlineKeyboardButton("🔄 Restart Freqtrade", callback_data='reload_freqtrade')],
+        [InlineKeyboardButton("📋 Monitored files", callback_data='show_status')],
+        [InlineKeyboardButton("⏪ Rollback", callback_data='rollback')]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     if update.message:
         await update.message.reply_text(start_message, reply_markup=reply_markup)
 
+# Connection to the state database, opened on first use
+STATE_CONNECTION = None
+
+# The connection is shared by the worker threads
+STATE_LOCK = threading.Lock()
+
+# Chats that receive the update notifications in addition to CHAT_ID
+SUBSCRIBERS = set()
+
+# Tables of the state database
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checks (
+    id INTEGER PRIMARY KEY,
+    target TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    result TEXT NOT NULL,
+    interval INTEGER NOT NULL,
+    next_check REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS checks_target ON checks (target, id);
+CREATE TABLE IF NOT EXISTS remote_files (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, version TEXT);
+CREATE TABLE IF NOT EXISTS remote_versions (url TEXT PRIMARY KEY, version TEXT NOT NULL, checked_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS remote_trees (url TEXT PRIMARY KEY, etag TEXT, shas TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS commits (repo TEXT NOT NULL, sha TEXT NOT NULL, date TEXT NOT NULL, message TEXT NOT NULL, PRIMARY KEY (repo, sha));
+CREATE TABLE IF NOT EXISTS commit_requests (repo TEXT PRIMARY KEY, url TEXT, etag TEXT);
+CREATE TABLE IF NOT EXISTS subscriptions (chat_id TEXT PRIMARY KEY, subscribed_at REAL NOT NULL);
+"""
+
+# Open the state database
+def get_state_connection():
+    """Returns the connection to STATE_DB, creating the tables on first use."""
+    global STATE_CONNECTION
+    if STATE_CONNECTION is None:
+        os.makedirs(os.path.dirname(os.path.abspath(STATE_DB)), exist_ok=True)
+        connection = sqlite3.connect(STATE_DB, check_same_thread=False)
+        # WAL keeps the readers unblocked, NORMAL only syncs at checkpoints, which is enough for a cache
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(STATE_SCHEMA)
+        STATE_CONNECTION = connection
+    return STATE_CONNECTION
+
+# Read the state saved before the restart
+def read_state():
+    """Returns all rows needed for a warm start. Runs in a worker thread."""
+    with STATE_LOCK:
+        connection = get_state_connection()
+        return {
+            "checks": connection.execute(
+                "SELECT target, checked_at, duration, result, interval, next_check FROM checks "
+                "WHERE id IN (SELECT MAX(id) FROM checks GROUP BY target)").fetchall(),
+            "remote_files": connection.execute("SELECT url, etag, last_modified, version FROM remote_files").fetchall(),
+            "remote_versions": connection.execute("SELECT url, version, checked_at FROM remote_versions").fetchall(),
+            "remote_trees": connection.execute("SELECT url, etag, shas FROM remote_trees").fetchall(),
+            "commits": connection.execute("SELECT repo, sha, date, message FROM commits").fetchall(),
+            "commit_requests": connection.execute("SELECT repo, url, etag FROM commit_requests").fetchall(),
+            "subscriptions": connection.execute("SELECT chat_id FROM subscriptions").fetchall(),
+        }
+
+# Warm the caches from the state database
+async def load_state():
+    """Restores the last checks, ETags, remote versions, blob SHAs, commits and subscriptions."""
+    try:
+        state = await asyncio.to_thread(read_state)
+    except sqlite3.Error as e:
+        logger.error(f"Error reading the state database {STATE_DB}: {e}")
+        return
+    timezone = pytz.timezone(TIMEZONE)
+    for name, checked_at, duration, result, interval, next_check in state["checks"]:
+        TARGET_STATUS[name] = {
+            "last_check": datetime.fromtimestamp(checked_at, timezone),
+            "duration": duration,
+            "result": result,
+            "interval": int(interval),  # The column was REAL in earlier databases
+            "next_check": datetime.fromtimestamp(next_check, timezone),
+        }
+    for url, etag, last_modified, version in state["remote_files"]:
+        REMOTE_FILE_CACHE[url] = {"etag": etag, "last_modified": last_modified, "version": version}
+    for url, version, checked_at in state["remote_versions"]:
+        # The memo keeps monotonic times, the age of the saved version carries over the restart
+        VERSION_MEMO[url] = (time.monotonic() - max(0.0, time.time() - checked_at), version)
+    for url, etag, shas in state["remote_trees"]:
+        REMOTE_TREE_CACHE[url] = {"etag": etag, "shas": json.loads(shas)}
+    commits = {}
+    for repo, sha, date, message in state["commits"]:
+        commits.setdefault(repo, []).append(CommitRecord(sha, datetime.fromisoformat(date), message))
+    for repo, records in commits.items():
+        add_commits_to_cache(repo, records)
+    for repo, url, etag in state["commit_requests"]:
+        cache = get_commit_cache(repo)
+        cache["url"], cache["etag"] = url, etag
+    SUBSCRIBERS.update(chat_id for chat_id, in state["subscriptions"])
+    logger.info(f"State restored from {STATE_DB}: {len(state['checks'])} files, {len(state['remote_files'])} remote versions, "
+                f"{len(state['commits'])} commits, {len(SUBSCRIBERS)} subscribers")
+
+# Write the state to the database
+def write_state(remote_files, remote_versions, remote_trees, commits, commit_requests, check):
+    """Replaces the cached rows and adds the check to the history in one transaction. Runs in a worker thread."""
+    with STATE_LOCK:
+        connection = get_state_connection()
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO remote_files VALUES (?, ?, ?, ?)", remote_files)
+            connection.executemany("INSERT OR REPLACE INTO remote_versions VALUES (?, ?, ?)", remote_versions)
+            connection.executemany("INSERT OR REPLACE INTO remote_trees VALUES (?, ?, ?)", remote_trees)
+            connection.execute("DELETE FROM commits")  # The commit cache forgets old days, so do the rows
+            connection.executemany("INSERT INTO commits VALUES (?, ?, ?, ?)", commits)
+            connection.executemany("INSERT OR REPLACE INTO commit_requests VALUES (?, ?, ?)", commit_requests)
+            if check:
+                connection.execute(
+                    "INSERT INTO checks (target, checked_at, duration, result, interval, next_check) VALUES (?, ?, ?, ?, ?, ?)", check)
+                connection.execute(
+                    "DELETE FROM checks WHERE target = ? AND id NOT IN "
+                    "(SELECT id FROM checks WHERE target = ? ORDER BY id DESC LIMIT ?)", (check[0], check[0], CHECK_HISTORY_LIMIT))
+
+# Save the state after a check
+async def save_state(target_name=None, status=None):
+    """Copies the caches on the event loop and writes them to the state database in a worker thread."""
+    remote_files = [(url, entry.get("etag"), entry.get("last_modified"), entry["version"]) for url, entry in REMOTE_FILE_CACHE.items()]
+    remote_versions = [(url, version, time.time() - (time.monotonic() - received)) for url, (received, version) in VERSION_MEMO.items()]
+    remote_trees = [(url, entry["etag"], json.dumps(entry["shas"])) for url, entry in REMOTE_TREE_CACHE.items()]
+    commits = [(repo, record.sha, record.date.isoformat(), record.message)
+               for repo, cache in COMMIT_CACHE.items() for records in cache["by_date"].values() for record in records]
+    commit_requests = [(repo, cache["url"], cache["etag"]) for repo, cache in COMMIT_CACHE.items()]
+    check = None
+    if status:
+        check = (target_name, status["last_check"].timestamp(), status["duration"], status["result"],
+                 status["interval"], status["next_check"].timestamp())
+    try:
+        await asyncio.to_thread(write_state, remote_files, remote_versions, remote_trees, commits, commit_requests, check)
+    except sqlite3.Error as e:
+        logger.error(f"Error writing the state database {STATE_DB}: {e}")
+
+# Subscribe a chat to the update notifications or unsubscribe it
+def write_subscription(chat_id, subscribed):
+    """Adds or removes the chat in the subscriptions table. Runs in a worker thread."""
+    with STATE_LOCK:
+        connection = get_state_connection()
+        with connection:
+            if subscribed:
+                connection.execute("INSERT OR REPLACE INTO subscriptions VALUES (?, ?)", (chat_id, time.time()))
+            else:
+                connection.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+
+# Recent checks from the state database
+def read_check_history(limit):
+    """Returns the last checks of all files, newest first. Runs in a worker thread."""
+    with STATE_LOCK:
+        return get_state_connection().execute(
+            "SELECT target, checked_at, duration, result FROM checks ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+# Send an update notification to every subscriber
+async def notify_subscribers(message):
+    """Queues the message for CHAT_ID and every subscribed chat."""
+    for chat_id in {str(CHAT_ID)} | SUBSCRIBERS:
+        await send_telegram_message(TELEGRAM_TOKEN, chat_id, message)
+
+# Handler for the /subscribe and /unsubscribe commands
+async def subscribe(update: Update, context: CallbackContext):
+    """Subscribes the chat to the update notifications or unsubscribes it."""
+    await log_telegram_message(update)
+    chat_id = str(update.effective_chat.id)
+    subscribed = update.message.text.split()[0].split("@")[0] == "/subscribe"
+    try:
+        await asyncio.to_thread(write_subscription, chat_id, subscribed)
+    except sqlite3.Error as e:
+        logger.error(f"Error saving the subscription of {chat_id}: {e}")
+        await update.message.reply_text(f"❌ Failed to save the subscription: {e}")
+        return
+    if subscribed:
+        SUBSCRIBERS.add(chat_id)
+        await update.message.reply_text("🔔 This chat will be notified about strategy updates. /unsubscribe stops it.")
+    else:
+        SUBSCRIBERS.discard(chat_id)
+        await update.message.reply_text("🔕 This chat will no longer be notified about strategy updates.")
+
+# Handler for the /history command
+async def show_history(update: Update, context: CallbackContext):
+    """Shows the last checks saved in the state database."""
+    await log_telegram_message(update)
+    try:
+        rows = await asyncio.to_thread(read_check_history, 10)
+    except sqlite3.Error as e:
+        await update.message.reply_text(f"❌ Failed to read the check history: {e}")
+        return
+    if not rows:
+        await update.message.reply_text("No checks yet.")
+        return
+    timezone = pytz.timezone(TIMEZONE)
+    lines = ["🗒️ Last checks:"]
+    for name, checked_at, duration, result in rows:
+        lines.append(f"{datetime.fromtimestamp(checked_at, timezone).strftime('%d-%m-%Y %H:%M:%S')} {name}: {result} ({duration:.2f} sec)")
+    await update.message.reply_text("\n".join(lines))
+
+# Background tasks of the bot, the ones still running are cancelled when it stops
+BACKGROUND_TASKS = set()
+
+# Runs inside the bot's event loop before the updates are received
+async def on_startup(application: Application):
+    """Creates the shared HTTP session, restores the saved state, removes interrupted downloads, stores the current files for a rollback and starts the Telegram notifier, the web server and the background update check."""
+    get_http_session()
+    start_telegram_notifier()
+    await start_web_server(application)
+    await load_state()
+    await asyncio.to_thread(remove_stale_downloads)
+    await snapshot_live_files()
+    # Plain asyncio tasks: the application is not running yet, and its tasks would not be awaited
+    BACKGROUND_TASKS.add(asyncio.create_task(measure_event_loop_lag()))
+    BACKGROUND_TASKS.add(asyncio.create_task(periodic_update_check()))
+
+# Run the bot with a Telegram webhook
+async def run_telegram_webhook(application: Application):
+    """Receives the updates on /telegram of the built-in web server instead of long polling."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    # Started in the order of run_polling, run_webhook would start a server of its own
+    await application.initialize()
+    await on_startup(application)
+    try:
+        await application.bot.set_webhook(TELEGRAM_WEBHOOK_URL, secret_token=TELEGRAM_WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES)
+        await application.start()
+        logger.info(f"Telegram webhook set to {TELEGRAM_WEBHOOK_URL}.")
+        await stop.wait()
+    finally:
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        await on_shutdown(application)
+
+# Runs when the bot is stopped
+async def on_shutdown(application: Application):
+    """Cancels the background tasks, stops the web server, delivers the queued Telegram messages, saves the state and closes the shared HTTP session."""
+    for task in BACKGROUND_TASKS:
+        task.cancel()
+    await asyncio.gather(*BACKGROUND_TASKS, return_exceptions=True)
+    BACKGROUND_TASKS.clear()
+    await stop_web_server()
+    await stop_telegram_notifier()
+    await save_state()
+    if HTTP_SESSION is not None and not HTTP_SESSION.closed:
+        await HTTP_SESSION.close()
+    logger.info(format_http_stats())
+
 def main():
     """Main function to run the bot and periodically check for updates."""
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = Application.builder().token(TELEGRAM_TOKEN).post_init(on_startup).post_shutdown(on_shutdown).build()
 
     # Add all handlers
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("status", show_status))
+    application.add_handler(CommandHandler(["subscribe", "unsubscribe"], subscribe))
+    application.add_handler(CommandHandler("history", show_history))
     application.add_handler(CallbackQueryHandler(check_version, pattern='check_version'))
     application.add_handler(CallbackQueryHandler(download_file, pattern='download_file'))
     application.add_handler(CallbackQueryHandler(check_commits, pattern='check_commits'))
     application.add_handler(CallbackQueryHandler(reload_freqtrade, pattern='reload_freqtrade'))
+    application.add_handler(CallbackQueryHandler(show_status, pattern='show_status'))
+    application.add_handler(CallbackQueryHandler(show_snapshots, pattern='^rollback$'))
+    application.add_handler(CallbackQueryHandler(rollback_snapshot, pattern='^rollback:'))
 
-    # Start the background task to check for updates
-    asyncio.get_event_loop().create_task(periodic_update_check())
-
-    # Run the Telegram bot
+    # Run the Telegram bot, the webhook needs the web server and a public address
+    if TELEGRAM_MODE == "webhook" and WEBHOOK_PORT and TELEGRAM_WEBHOOK_URL:
+        asyncio.run(run_telegram_webhook(application))
+        return
+    if TELEGRAM_MODE == "webhook":
+        logger.warning("TELEGRAM_MODE=webhook needs WEBHOOK_PORT and TELEGRAM_WEBHOOK_URL, long polling is used.")
     application.run_polling()
 
 if __name__ == "__main__":
@@ -2,13 +2,36 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackContext, CallbackQueryHandler
 from datetime import datetime, timedelta
+from collections import namedtuple
 from dotenv import load_dotenv
-import requests
+from aiohttp import web
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
 import logging
+import multiprocessing
 import aiohttp
 import asyncio
+import contextlib
+import tempfile
+import shutil
+import threading
+import traceback
+import random
+import json
+import sqlite3
+import time
+import posixpath
+import hashlib
+import importlib.util
+import py_compile
+import marshal
+import types
+import hmac
+import secrets
+import signal
+import codecs
 import pytz
 import re
+import sys
 import os
 
 # Настроим логирование
@@ -27,14 +50,303 @@ FILE_URL = os.getenv("FILE_URL")  # URL для скачивания файла
 LOCAL_FILE_PATH = os.getenv("LOCAL_FILE_PATH")  # Локальный путь файла
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL"))  # Интервал проверки обновлений
 RETRY_LIMIT = int(os.getenv("RETRY_LIMIT"))  # Лимит попыток при скачивании
-RETRY_DELAY = int(os.getenv("RETRY_DELAY"))  # Задержка между попытками
+RETRY_DELAY = int(os.getenv("RETRY_DELAY"))  # Наибольшая задержка между попытками
 REPO_URL = os.getenv("REPO_URL")  # URL репозитория GitHub
 REMOTE_FILE_PATH = os.getenv("REMOTE_FILE_PATH")  # Путь к файлу в репозитории
 TIMEZONE = os.getenv("TIMEZONE")  # Часовой пояс
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "20"))  # Общее число HTTP-соединений в пуле
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "4"))  # Число соединений в пуле на один хост
+HTTP_KEEPALIVE_TIMEOUT = int(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))  # Сколько держать открытым простаивающее соединение
+DNS_CACHE_TTL = int(os.getenv("DNS_CACHE_TTL", "300"))  # Сколько хранить разрешённые имена хостов
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "100"))  # Максимальное число сообщений Telegram в очереди
+CHECK_MODE = os.getenv("CHECK_MODE", "version").lower()  # "version" сравнивает строки версий, "blob" сначала сравнивает git blob SHA
+TARGETS_FILE = os.getenv("TARGETS_FILE")  # JSON-файл со списком отслеживаемых файлов (необязательно)
+MAX_CONCURRENT_CHECKS = int(os.getenv("MAX_CONCURRENT_CHECKS", "4"))  # Сколько файлов проверяется одновременно
+FREQTRADE_INSTANCES_FILE = os.getenv("FREQTRADE_INSTANCES_FILE")  # JSON-файл со списком экземпляров Freqtrade для перезапуска (необязательно)
+RELOAD_TIMEOUT = int(os.getenv("RELOAD_TIMEOUT", "30"))  # Сколько ждать перезапуска одного экземпляра Freqtrade
+FREQTRADE_API_URL = os.getenv("FREQTRADE_API_URL")  # Адрес REST API Freqtrade, например http://127.0.0.1:8080 (необязательно, без него используется Telegram)
+FREQTRADE_API_USERNAME = os.getenv("FREQTRADE_API_USERNAME")  # Имя пользователя REST API Freqtrade
+FREQTRADE_API_PASSWORD = os.getenv("FREQTRADE_API_PASSWORD")  # Пароль REST API Freqtrade
+STRATEGY_CHECK = os.getenv("STRATEGY_CHECK", "true").lower() == "true"  # Компилировать и импортировать скачанную стратегию в отдельном процессе до замены рабочего файла
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR") or os.path.join(os.path.dirname(os.path.abspath(LOCAL_FILE_PATH)), ".snapshots")  # Хранилище скачанных версий на томе Update
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "10"))  # Сколько версий каждого файла хранить для отката
+SNAPSHOT_LINK = os.getenv("SNAPSHOT_LINK", "hardlink").lower()  # Как рабочий файл ссылается на свою версию: "hardlink" или "symlink"
+STATE_DB = os.getenv("STATE_DB") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "monitor_state.sqlite3")  # База SQLite с состоянием, которое переживает перезапуск, хранится вне папки стратегий
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8000"))  # Порт встроенного веб-сервера, 0 отключает его
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")  # Секрет webhook'а GitHub для событий push
+WEBHOOK_FALLBACK_INTERVAL = int(os.getenv("WEBHOOK_FALLBACK_INTERVAL", "21600"))  # Интервал опроса, пока настроен webhook
+TELEGRAM_MODE = os.getenv("TELEGRAM_MODE", "polling").lower()  # Как бот получает обновления Telegram: "polling" или "webhook"
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")  # Публичный HTTPS-адрес /telegram веб-сервера, например https://example.com/telegram
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET") or secrets.token_urlsafe(32)  # Секретный токен webhook'а Telegram, случайный, если не задан
+ADAPTIVE_POLLING = os.getenv("ADAPTIVE_POLLING", "false").lower() == "true"  # Подстраивать интервал проверки под активность коммитов в репозитории
+POLL_MIN_INTERVAL = int(os.getenv("POLL_MIN_INTERVAL", "60"))  # Наименьший адаптивный интервал проверки
+POLL_MAX_INTERVAL = int(os.getenv("POLL_MAX_INTERVAL", "14400"))  # Наибольший адаптивный интервал проверки
+POLL_ACTIVE_WINDOW = int(os.getenv("POLL_ACTIVE_WINDOW", "3600"))  # Сколько после коммита используется наименьший интервал
+POLL_JITTER = float(os.getenv("POLL_JITTER", "0.1"))  # Случайный разброс адаптивного интервала (0.1 = ±10%)
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0.5"))  # Блокировки цикла событий дольше этого (в секундах) логируются со стеком виновника
+VERSION_CACHE_TTL = float(os.getenv("VERSION_CACHE_TTL", "30"))  # Сколько секунд удалённая версия отвечает на повторные запросы без обращения к GitHub
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")  # Токен GitHub для запросов к API (необязательно, поднимает лимит с 60 до 5000 запросов в час)
+GITHUB_INTERACTIVE_RESERVE = int(os.getenv("GITHUB_INTERACTIVE_RESERVE", "10"))  # Запросы к API, оставляемые периодическим проверкам; ниже этого кнопки получают отказ
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "3"))  # Через сколько секунд медленную загрузку начинают обгонять другие источники
+HEDGE_SOURCES = [source.strip() for source in os.getenv("HEDGE_SOURCES", "contents,jsdelivr").lower().split(",") if source.strip()]  # Встроенные альтернативные источники
+DOWNLOAD_MIRRORS = [url.strip() for url in os.getenv("DOWNLOAD_MIRRORS", "").split(",") if url.strip()]  # Шаблоны URL собственных зеркал с {repo} и {path}
+GITHUB_API_MODE = os.getenv("GITHUB_API_MODE", "rest").lower()  # "graphql" получает версию и коммиты для /start и кнопок одним запросом
+GRAPHQL_URL = os.getenv("GRAPHQL_URL", "https://api.github.com/graphql")  # Адрес GitHub GraphQL API
+
+# GitHub GraphQL API отвечает только с токеном, без него каждый запрос статуса завершался бы ошибкой
+if GITHUB_API_MODE == "graphql" and not GITHUB_TOKEN:
+    logger.warning("GITHUB_API_MODE=graphql требует GITHUB_TOKEN, используется REST API.")
+    GITHUB_API_MODE = "rest"
 
 # Версия бота
 BOT_VERSION = "v1.15"
 
+# Шаблон строки версии, которую возвращает метод version() стратегии
+VERSION_PATTERN = re.compile(r'return\s+[\'\"](v[\d.]+)[\'\"]')
+STREAM_CHUNK_SIZE = 16 * 1024  # Размер блоков, которыми читается удалённый файл
+VERSION_SCAN_LIMIT = 256 * 1024  # Сколько байт файла стратегии читать в поисках версии
+WRITE_BUFFER_SIZE = 256 * 1024  # Скачанные данные пишутся на диск блоками такого размера вне цикла событий
+RETRY_BASE_DELAY = 2  # Первая повторная попытка ждёт до стольких секунд, каждая следующая — до вдвое большего времени
+GRAPHQL_COMMIT_COUNT = 100  # Сколько коммитов запрашивать вместе со статусом GraphQL, как одна страница REST API
+RELOAD_POLL_INTERVAL = 0.5  # Как часто перезапускаемый экземпляр Freqtrade опрашивается, работает ли он снова
+STRATEGY_CHECK_TIMEOUT = 300  # Наибольшее время, которое может занять проверка компиляции и импорта стратегии
+CHECK_HISTORY_LIMIT = 1000  # Сколько проверок каждого файла хранить в базе состояния
+POLL_BACKOFF_FACTOR = 0.25  # Вне активного окна интервал равен четверти времени с последнего коммита
+
+# Имя класса файла стратегии
+def strategy_class_name(file_path):
+    """Возвращает класс, который должен определять файл стратегии (Freqtrade называет его по имени файла), None для других файлов."""
+    return os.path.splitext(os.path.basename(file_path))[0] if file_path.endswith(".py") else None
+
+# Загружаем список отслеживаемых файлов
+def load_targets():
+    """Возвращает отслеживаемые файлы из TARGETS_FILE или один файл, собранный из настроек .env."""
+    if not TARGETS_FILE:
+        return [{
+            "name": posixpath.basename(REMOTE_FILE_PATH),
+            "repo": REPO_URL,
+            "remote_path": REMOTE_FILE_PATH,
+            "local_path": LOCAL_FILE_PATH,
+            "url": FILE_URL,
+            "interval": CHECK_INTERVAL,
+            "mode": CHECK_MODE,
+            "versioned": True,
+            "reload": True,
+            "adaptive": ADAPTIVE_POLLING,
+            "strategy_class": strategy_class_name(LOCAL_FILE_PATH),
+        }]
+    with open(TARGETS_FILE, encoding="utf-8") as f:
+        entries = json.load(f)
+    targets = []
+    for entry in entries:
+        repo = entry.get("repo", REPO_URL)
+        remote_path = entry["remote_path"]
+        versioned = entry.get("versioned", remote_path.endswith(".py"))
+        targets.append({
+            "name": entry.get("name", posixpath.basename(remote_path)),
+            "repo": repo,
+            "remote_path": remote_path,
+            "local_path": entry["local_path"],
+            "url": entry.get("url", f"https://raw.githubusercontent.com/{repo}/main/{remote_path}"),
+            "interval": int(entry.get("interval", CHECK_INTERVAL)),
+            "mode": entry.get("mode", CHECK_MODE).lower() if versioned else "blob",
+            "versioned": versioned,
+            "reload": entry.get("reload", True),
+            "adaptive": entry.get("adaptive", ADAPTIVE_POLLING),
+            "strategy_class": entry.get("strategy_class", strategy_class_name(entry["local_path"])),
+        })
+    return targets
+
+# Отслеживаемые файлы
+TARGETS = load_targets()
+
+# Загружаем список экземпляров Freqtrade
+def load_freqtrade_instances():
+    """Возвращает экземпляры Freqtrade из FREQTRADE_INSTANCES_FILE или один экземпляр из .env."""
+    if not FREQTRADE_INSTANCES_FILE:
+        return [{"name": "Freqtrade", "token": FREQTRADE_BOT_TOKEN, "chat_id": FREQTRADE_CHAT_ID,
+                 "api_url": FREQTRADE_API_URL, "username": FREQTRADE_API_USERNAME, "password": FREQTRADE_API_PASSWORD}]
+    with open(FREQTRADE_INSTANCES_FILE, encoding="utf-8") as f:
+        entries = json.load(f)
+    return [{
+        "name": entry.get("name", f"Freqtrade {number}"),
+        "token": entry.get("token", FREQTRADE_BOT_TOKEN),
+        "chat_id": str(entry.get("chat_id", FREQTRADE_CHAT_ID)),
+        "api_url": entry.get("api_url"),
+        "username": entry.get("username", FREQTRADE_API_USERNAME),
+        "password": entry.get("password", FREQTRADE_API_PASSWORD),
+    } for number, entry in enumerate(entries, 1)]
+
+# Экземпляры Freqtrade с общим томом стратегий
+FREQTRADE_INSTANCES = load_freqtrade_instances()
+
+# Общая HTTP-сессия для всех запросов к GitHub, создаётся при запуске и закрывается при остановке
+HTTP_SESSION = None
+
+# Статистика пула соединений
+HTTP_STATS = {
+    "requests": 0,
+    "connections_created": 0,
+    "connections_reused": 0,
+    "dns_lookups": 0,
+    "dns_cache_hits": 0,
+}
+
+# Метрики Prometheus, отдаются на /metrics
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+CHECK_DURATION = Histogram("monitor_check_duration_seconds", "Duration of an update check cycle", ["target"], buckets=DURATION_BUCKETS)
+CHECKS_TOTAL = Counter("monitor_checks_total", "Update checks", ["target"])
+CHECK_ERRORS = Counter("monitor_check_errors_total", "Update checks that failed", ["target"])
+UPDATES_TOTAL = Counter("monitor_updates_total", "Updates downloaded", ["target"])
+LAST_CHECK_TIME = Gauge("monitor_last_check_timestamp_seconds", "Unix time of the last finished check", ["target"])
+NEXT_CHECK_TIME = Gauge("monitor_next_check_timestamp_seconds", "Unix time of the next scheduled check", ["target"])
+HTTP_REQUEST_DURATION = Histogram("monitor_http_request_duration_seconds", "Time until the response headers arrive", ["host"])
+HTTP_RESPONSES = Counter("monitor_http_responses_total", "HTTP responses by status (error = no response)", ["host", "status"])
+HTTP_RECEIVED_BYTES = Counter("monitor_http_received_bytes_total", "Response body bytes received", ["host"])
+DOWNLOAD_RESUMES = Counter("monitor_download_resumes_total", "Downloads continued from a partial file with a Range request")
+DOWNLOAD_DURATION = Histogram("monitor_download_duration_seconds", "Duration of a download that replaced a file, including retries", buckets=DURATION_BUCKETS)
+TELEGRAM_LATENCY = Histogram("monitor_telegram_send_duration_seconds", "Latency of a Telegram sendMessage call")
+TELEGRAM_ERRORS = Counter("monitor_telegram_errors_total", "Telegram messages that failed or hit the rate limit", ["reason"])
+RELOAD_DURATION = Histogram("monitor_reload_duration_seconds", "Round trip of a Freqtrade reload command", ["instance"], buckets=DURATION_BUCKETS)
+GITHUB_RATE_REMAINING = Gauge("monitor_github_rate_limit_remaining", "GitHub API requests left in the current rate limit window")
+GITHUB_RATE_DEFERRED = Counter("monitor_github_requests_deferred_total", "GitHub API requests not sent because of the rate limit", ["priority"])
+HEDGE_WINS = Counter("monitor_download_source_wins_total", "Downloads won by each source", ["source"])
+VERSION_LOOKUPS = Counter("monitor_version_lookups_total", "Remote version lookups by source (memo, shared, request)", ["source"])
+STRATEGY_CHECK_DURATION = Histogram("monitor_strategy_check_duration_seconds", "Duration of the pre-reload strategy check by step (compile, import)", ["step"], buckets=DURATION_BUCKETS)
+STRATEGY_CHECK_ERRORS = Counter("monitor_strategy_check_errors_total", "Downloaded strategies that failed to compile or import", ["target"])
+SNAPSHOT_STORE_BYTES = Gauge("monitor_snapshot_store_bytes", "Disk space used by the stored versions")
+RELOAD_ERRORS = Counter("monitor_reload_errors_total", "Freqtrade reloads that failed or timed out", ["instance"])
+LOOP_LAG = Histogram("monitor_event_loop_lag_seconds", "Delay of a timer in the event loop",
+                     buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+LOOP_STALLS = Counter("monitor_event_loop_stalls_total", "Event loop stalls longer than LOOP_STALL_THRESHOLD")
+LOOP_LAG_INTERVAL = 1.0  # Как часто измеряется задержка цикла событий
+
+# Запоминаем начало HTTP-запроса
+async def on_http_request_start(session, context, params):
+    """Запоминает время отправки запроса."""
+    context.started = asyncio.get_running_loop().time()
+
+# Учитываем ответ на HTTP-запрос
+async def on_http_request_end(session, context, params):
+    """Учитывает задержку и статус ответа по хосту."""
+    host = params.url.host
+    HTTP_REQUEST_DURATION.labels(host).observe(asyncio.get_running_loop().time() - context.started)
+    HTTP_RESPONSES.labels(host, str(params.response.status)).inc()
+
+# Учитываем неудачный HTTP-запрос
+async def on_http_request_exception(session, context, params):
+    """Считает запросы, оставшиеся без ответа."""
+    HTTP_RESPONSES.labels(params.url.host, "error").inc()
+
+# Считаем полученные байты тела ответа
+async def on_http_chunk_received(session, context, params):
+    """Считает байты тела ответа по хосту."""
+    HTTP_RECEIVED_BYTES.labels(params.url.host).inc(len(params.chunk))
+
+# Подсчёт событий HTTP-клиента
+def http_stats_counter(key):
+    """Возвращает trace-обработчик, увеличивающий указанный счётчик HTTP_STATS."""
+    async def callback(session, context, params):
+        HTTP_STATS[key] += 1
+    return callback
+
+# Создаём HTTP-сессию с пулом соединений
+def create_http_session():
+    """Создаёт HTTP-сессию с пулом соединений, keep-alive и кэшем DNS."""
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+    )
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(http_stats_counter("requests"))
+    trace_config.on_connection_create_end.append(http_stats_counter("connections_created"))
+    trace_config.on_connection_reuseconn.append(http_stats_counter("connections_reused"))
+    trace_config.on_dns_resolvehost_end.append(http_stats_counter("dns_lookups"))
+    trace_config.on_dns_cache_hit.append(http_stats_counter("dns_cache_hits"))
+    trace_config.on_request_start.append(on_http_request_start)
+    trace_config.on_request_end.append(on_http_request_end)
+    trace_config.on_request_exception.append(on_http_request_exception)
+    trace_config.on_response_chunk_received.append(on_http_chunk_received)
+    return aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+
+# Получаем общую HTTP-сессию
+def get_http_session():
+    """Возвращает общую HTTP-сессию, создавая её при первом обращении."""
+    global HTTP_SESSION
+    if HTTP_SESSION is None or HTTP_SESSION.closed:
+        HTTP_SESSION = create_http_session()
+    return HTTP_SESSION
+
+# Статистика пула соединений для логов
+def format_http_stats():
+    """Возвращает статистику пула соединений одной строкой."""
+    return (f"HTTP-запросов: {HTTP_STATS['requests']}, создано соединений: {HTTP_STATS['connections_created']}, "
+            f"переиспользовано: {HTTP_STATS['connections_reused']}, DNS-запросов: {HTTP_STATS['dns_lookups']}, "
+            f"попаданий в кэш DNS: {HTTP_STATS['dns_cache_hits']}")
+
+# Лимит GitHub API по последнему ответу: лимит, оставшиеся запросы и время сброса (Unix-время)
+GITHUB_BUDGET = {"limit": None, "remaining": None, "reset": 0.0}
+
+# Выбрасывается вместо запроса к GitHub API, который превысил бы лимит
+class GitHubRateLimitError(Exception):
+    def __init__(self, reset):
+        super().__init__(f"лимит GitHub API исчерпан до {datetime.fromtimestamp(reset, pytz.timezone(TIMEZONE)).strftime('%H:%M:%S')}")
+        self.reset = reset
+
+# Проверяем бюджет GitHub API перед запросом
+def check_github_budget(interactive):
+    """Выбрасывает GitHubRateLimitError, если запрос отправлять не следует."""
+    remaining, reset = GITHUB_BUDGET["remaining"], GITHUB_BUDGET["reset"]
+    if remaining is None or time.time() >= reset:
+        return
+    # Кнопки останавливаются на GITHUB_INTERACTIVE_RESERVE запросов раньше, остаток сохраняется для проверок обновлений
+    floor = GITHUB_INTERACTIVE_RESERVE if interactive else 0
+    if remaining <= floor:
+        GITHUB_RATE_DEFERRED.labels("interactive" if interactive else "periodic").inc()
+        raise GitHubRateLimitError(reset)
+
+# Запоминаем бюджет GitHub API из заголовков ответа
+def update_github_budget(response):
+    """Читает заголовки X-RateLimit-* и Retry-After ответа GitHub API."""
+    headers = response.headers
+    if "X-RateLimit-Remaining" in headers:
+        GITHUB_BUDGET["limit"] = int(headers.get("X-RateLimit-Limit", 0))
+        GITHUB_BUDGET["remaining"] = int(headers["X-RateLimit-Remaining"])
+        GITHUB_BUDGET["reset"] = float(headers.get("X-RateLimit-Reset", 0))
+        GITHUB_RATE_REMAINING.set(GITHUB_BUDGET["remaining"])
+    if response.status in (403, 429) and (GITHUB_BUDGET["remaining"] == 0 or "Retry-After" in headers):
+        # Основной или вторичный лимит, до сброса ничего не отправляем
+        if "Retry-After" in headers:
+            GITHUB_BUDGET["reset"] = time.time() + int(headers["Retry-After"])
+        GITHUB_BUDGET["remaining"] = 0
+        GITHUB_RATE_REMAINING.set(0)
+        logger.warning(f"Лимит GitHub API исчерпан, запросы откладываются до "
+                       f"{datetime.fromtimestamp(GITHUB_BUDGET['reset'], pytz.timezone(TIMEZONE)).strftime('%H:%M:%S')}")
+
+# Запрос к GitHub API
+@contextlib.asynccontextmanager
+async def github_api_get(url, headers=None, interactive=False):
+    """Отправляет GET-запрос к GitHub API с токеном и учётом лимита, используется как "async with"."""
+    # Пока лимит исчерпан, запрос не отправляется
+    check_github_budget(interactive)
+    headers = dict(headers or {})
+    headers.setdefault("Accept", "application/vnd.github+json")
+    if GITHUB_TOKEN:
+        headers["Authorization"] = f"Bearer {GITHUB_TOKEN}"
+    async with get_http_session().get(url, headers=headers) as response:
+        update_github_budget(response)
+        yield response
+
+# Бюджет GitHub API для списка состояния
+def format_github_budget():
+    """Возвращает оставшиеся запросы к GitHub API одной строкой."""
+    if GITHUB_BUDGET["remaining"] is None:
+        return "🔑 GitHub API: запросов ещё не было"
+    reset = datetime.fromtimestamp(GITHUB_BUDGET["reset"], pytz.timezone(TIMEZONE)).strftime('%H:%M:%S')
+    return f"🔑 GitHub API: осталось {GITHUB_BUDGET['remaining']}/{GITHUB_BUDGET['limit']} запросов, сброс в {reset}"
+
 # Логирование входящих сообщений
 async def log_telegram_message(update: Update):
     """Логирует входящие сообщения в Telegram."""
@@ -43,73 +355,591 @@ async def log_telegram_message(update: Update):
     elif update.callback_query:
         logger.info(f"Входящий callback от {update.callback_query.from_user.username} ({update.callback_query.from_user.id}): {update.callback_query.data}")
 
+# Очередь исходящих сообщений Telegram и обработчик, который её отправляет
+NOTIFY_QUEUE = None
+NOTIFY_WORKER = None
+TELEGRAM_SEND_ATTEMPTS = 5  # Сколько раз повторять отправку после ответа 429
+LAST_SENT_AT = {}  # Время последнего сообщения в каждый чат
+
+# Статистика отправки уведомлений
+NOTIFY_STATS = {
+    "sent": 0,
+    "failed": 0,
+    "dropped": 0,
+    "rate_limited": 0,
+    "latency_total": 0.0,
+    "latency_max": 0.0,
+}
+
+# Запуск отправки уведомлений в Telegram
+def start_telegram_notifier():
+    """Создаёт очередь исходящих сообщений и запускает обработчик, если он ещё не запущен."""
+    global NOTIFY_QUEUE, NOTIFY_WORKER
+    if NOTIFY_QUEUE is None:
+        NOTIFY_QUEUE = asyncio.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+    if NOTIFY_WORKER is None or NOTIFY_WORKER.done():
+        NOTIFY_WORKER = asyncio.create_task(telegram_notifier_worker())
+
+# Остановка отправки уведомлений в Telegram
+async def stop_telegram_notifier(timeout=10):
+    """Дожидается отправки сообщений из очереди и останавливает обработчик."""
+    if NOTIFY_WORKER is None:
+        return
+    try:
+        await asyncio.wait_for(NOTIFY_QUEUE.join(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Очередь Telegram не опустела, потеряно сообщений: {NOTIFY_QUEUE.qsize()}.")
+    NOTIFY_WORKER.cancel()
+
 # Логирование отправки сообщений
-def send_telegram_message(token, chat_id, message):
+async def send_telegram_message(token, chat_id, message):
+    """Ставит сообщение для Telegram в очередь, не блокируя цикл событий."""
+    start_telegram_notifier()
+    try:
+        NOTIFY_QUEUE.put_nowait((token, chat_id, message))
+    except asyncio.QueueFull:
+        NOTIFY_STATS["dropped"] += 1
+        logger.error(f"Очередь Telegram переполнена, сообщение отброшено: {message}")
+
+# Отправляем сообщения из очереди по одному
+async def telegram_notifier_worker():
+    """Берёт сообщения из очереди и отправляет их в Telegram."""
+    while True:
+        token, chat_id, message = await NOTIFY_QUEUE.get()
+        try:
+            await deliver_telegram_message(token, chat_id, message)
+        except Exception as e:
+            NOTIFY_STATS["failed"] += 1
+            TELEGRAM_ERRORS.labels("failed").inc()
+            logger.error(f"Ошибка при отправке сообщения в Telegram: {e}")
+        finally:
+            NOTIFY_QUEUE.task_done()
+
+# Отправляем одно сообщение с учётом ограничений Telegram
+async def deliver_telegram_message(token, chat_id, message):
     """Отправляет сообщение в Telegram и логирует ответ."""
     url = f"https://api.telegram.org/bot{token}/sendMessage"
     payload = {"chat_id": chat_id, "text": message}
-    response = requests.post(url, json=payload)
-    logger.info(f"Отправка сообщения: {message}")
-    logger.info(f"Ответ от Telegram API: {response.text}")
-    response.raise_for_status()  # Если произошла ошибка, выбросит исключение
+    loop = asyncio.get_running_loop()
+    # Telegram допускает около одного сообщения в секунду в личный чат и 20 в минуту в группу
+    chat_interval = 3.0 if str(chat_id).startswith("-") else 1.0
+    for attempt in range(1, TELEGRAM_SEND_ATTEMPTS + 1):
+        pause = LAST_SENT_AT.get(chat_id, 0) + chat_interval - loop.time()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        started = loop.time()
+        async with get_http_session().post(url, json=payload) as response:
+            LAST_SENT_AT[chat_id] = loop.time()
+            result = await response.json(content_type=None)
+            logger.info(f"Отправка сообщения: {message}")
+            logger.info(f"Ответ от Telegram API: {result}")
+            if response.status == 429:
+                # Telegram сообщает, сколько нужно подождать перед следующей попыткой
+                retry_after = result.get("parameters", {}).get("retry_after", 1)
+                NOTIFY_STATS["rate_limited"] += 1
+                TELEGRAM_ERRORS.labels("rate_limited").inc()
+                logger.warning(f"Достигнут лимит Telegram, повтор через {retry_after} сек.")
+                await asyncio.sleep(retry_after)
+                continue
+            if response.status >= 400:
+                # URL содержит токен бота, поэтому он не попадает в текст ошибки
+                raise RuntimeError(f"Ошибка Telegram API {response.status}: {result.get('description')}")
+        latency = loop.time() - started
+        TELEGRAM_LATENCY.observe(latency)
+        NOTIFY_STATS["sent"] += 1
+        NOTIFY_STATS["latency_total"] += latency
+        NOTIFY_STATS["latency_max"] = max(NOTIFY_STATS["latency_max"], latency)
+        return
+    raise RuntimeError(f"Лимит Telegram: сообщение не отправлено после {TELEGRAM_SEND_ATTEMPTS} попыток")
 
-# Функция для перезапуска Freqtrade
-async def reload_freqtrade(update: Update, context: CallbackContext):
-    """Отправка команды на перезапуск Freqtrade в другой бот."""
-    logger.info("Обработка кнопки 'Перезапустить Freqtrade'.")
+# Статистика отправки уведомлений для логов
+def format_notifier_stats():
+    """Возвращает глубину очереди и задержку отправки уведомлений Telegram одной строкой."""
+    depth = NOTIFY_QUEUE.qsize() if NOTIFY_QUEUE else 0
+    average = NOTIFY_STATS["latency_total"] / NOTIFY_STATS["sent"] if NOTIFY_STATS["sent"] else 0.0
+    return (f"Очередь Telegram: {depth}, отправлено: {NOTIFY_STATS['sent']}, ошибок: {NOTIFY_STATS['failed']}, "
+            f"отброшено: {NOTIFY_STATS['dropped']}, ответов 429: {NOTIFY_STATS['rate_limited']}, "
+            f"задержка сред./макс.: {average * 1000:.0f}/{NOTIFY_STATS['latency_max'] * 1000:.0f} мс")
+
+# Учётные данные REST API Freqtrade
+def freqtrade_api_auth(instance):
+    """Возвращает basic auth экземпляра или None, если имя пользователя не задано."""
+    return aiohttp.BasicAuth(instance["username"], instance["password"] or "") if instance["username"] else None
+
+# Отправляем команду перезапуска одному экземпляру Freqtrade
+async def send_reload_command(instance):
+    """Просит экземпляр перечитать конфигурацию и возвращает "api" или "telegram"."""
+    if instance["api_url"]:
+        try:
+            url = f"{instance['api_url'].rstrip('/')}/api/v1/reload_config"
+            async with get_http_session().post(url, auth=freqtrade_api_auth(instance)) as response:
+                response.raise_for_status()
+            return "api"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if not instance["token"]:
+                raise
+            logger.warning(f"REST API {instance['name']} недоступен, отправляем /reload_config через Telegram: {e}")
+    # Telegram используется, если REST API не настроен или не принимает команду
+    await deliver_telegram_message(instance["token"], instance["chat_id"], "/reload_config")
+    return "telegram"
+
+# Ждём, пока перезапущенный экземпляр Freqtrade снова заработает
+async def wait_for_freqtrade(instance):
+    """Опрашивает /api/v1/ping и /api/v1/show_config, пока бот снова не заработает."""
+    base_url = instance["api_url"].rstrip("/")
+    session = get_http_session()
+    while True:
+        await asyncio.sleep(RELOAD_POLL_INTERVAL)
+        try:
+            async with session.get(f"{base_url}/api/v1/ping") as response:
+                if response.status != 200:
+                    continue
+            async with session.get(f"{base_url}/api/v1/show_config", auth=freqtrade_api_auth(instance)) as response:
+                if response.status != 200:
+                    continue
+                config = await response.json()
+        # API-сервер перезапускается вместе с ботом, ошибки означают только "ещё нет"
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            continue
+        if config.get("state") == "running":
+            return f"{config.get('strategy')} {config.get('strategy_version') or ''}".strip()
+
+# Перезапускаем один экземпляр Freqtrade
+async def reload_instance(instance):
+    """Перезапускает один экземпляр Freqtrade и возвращает (имя, ошибка, время, стратегия)."""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    strategy = None
     try:
-        # Отправка команды на перезапуск
-        send_telegram_message(FREQTRADE_BOT_TOKEN, FREQTRADE_CHAT_ID, "/reload_config")
-        message = "Команда перезапуска Freqtrade отправлена"
+        # Команда отправляется напрямую, а не через очередь уведомлений, поэтому экземпляры перезапускаются параллельно
+        path = await asyncio.wait_for(send_reload_command(instance), RELOAD_TIMEOUT)
+        if path == "api":
+            strategy = await asyncio.wait_for(wait_for_freqtrade(instance), RELOAD_TIMEOUT - (loop.time() - started))
+        error = None
+    except asyncio.TimeoutError:
+        error = f"нет ответа за {RELOAD_TIMEOUT} сек."
+    except Exception as e:
+        error = str(e)
+    elapsed = loop.time() - started
+    RELOAD_DURATION.labels(instance["name"]).observe(elapsed)
+    if error:
+        RELOAD_ERRORS.labels(instance["name"]).inc()
+    return instance["name"], error, elapsed, strategy
 
-        # Проверяем, существует ли callback_query, и отправляем ответ
-        if update and update.callback_query:
-            await update.callback_query.message.reply_text(message)
+# Перезапускаем все экземпляры Freqtrade одновременно
+async def reload_all_instances():
+    """Одновременно перезапускает все экземпляры Freqtrade и возвращает одно итоговое сообщение и результаты."""
+    results = await asyncio.gather(*(reload_instance(instance) for instance in FREQTRADE_INSTANCES))
+    failed = [result for result in results if result[1]]
+    lines = [f"🔄 Перезапуск Freqtrade: успешно {len(results) - len(failed)}/{len(results)}"]
+    for name, error, elapsed, strategy in results:
+        if error:
+            lines.append(f"❌ {name}: {error}")
+            logger.error(f"Ошибка при отправке команды перезапуска в {name}: {error}")
+        elif strategy:
+            lines.append(f"✅ {name}: снова работает через {elapsed:.1f} сек., {strategy}")
         else:
-            logger.warning("Перезапуск инициирован без взаимодействия с Telegram.")
+            lines.append(f"✅ {name} ({elapsed:.1f} сек.)")
+    return "\n".join(lines), results
 
-        logger.info("Команда на перезапуск Freqtrade успешно отправлена.")
-    except Exception as e:
-        logger.error(f"Ошибка при отправке команды перезапуска: {e}")
+# Функция для перезапуска Freqtrade
+async def reload_freqtrade(update: Update, context: CallbackContext):
+    """Отправка команды на перезапуск Freqtrade всем настроенным экземплярам."""
+    logger.info("Обработка кнопки 'Перезапустить Freqtrade'.")
+    summary, results = await reload_all_instances()
+    logger.info(summary)
+    if len(results) == 1:
+        # Для одного экземпляра сохраняем короткий ответ
+        name, error, elapsed, strategy = results[0]
+        if error:
+            summary = f"❌ Не удалось отправить команду: {error}"
+        elif strategy:
+            summary = f"✅ Freqtrade перезапущен и снова работает через {elapsed:.1f} сек. Стратегия: {strategy}"
+        else:
+            summary = "Команда перезапуска Freqtrade отправлена"
 
-        # Отправляем сообщение об ошибке, если callback_query существует
-        if update and update.callback_query:
-            await update.callback_query.message.reply_text(f"❌ Не удалось отправить команду: {e}")
+    # Проверяем, существует ли callback_query, и отправляем ответ
+    if update and update.callback_query:
+        await update.callback_query.message.reply_text(summary)
+    else:
+        logger.warning("Перезапуск инициирован без взаимодействия с Telegram.")
+        if len(results) > 1 or results[0][1] or results[0][3]:
+            await send_telegram_message(TELEGRAM_TOKEN, CHAT_ID, summary)  # Одна сводка вместо сообщения на каждый экземпляр
 
 
 # Асинхронная версия загрузки файла с повторными попытками
-async def download_file_with_retries(url, save_path, retries=RETRY_LIMIT, delay=RETRY_DELAY):
+async def download_file_with_retries(url, save_path, retries=RETRY_LIMIT, delay=RETRY_DELAY, known_version=None, versioned=True):
     """Асинхронная версия загрузки файла с повторными попытками."""
-    async with aiohttp.ClientSession() as session:
-        for attempt in range(1, retries + 1):
+    started = time.monotonic()
+    for attempt in range(1, retries + 1):
+        try:
+            logger.info(f"Попытка {attempt}/{retries} загрузки...")
+            status, version, saved = await fetch_shared_file_content(url, known_version, save_path, versioned)
+            if not saved:
+                logger.info(f"Скачивать нечего. Удалённая версия: {version}")
+                return version, False
+            logger.info("Файл успешно загружен.")
+            DOWNLOAD_DURATION.observe(time.monotonic() - started)
+            return version, True
+        except StrategyCheckError:
+            raise  # Повторное скачивание того же файла не поможет
+        except Exception as e:
+            logger.error(f"Попытка {attempt}/{retries} не удалась: {e}")
+            if attempt < retries:
+                # Экспоненциальная задержка со случайным разбросом, не больше delay
+                pause = random.uniform(0, min(delay, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+                logger.info(f"Следующая попытка через {pause:.1f} с.")
+                await asyncio.sleep(pause)
+            else:
+                # Частично скачанный файл сохраняется, следующая проверка его продолжит
+                logger.error("Все попытки исчерпаны.")
+                raise
+
+# Валидаторы (ETag / Last-Modified) и последняя известная версия для каждого отслеживаемого URL
+REMOTE_FILE_CACHE = {}
+
+# Последняя удалённая версия каждого URL и время её получения: (monotonic-время, версия)
+VERSION_MEMO = {}
+
+# Выполняемые запросы версии по URL, одновременные вызовы ждут одну и ту же задачу
+VERSION_INFLIGHT = {}
+
+# Частично скачанные файлы по save_path: URL, валидатор, версия, временный файл, размер и хэш записанных байт
+PARTIAL_DOWNLOADS = {}
+
+# Забываем частично скачанный файл
+def discard_partial_download(save_path):
+    """Удаляет запись о докачке save_path и её временный файл."""
+    partial = PARTIAL_DOWNLOADS.pop(save_path, None)
+    if partial and partial["temp_path"] and os.path.exists(partial["temp_path"]):
+        os.remove(partial["temp_path"])
+
+# Удаляем загрузки, прерванные перезапуском
+def remove_stale_downloads():
+    """Удаляет файлы .<имя>.*.tmp, оставшиеся рядом с отслеживаемыми файлами. Выполняется в рабочем потоке."""
+    # Записи для докачки хранятся только в памяти, после перезапуска эти файлы никто не продолжит
+    for target in TARGETS:
+        directory = os.path.dirname(os.path.abspath(target["local_path"]))
+        prefix = f".{os.path.basename(target['local_path'])}."
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(directory, name))
+                    logger.info(f"Удалена прерванная загрузка {name}.")
+                except OSError as e:
+                    logger.warning(f"Ошибка при удалении прерванной загрузки {name}: {e}")
+
+# Проверяем, что ответ 206 продолжает частично скачанный файл
+def resumes_partial(response, partial):
+    """Возвращает True, если тело ответа начинается сразу после уже записанных байт."""
+    match = re.match(r"bytes (\d+)-", response.headers.get("Content-Range", ""))
+    return response.status == 206 and match is not None and int(match.group(1)) == partial["size"]
+
+# Читаем удалённый файл только до строки с версией
+async def read_until_version(response):
+    """Читает ответ блоками и останавливается, как только найдена строка с версией."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    head = bytearray()
+    text = ""
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        head += chunk
+        scan_from = max(0, len(text) - 128)  # Строка версии может оказаться на стыке блоков
+        text += decoder.decode(chunk)
+        match = VERSION_PATTERN.search(text, scan_from)
+        if match:
+            return head, match.group(1)
+        if len(head) >= VERSION_SCAN_LIMIT:
+            break
+    return head, None
+
+# SHA-256 локального файла
+def file_sha256(file_path):
+    """Возвращает SHA-256 файла или None, если файла нет."""
+    if not os.path.exists(file_path):
+        return None
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE * 4), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Дописываем файл и сбрасываем его на диск
+def write_and_sync(f, data):
+    """Записывает данные и ждёт, пока файл окажется на диске. Выполняется в рабочем потоке."""
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+
+# Переносим готовый временный файл на место
+def replace_and_sync(temp_path, save_path):
+    """Заменяет save_path на temp_path и сохраняет переименование на диск. Выполняется в рабочем потоке."""
+    directory = os.path.dirname(os.path.abspath(save_path))
+    # Сохраняем права текущего файла, mkstemp создаёт файл, доступный только владельцу
+    mode = os.stat(save_path).st_mode if os.path.exists(save_path) else 0o644
+    os.chmod(temp_path, mode & 0o777)
+    os.replace(temp_path, save_path)
+    sync_directory(directory)  # Сохраняем на диск и само переименование
+
+# Сохраняем на диск переименования в каталоге
+def sync_directory(directory):
+    """Сбрасывает изменения записей каталога на диск. Выполняется в рабочем потоке."""
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+# Выбрасывается вместо замены рабочего файла стратегией, не прошедшей проверку
+class StrategyCheckError(Exception):
+    def __init__(self, error, version, blob_sha):
+        super().__init__(error)
+        self.version = version
+        self.blob_sha = blob_sha
+
+# Проверяем скачанную стратегию до замены рабочего файла
+async def check_download(temp_path, save_path):
+    """Запускает check_strategy для временного файла отслеживаемой стратегии и выбрасывает StrategyCheckError при ошибке."""
+    target = next((target for target in TARGETS if target["local_path"] == save_path), None)
+    if target is None or not target["strategy_class"] or not STRATEGY_CHECK:
+        return
+    blob_sha = await asyncio.to_thread(compute_blob_sha, temp_path, os.path.getsize(temp_path))
+    rejected = REJECTED_DOWNLOADS.get(target["name"])
+    if rejected and rejected["blob_sha"] == blob_sha:
+        error = rejected["error"]  # Этот файл уже не прошёл проверку, повторно он не проверяется
+    else:
+        error = await check_strategy(target, temp_path)
+    if error:
+        if target["versioned"]:
+            version = await asyncio.to_thread(extract_version_from_file, temp_path)
+            LOCAL_VERSION_CACHE.pop(temp_path, None)
+        else:
+            version = blob_sha[:7]
+        raise StrategyCheckError(error, version, blob_sha)
+
+# Атомарно записываем скачанный файл
+async def save_stream_atomically(head, chunks, save_path, partial=None):
+    """Записывает поток во временный файл рядом с save_path и переносит его на место."""
+    directory = os.path.dirname(os.path.abspath(save_path))
+    # Запись для докачки, у которой уже есть временный файл, продолжается
+    if partial and partial["temp_path"]:
+        temp_path, digest, size = partial["temp_path"], partial["digest"], partial["size"]
+        f = open(temp_path, "ab")
+    else:
+        fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(save_path)}.", suffix=".tmp", dir=directory)
+        f = os.fdopen(fd, "wb")
+        digest, size = hashlib.sha256(), 0
+    keep = False
+    try:
+        with f:
+            buffer = bytearray(head)
             try:
-                logger.info(f"Попытка {attempt}/{retries} загрузки...")
-                async with session.get(url) as response:
-                    response.raise_for_status()  # Вызывает ошибку при неудачном ответе
-                    with open(save_path, "wb") as f:
-                        f.write(await response.read())
-                logger.info("Файл успешно загружен.")
-                return
-            except Exception as e:
-                logger.error(f"Попытка {attempt}/{retries} не удалась: {e}")
-                if attempt < retries:
-                    await asyncio.sleep(delay)  # Задержка перед следующей попыткой
-                else:
-                    logger.error("Все попытки исчерпаны.")
+                async for chunk in chunks:
+                    buffer += chunk
+                    if len(buffer) >= WRITE_BUFFER_SIZE:
+                        await asyncio.to_thread(f.write, bytes(buffer))
+                        digest.update(buffer)
+                        size += len(buffer)
+                        buffer.clear()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError):
+                if partial is None:
                     raise
+                # Сохраняем то, что успело прийти, следующая попытка запросит только остаток
+                await asyncio.to_thread(write_and_sync, f, bytes(buffer))
+                digest.update(buffer)
+                partial.update(temp_path=temp_path, digest=digest, size=size + len(buffer))
+                keep = True
+                logger.info(f"Сохранено {partial['size']} байт {save_path} для докачки.")
+                raise
+            await asyncio.to_thread(write_and_sync, f, bytes(buffer))
+            digest.update(buffer)
+            size += len(buffer)
+        # Временный файл сбрасывается на диск до os.replace, Freqtrade никогда не видит недописанную стратегию
+        if digest.hexdigest() == await asyncio.to_thread(file_sha256, save_path):
+            os.remove(temp_path)
+            logger.info(f"Скачанный файл совпадает с {save_path}, заменять нечего.")
+            return False
+        # Стратегия, которая не компилируется или не импортируется, не становится рабочим файлом
+        await check_download(temp_path, save_path)
+        await asyncio.to_thread(replace_and_sync, temp_path, save_path)
+        logger.info(f"Сохранено {size} байт в {save_path} (sha256 {digest.hexdigest()[:12]}).")
+        return True
+    except BaseException:
+        if not keep and os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
 
 # Получаем содержимое удалённого файла с GitHub
-async def fetch_file_content(repo_url, file_path):
-    """Получает содержимое файла из GitHub."""
-    api_url = f"https://raw.githubusercontent.com/{repo_url}/main/{file_path}"
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(api_url) as response:
+async def fetch_file_content(url, known_version=None, save_path=None, versioned=True):
+    """Получает удалённый файл условным запросом и возвращает (статус, версия, сохранён)."""
+    cached = REMOTE_FILE_CACHE.get(url, {})
+    headers = {}
+    partial = PARTIAL_DOWNLOADS.get(save_path) if save_path else None
+    if partial and (partial["url"] != url or not partial["temp_path"] or not os.path.exists(partial["temp_path"])):
+        discard_partial_download(save_path)
+        partial = None
+    if partial:
+        # Частичная загрузка продолжается, If-Range заставляет отдать изменённый файл с начала
+        headers["Range"] = f"bytes={partial['size']}-"
+        headers["If-Range"] = partial["validator"]
+    # Ответ 304 полезен, только если вызывающему достаточно сохранённой версии
+    elif cached and (save_path is None or (versioned and cached["version"] == known_version)):
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    session = get_http_session()
+    async with session.get(url, headers=headers) as response:
+        if response.status == 304:
+            logger.info(f"Удалённый файл не изменился (304). Версия: {cached['version']}")
+            VERSION_MEMO[url] = (time.monotonic(), cached["version"])
+            return 304, cached["version"], False
+        if partial and resumes_partial(response, partial):
+            logger.info(f"Продолжаем загрузку {save_path} с байта {partial['size']}.")
+            DOWNLOAD_RESUMES.inc()
+            saved = await save_stream_atomically(bytearray(), response.content.iter_chunked(STREAM_CHUNK_SIZE), save_path, partial)
+            PARTIAL_DOWNLOADS.pop(save_path, None)
+            return response.status, partial["version"] or "Неизвестная версия", saved
+        if partial:
+            discard_partial_download(save_path)  # Файл изменился или сервер не поддержал Range
+            partial = None
+        response.raise_for_status()
+        if versioned:
+            head, version = await read_until_version(response)
+        else:
+            head, version = bytearray(), None
+        # Сохраняется до тела файла: на файл, отклонённый проверкой стратегии, затем приходит 304
+        REMOTE_FILE_CACHE[url] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "version": version or "Неизвестная версия",
+        }
+        VERSION_MEMO[url] = (time.monotonic(), version or "Неизвестная версия")
+        if save_path is None or (versioned and (version is None or version == known_version)):
+            response.close()  # Закрываем соединение, не скачивая остаток файла
+            logger.info(f"Для поиска версии прочитано {len(head)} байт удалённого файла.")
+            saved = False
+        else:
+            etag = response.headers.get("ETag")
+            # Для If-Range нужен сильный ETag или дата изменения
+            validator = etag if etag and not etag.startswith("W/") else response.headers.get("Last-Modified")
+            if validator:
+                partial = {"url": url, "validator": validator, "version": version, "temp_path": None, "digest": None, "size": 0}
+                PARTIAL_DOWNLOADS[save_path] = partial
+            saved = await save_stream_atomically(head, response.content.iter_chunked(STREAM_CHUNK_SIZE), save_path, partial)
+            PARTIAL_DOWNLOADS.pop(save_path, None)
+        return response.status, version or "Неизвестная версия", saved
+
+# Источники отслеживаемого файла
+def download_sources(target):
+    """Возвращает источники, из которых можно скачать файл, первым идёт настроенный URL."""
+    repo, path = target["repo"], target["remote_path"]
+    sources = [{"name": "primary", "url": target["url"], "api": False}]
+    # GitHub contents API и jsDelivr отдают тот же blob с других хостов
+    if "contents" in HEDGE_SOURCES:
+        sources.append({"name": "contents", "url": f"https://api.github.com/repos/{repo}/contents/{path}?ref=main", "api": True})
+    if "jsdelivr" in HEDGE_SOURCES:
+        sources.append({"name": "jsdelivr", "url": f"https://cdn.jsdelivr.net/gh/{repo}@main/{path}", "api": False})
+    for number, template in enumerate(DOWNLOAD_MIRRORS, 1):
+        sources.append({"name": f"mirror{number}", "url": template.format(repo=repo, path=path), "api": False})
+    return sources
+
+# Скачиваем файл из одного источника
+async def download_from_source(source, save_path, expected_sha):
+    """Скачивает файл в собственный временный файл и проверяет его git blob SHA."""
+    directory = os.path.dirname(os.path.abspath(save_path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(save_path)}.{source['name']}.", suffix=".tmp", dir=directory)
+    try:
+        if source["api"]:
+            request = github_api_get(source["url"], {"Accept": "application/vnd.github.raw"})
+        else:
+            request = get_http_session().get(source["url"])
+        with os.fdopen(fd, "wb") as f:
+            async with request as response:
                 response.raise_for_status()
-                return await response.text()
-        except Exception as e:
-            logger.error(f"Ошибка при получении файла: {e}")
-            return None
+                head = bytearray()
+                buffer = bytearray()
+                size = 0
+                async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    if len(head) < VERSION_SCAN_LIMIT:
+                        head += chunk[:VERSION_SCAN_LIMIT - len(head)]
+                    buffer += chunk
+                    size += len(chunk)
+                    if len(buffer) >= WRITE_BUFFER_SIZE:
+                        await asyncio.to_thread(f.write, bytes(buffer))
+                        buffer.clear()
+            await asyncio.to_thread(write_and_sync, f, bytes(buffer))
+        sha = await asyncio.to_thread(compute_blob_sha, temp_path, size)
+        if sha != expected_sha:
+            raise RuntimeError(f"blob SHA {sha[:7]} не совпадает с ожидаемым {expected_sha[:7]}")
+        match = VERSION_PATTERN.search(head.decode("utf-8", errors="replace"))
+        return temp_path, match.group(1) if match else None
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+# Устраиваем гонку источников файла
+async def hedged_download(target, expected_sha):
+    """Скачивает отслеживаемый файл из первого источника, который отдаст ожидаемый blob."""
+    save_path = target["local_path"]
+    primary, *alternatives = download_sources(target)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    pending = {asyncio.ensure_future(download_from_source(primary, save_path, expected_sha)): primary["name"]}
+    hedged = not alternatives
+    winner = None
+    errors = []
+    try:
+        # Настроенный URL стартует один, остальные подключаются через HEDGE_DELAY секунд или после его ошибки
+        while winner is None:
+            if not hedged and (not pending or loop.time() - started >= HEDGE_DELAY):
+                logger.info(f"{primary['name']} медленный или не ответил, запускаем гонку {[source['name'] for source in alternatives]}")
+                for source in alternatives:
+                    pending[asyncio.ensure_future(download_from_source(source, save_path, expected_sha))] = source["name"]
+                hedged = True
+            if not pending:
+                break
+            timeout = None if hedged else HEDGE_DELAY - (loop.time() - started)
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = pending.pop(task)
+                if task.exception():
+                    errors.append(f"{name}: {task.exception()}")
+                    logger.warning(f"Загрузка из {name} не удалась: {task.exception()}")
+                elif winner is None:
+                    winner = (name,) + task.result()
+                else:
+                    os.remove(task.result()[0])  # Завершилась в одном раунде с победителем
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    if winner is None:
+        raise RuntimeError("все источники загрузки не ответили: " + "; ".join(errors))
+
+    name, temp_path, version = winner
+    HEDGE_WINS.labels(name).inc()
+    logger.info(f"Скачано из {name} за {loop.time() - started:.2f} сек., blob SHA {expected_sha[:12]} проверен.")
+    if target["versioned"] and version is None:
+        os.remove(temp_path)
+        return "Неизвестная версия", False
+    try:
+        await check_download(temp_path, save_path)
+        await asyncio.to_thread(replace_and_sync, temp_path, save_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    DOWNLOAD_DURATION.observe(loop.time() - started)
+    # Запросы версии не должны по-прежнему отвечать версией до этого скачивания
+    REMOTE_FILE_CACHE[target["url"]] = {"etag": None, "last_modified": None, "version": version or "Неизвестная версия"}
+    VERSION_MEMO[target["url"]] = (time.monotonic(), version or "Неизвестная версия")
+    return version, True
+
+# Локальные версии по пути к файлу: ((inode, размер, mtime_ns), версия)
+LOCAL_VERSION_CACHE = {}
 
 # Извлекаем версию из содержимого локального файла
 def extract_version_from_file(file_path):
@@ -117,73 +947,796 @@ def extract_version_from_file(file_path):
     if not os.path.exists(file_path):
         return "Файл не найден"
     try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            content = file.read()
-            match = re.search(r'return\s+[\'\"](v[\d.]+)[\'\"]', content)
-            return match.group(1) if match else "Неизвестная версия"
+        stat = os.stat(file_path)
+        # Версия используется повторно, пока файл не изменится
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        cached = LOCAL_VERSION_CACHE.get(file_path)
+        if cached and cached[0] == key:
+            return cached[1]
+        with open(file_path, "rb") as file:
+            content = file.read(VERSION_SCAN_LIMIT).decode("utf-8", errors="replace")
+        match = VERSION_PATTERN.search(content)
+        version = match.group(1) if match else "Неизвестная версия"
+        LOCAL_VERSION_CACHE[file_path] = (key, version)
+        return version
     except Exception as e:
         logger.error(f"Ошибка при извлечении версии: {e}")
     return "Неизвестная версия"
 
-# Извлекаем версию из содержимого удалённого файла
-def extract_version_from_content(content):
-    """Проверяет содержимое текста на наличие версии."""
-    match = re.search(r'return\s+[\'\"](v[\d.]+)[\'\"]', content)
-    return match.group(1) if match else "Неизвестная версия"
+# Git blob SHA-1 локальных файлов по пути: ((inode, размер, mtime_ns), sha)
+LOCAL_BLOB_SHA_CACHE = {}
+
+# ETag и blob SHA из последнего ответа GitHub trees API для каждого URL дерева
+REMOTE_TREE_CACHE = {}
+
+# Git blob SHA локального файла
+def git_blob_sha(file_path):
+    """Вычисляет git blob SHA-1 локального файла, результат кэшируется до изменения файла."""
+    if not os.path.exists(file_path):
+        return None
+    stat = os.stat(file_path)
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    cached = LOCAL_BLOB_SHA_CACHE.get(file_path)
+    if cached and cached[0] == key:
+        return cached[1]
+    sha = compute_blob_sha(file_path, stat.st_size)
+    LOCAL_BLOB_SHA_CACHE[file_path] = (key, sha)
+    return sha
+
+# Git blob SHA файла без кэширования
+def compute_blob_sha(file_path, size):
+    """Хэширует файл так же, как git: SHA-1 от заголовка blob и содержимого."""
+    digest = hashlib.sha1(f"blob {size}\0".encode())
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE * 4), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Git blob SHA удалённого файла
+async def fetch_remote_blob_sha(repo_url, file_path):
+    """Получает git blob SHA файла через GitHub trees API."""
+    directory, name = posixpath.split(file_path)
+    tree = f"main:{directory}" if directory else "main"
+    api_url = f"https://api.github.com/repos/{repo_url}/git/trees/{tree}"
+    cached = REMOTE_TREE_CACHE.get(api_url, {})
+    headers = {}
+    # Неизменённое дерево стоит ответа 304 без тела
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    async with github_api_get(api_url, headers) as response:
+        if response.status == 304:
+            return cached["shas"].get(name)
+        response.raise_for_status()
+        tree_data = await response.json()
+    shas = {entry["path"]: entry["sha"] for entry in tree_data.get("tree", []) if entry.get("type") == "blob"}
+    REMOTE_TREE_CACHE[api_url] = {"etag": response.headers.get("ETag"), "shas": shas}
+    return shas.get(name)
+
+# Делаем запрос версии видимым для одновременных вызовов
+def publish_version_lookup(url, lookup):
+    """Запускает запрос как задачу в VERSION_INFLIGHT до его завершения и возвращает задачу."""
+    task = asyncio.ensure_future(lookup)
+    VERSION_INFLIGHT[url] = task
+    task.add_done_callback(lambda _: VERSION_INFLIGHT.pop(url, None))
+    return task
+
+# Запрос версии проверкой, которая может скачать файл
+async def fetch_shared_file_content(url, known_version, save_path, versioned):
+    """Выполняет fetch_file_content для периодической проверки и кнопки скачивания."""
+    if not versioned:
+        return await fetch_file_content(url, save_path=save_path, versioned=False)
+    # Уже идущий запрос (нажатие кнопки), нашедший known_version, избавляет от своего запроса
+    running = VERSION_INFLIGHT.get(url)
+    if running is not None:
+        try:
+            status, version, _ = await asyncio.shield(running)
+        except Exception:
+            pass  # Запрос ниже повторяется вызывающим, если он тоже не удастся
+        else:
+            if version == known_version:
+                VERSION_LOOKUPS.labels("shared").inc()
+                return status, version, False
+    task = fetch_file_content(url, known_version=known_version, save_path=save_path)
+    # Нажатия во время загрузки ждут этот запрос вместо отправки своих
+    if url not in VERSION_INFLIGHT:
+        task = publish_version_lookup(url, task)
+    return await task
+
+# Удалённая версия с объединением запросов
+async def fetch_remote_version(url):
+    """Возвращает удалённую версию url, разделяя один запрос между одновременными вызовами."""
+    # Версия, полученная любой проверкой, в том числе периодической, используется VERSION_CACHE_TTL секунд
+    memo = VERSION_MEMO.get(url)
+    if memo and time.monotonic() - memo[0] < VERSION_CACHE_TTL:
+        VERSION_LOOKUPS.labels("memo").inc()
+        return memo[1]
+    task = VERSION_INFLIGHT.get(url)
+    if task is None:
+        VERSION_LOOKUPS.labels("request").inc()
+        task = publish_version_lookup(url, fetch_file_content(url))
+    else:
+        VERSION_LOOKUPS.labels("shared").inc()
+    # Отменённый вызов не должен отменять запрос остальных
+    status, version, _ = await asyncio.shield(task)
+    return version
 
 # Получаем версию удалённого файла
-async def check_remote_version():
+async def check_remote_version(target=None):
     """Проверяет версию файла на GitHub."""
-    content = await fetch_file_content(REPO_URL, REMOTE_FILE_PATH)
-    if content:
-        version = extract_version_from_content(content)
+    target = target or TARGETS[0]
+    try:
+        # Запрашивается /start и кнопками: запрос не расходует резерв периодических проверок
+        status = await get_github_status(target["repo"], target["remote_path"], interactive=True) if GITHUB_API_MODE == "graphql" else None
+        version = status["version"] if status else await fetch_remote_version(target["url"])
         logger.info(f"Версия удалённого файла: {version}")
         return version
-    else:
-        logger.error("Не удалось получить содержимое файла.")
+    except Exception as e:
+        logger.error(f"Ошибка при получении файла: {e}")
         return "Ошибка загрузки"
 
+# Компилируем и импортируем файл стратегии, выполняется в отдельном процессе
+def compile_and_import_strategy(source_path, live_path, class_name):
+    """Записывает байт-код source_path в __pycache__ файла live_path и импортирует из него class_name."""
+    try:
+        started = time.perf_counter()
+        # Файл .pyc записывается для рабочего пути, поэтому после замены Freqtrade не компилирует файл
+        cache_path = py_compile.compile(source_path, cfile=importlib.util.cache_from_source(live_path), dfile=live_path, doraise=True)
+        compiled = time.perf_counter()
+        with open(cache_path, "rb") as f:
+            code = marshal.loads(f.read()[16:])  # Пропускаем 16-байтовый заголовок .pyc
+        module = types.ModuleType(f"strategy_check_{class_name}")
+        module.__file__ = live_path
+        sys.modules[module.__name__] = module
+        try:
+            exec(code, module.__dict__)  # Выполняет только что записанный байт-код
+            note = None
+            found = isinstance(getattr(module, class_name, None), type)
+        # В мониторе нет Freqtrade, тогда класс ищется в байт-коде
+        except ModuleNotFoundError as e:
+            note = f"импорт пропущен, {e.name} не установлен"
+            found = any(isinstance(const, types.CodeType) and const.co_name == class_name for const in code.co_consts)
+        if not found:
+            raise RuntimeError(f"класс {class_name} не определён")
+        return compiled - started, time.perf_counter() - compiled, note
+    except RuntimeError:
+        raise
+    except py_compile.PyCompileError as e:
+        raise RuntimeError(f"{e.exc_type_name}: {e.exc_value}") from None
+    except Exception as e:
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+# Точка входа процесса проверки стратегии
+def run_strategy_check(connection, source_path, live_path, class_name):
+    """Отправляет результат compile_and_import_strategy или его ошибку обратно через канал."""
+    try:
+        connection.send((None, compile_and_import_strategy(source_path, live_path, class_name)))
+    except RuntimeError as e:
+        connection.send((str(e), None))
+    finally:
+        connection.close()
+
+# Проверяем стратегию до того, как её загрузит Freqtrade
+async def check_strategy(target, source_path=None):
+    """Компилирует и импортирует source_path (по умолчанию рабочий файл) в отдельном процессе и возвращает None или ошибку."""
+    local_path, class_name = target["local_path"], target["strategy_class"]
+    if not STRATEGY_CHECK or not class_name:
+        return None
+    # Новый процесс для каждой проверки, чтобы ничего от предыдущей версии не оставалось импортированным
+    # Процесс запускается через spawn, а не fork: в мониторе работают потоки и открыто соединение SQLite
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=run_strategy_check, args=(sender, source_path or local_path, local_path, class_name), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        if await asyncio.to_thread(receiver.poll, STRATEGY_CHECK_TIMEOUT):
+            error, result = receiver.recv()
+        else:
+            error = f"нет результата за {STRATEGY_CHECK_TIMEOUT} сек."
+    except EOFError:
+        error = "процесс проверки завершился без результата"
+    finally:
+        # Стратегия, зависшая при импорте, не должна оставлять процесс после себя
+        if process.is_alive():
+            process.kill()
+        await asyncio.to_thread(process.join)
+    if error:
+        STRATEGY_CHECK_ERRORS.labels(target["name"]).inc()
+        logger.error(f"Проверка стратегии {local_path} не пройдена: {error}")
+        return error
+    compile_seconds, import_seconds, note = result
+    STRATEGY_CHECK_DURATION.labels("compile").observe(compile_seconds)
+    STRATEGY_CHECK_DURATION.labels("import").observe(import_seconds)
+    logger.info(f"Стратегия {class_name} скомпилирована за {compile_seconds:.2f} сек., импортирована за {import_seconds:.2f} сек."
+                + (f" ({note})" if note else ""))
+    return None
+
+# Индекс хранилища версий: сохранённые версии и файлы, закреплённые откатом; загружается при первом обращении
+SNAPSHOT_INDEX = None
+
+# Хранилище изменяется из рабочих потоков нескольких проверок
+SNAPSHOT_LOCK = threading.Lock()
+
+# Путь к сохранённой версии
+def snapshot_path(sha256):
+    """Возвращает путь к версии с заданным SHA-256 в хранилище."""
+    return os.path.join(SNAPSHOT_DIR, f"{sha256}.snapshot")
+
+# Загружаем индекс хранилища версий
+def load_snapshot_index():
+    """Возвращает индекс, при первом обращении читая index.json. Выполняется в рабочем потоке."""
+    global SNAPSHOT_INDEX
+    if SNAPSHOT_INDEX is None:
+        index_path = os.path.join(SNAPSHOT_DIR, "index.json")
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                SNAPSHOT_INDEX = json.load(f)
+        else:
+            SNAPSHOT_INDEX = {"snapshots": [], "pinned": {}}
+    return SNAPSHOT_INDEX
+
+# Сохраняем индекс хранилища версий
+def save_snapshot_index():
+    """Атомарно записывает index.json. Выполняется в рабочем потоке при захваченном SNAPSHOT_LOCK."""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".index.", suffix=".tmp", dir=SNAPSHOT_DIR)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        write_and_sync(f, json.dumps(SNAPSHOT_INDEX, indent=2))
+    replace_and_sync(temp_path, os.path.join(SNAPSHOT_DIR, "index.json"))
+
+# Направляем рабочий файл на сохранённую версию
+def link_live_file(store_path, live_path):
+    """Атомарно заменяет live_path ссылкой на store_path. Выполняется в рабочем потоке."""
+    directory = os.path.dirname(os.path.abspath(live_path))
+    # Ссылка создаётся рядом с рабочим файлом и переносится на него, Freqtrade видит старую или новую версию
+    temp_path = os.path.join(directory, f".{os.path.basename(live_path)}.link")
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    if SNAPSHOT_LINK == "symlink":
+        os.symlink(os.path.relpath(store_path, directory), temp_path)
+    else:
+        try:
+            os.link(store_path, temp_path)
+        # Хранилище на другой файловой системе
+        except OSError:
+            shutil.copy2(store_path, temp_path)
+    os.replace(temp_path, live_path)
+    sync_directory(directory)
+
+# Добавляем рабочий файл в хранилище версий
+def store_snapshot(target, version):
+    """Сохраняет текущий файл цели по его SHA-256, связывает с ним рабочий файл и возвращает SHA-256."""
+    live_path = target["local_path"]
+    if not os.path.exists(live_path):
+        return None
+    sha256 = file_sha256(live_path)
+    store_path = snapshot_path(sha256)
+    with SNAPSHOT_LOCK:
+        index = load_snapshot_index()
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        if not os.path.exists(store_path):
+            temp_path = f"{store_path}.tmp"
+            if os.path.lexists(temp_path):
+                os.remove(temp_path)
+            try:
+                # Жёсткая ссылка, хранение версии не требует копии
+                os.link(os.path.realpath(live_path), temp_path)
+            except OSError:
+                shutil.copy2(live_path, temp_path)
+            os.replace(temp_path, store_path)
+        if not (os.path.samefile(live_path, store_path) and (SNAPSHOT_LINK != "symlink" or os.path.islink(live_path))):
+            link_live_file(store_path, live_path)
+        index["snapshots"] = [entry for entry in index["snapshots"]
+                              if not (entry["target"] == target["name"] and entry["sha256"] == sha256)]
+        index["snapshots"].append({
+            "target": target["name"],
+            "sha256": sha256,
+            "version": version or sha256[:7],
+            "saved_at": time.time(),
+            "size": os.path.getsize(store_path),
+        })
+        evict_snapshots(index, target, sha256)
+        save_snapshot_index()
+    logger.info(f"Версия {version or sha256[:7]} файла {target['name']} сохранена как {sha256[:12]}.")
+    return sha256
+
+# Применяем политику хранения версий
+def evict_snapshots(index, target, live_sha256):
+    """Оставляет SNAPSHOT_KEEP самых новых версий цели, рабочую и закреплённую версии."""
+    pinned = index["pinned"].get(target["name"], {}).get("sha256")
+    entries = sorted((entry for entry in index["snapshots"] if entry["target"] == target["name"]),
+                     key=lambda entry: entry["saved_at"], reverse=True)
+    evicted = [entry for entry in entries[SNAPSHOT_KEEP:] if entry["sha256"] not in (live_sha256, pinned)]
+    index["snapshots"] = [entry for entry in index["snapshots"] if entry not in evicted]
+    # Сохранённый файл удаляется, когда на него не ссылается ни одна цель
+    referenced = {entry["sha256"] for entry in index["snapshots"]}
+    for entry in evicted:
+        if entry["sha256"] not in referenced and os.path.exists(snapshot_path(entry["sha256"])):
+            os.remove(snapshot_path(entry["sha256"]))
+            logger.info(f"Сохранённая версия {entry['version']} файла {entry['target']} удалена.")
+    SNAPSHOT_STORE_BYTES.set(sum({entry["sha256"]: entry["size"] for entry in index["snapshots"]}.values()))
+
+# Сохранённые версии файла
+def list_snapshots(target):
+    """Возвращает сохранённые версии цели, начиная с самой новой, и SHA-256 рабочего файла."""
+    with SNAPSHOT_LOCK:
+        entries = [entry for entry in load_snapshot_index()["snapshots"] if entry["target"] == target["name"]]
+    live_sha256 = file_sha256(target["local_path"])
+    return sorted(entries, key=lambda entry: entry["saved_at"], reverse=True), live_sha256
+
+# Откатываем файл к сохранённой версии
+def rollback_to_snapshot(target, sha256_prefix):
+    """Связывает рабочий файл с сохранённой версией, закрепляет цель на ней и возвращает запись версии."""
+    with SNAPSHOT_LOCK:
+        index = load_snapshot_index()
+        entry = next((entry for entry in index["snapshots"]
+                      if entry["target"] == target["name"] and entry["sha256"].startswith(sha256_prefix)), None)
+        if entry is None or not os.path.exists(snapshot_path(entry["sha256"])):
+            return None
+        link_live_file(snapshot_path(entry["sha256"]), target["local_path"])
+        index["pinned"][target["name"]] = {"sha256": entry["sha256"], "version": entry["version"]}
+        save_snapshot_index()
+    logger.info(f"{target['name']} откатан к версии {entry['version']} ({entry['sha256'][:12]}).")
+    return entry
+
+# Возобновляем автоматические обновления файла после отката
+def unpin_snapshot(target):
+    """Снимает закрепление цели после отката. Возвращает True, если она была закреплена."""
+    with SNAPSHOT_LOCK:
+        index = load_snapshot_index()
+        if index["pinned"].pop(target["name"], None) is None:
+            return False
+        save_snapshot_index()
+    return True
+
+# Сохраняем файлы, найденные при запуске
+async def snapshot_live_files():
+    """Добавляет текущую версию каждого отслеживаемого файла в хранилище, чтобы первое обновление можно было откатить."""
+    for target in TARGETS:
+        try:
+            version = await asyncio.to_thread(extract_version_from_file, target["local_path"]) if target["versioned"] else None
+            await asyncio.to_thread(store_snapshot, target, version)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ошибка при сохранении версии {target['name']}: {e}")
+
+# Скачанные файлы, не прошедшие проверку стратегии, по имени цели: версия, blob SHA и ошибка
+REJECTED_DOWNLOADS = {}
+
+# Запоминаем скачанную стратегию, не прошедшую проверку
+def remember_rejected_download(target, error):
+    """Сохраняет отклонённый файл и возвращает False, если этот же файл уже был отклонён."""
+    rejected = REJECTED_DOWNLOADS.get(target["name"])
+    if rejected and rejected["blob_sha"] == error.blob_sha:
+        return False
+    REJECTED_DOWNLOADS[target["name"]] = {"version": error.version, "blob_sha": error.blob_sha, "error": str(error)}
+    return True
+
 # Функция для скачивания файла и уведомления с перезапуском
-async def check_for_updates():
-    """Проверяет наличие обновлений на удаленном сервере и скачивает файл, если обнаружено обновление."""
-    local_version = extract_version_from_file(LOCAL_FILE_PATH)
-    remote_version = await check_remote_version()
+async def check_for_updates(target=None):
+    """Проверяет наличие обновлений одного отслеживаемого файла и скачивает его, если обнаружено обновление."""
+    target = target or TARGETS[0]
+    # Имя файла добавляется в сообщения, только если отслеживается несколько файлов
+    prefix = f"[{target['name']}] " if len(TARGETS) > 1 else ""
+    local_path = target["local_path"]
 
-    if remote_version == "Неизвестная версия":
-        logger.warning("Удалённая версия неизвестна. Обновление не будет выполнено.")
-        send_telegram_message(TELEGRAM_TOKEN, CHAT_ID, "⚠️ Удалённая версия неизвестна. Проверьте файл вручную.")
-        return
-    if local_version == "Неизвестная версия":
-        logger.warning("Локальная версия неизвестна. Обновление не будет выполнено.")
-        send_telegram_message(TELEGRAM_TOKEN, CHAT_ID, "⚠️ Локальная версия неизвестна. Проверьте файл вручную.")
-        return
+    # После отката файл остаётся на выбранной версии, пока не нажата кнопка скачивания
+    index = await asyncio.to_thread(load_snapshot_index)
+    pinned = index["pinned"].get(target["name"])
+    if pinned:
+        logger.info(f"{prefix}Закреплён на версии {pinned['version']} после отката, проверка обновлений пропущена.")
+        return f"Закреплён на {pinned['version']} после отката"
+
+    local_version = None
+    if target["versioned"]:
+        local_version = await asyncio.to_thread(extract_version_from_file, local_path)
+        if local_version == "Неизвестная версия":
+            logger.warning(f"{prefix}Локальная версия неизвестна. Обновление не будет выполнено.")
+            await send_telegram_message(TELEGRAM_TOKEN, CHAT_ID, f"{prefix}⚠️ Локальная версия неизвестна. Проверьте файл вручную.")
+            return "Локальная версия неизвестна"
+
+    # Версия, не прошедшая проверку стратегии, не скачивается снова
+    rejected = REJECTED_DOWNLOADS.get(target["name"])
+    known_version = rejected["version"] if rejected and target["versioned"] else local_version
+    downloaded = None
+    check_error = None
+    if target["mode"] == "blob":
+        # Сначала сравниваем git blob SHA, файл скачивается, только если они различаются
+        try:
+            remote_sha = await fetch_remote_blob_sha(target["repo"], target["remote_path"])
+        except Exception as e:
+            logger.error(f"{prefix}Ошибка при получении blob SHA, используем проверку по версии: {e}")
+            remote_sha = None
+        if remote_sha and remote_sha == await asyncio.to_thread(git_blob_sha, local_path):
+            if target["versioned"]:
+                VERSION_MEMO[target["url"]] = (time.monotonic(), local_version)  # Удалённый файл совпадает с локальным
+            logger.info(f"{prefix}Обновлений не обнаружено. Blob SHA {remote_sha[:12]} совпадает, локальная версия: {local_version}")
+            return f"Обновлений нет ({local_version or remote_sha[:7]})"
+        if remote_sha and rejected and remote_sha == rejected["blob_sha"]:
+            logger.info(f"{prefix}Blob SHA {remote_sha[:12]} уже не прошёл проверку стратегии, скачивание пропущено.")
+            return f"Проверка не пройдена ({rejected['version']})"
+        if remote_sha:
+            # Содержимое отличается, скачиваем его, даже если строка версии та же
+            logger.info(f"{prefix}Удалённый blob SHA {remote_sha[:12]} отличается от локального файла.")
+            known_version = None
+            try:
+                remote_version, downloaded = await hedged_download(target, remote_sha)
+            except StrategyCheckError as e:
+                check_error = e
+            except Exception as e:
+                logger.error(f"{prefix}Ошибка при скачивании файла, повторяем через {target['url']}: {e}")
+
+    if downloaded is None and check_error is None:
+        # Один запрос возвращает удалённую версию и, если она отличается, сам новый файл
+        try:
+            remote_version, downloaded = await download_file_with_retries(
+                target["url"], local_path, known_version=known_version, versioned=target["versioned"])
+        except StrategyCheckError as e:
+            check_error = e
+        except Exception as e:
+            logger.error(f"{prefix}Ошибка при проверке обновлений: {e}")
+            CHECK_ERRORS.labels(target["name"]).inc()
+            return f"Ошибка: {e}"
 
-    if local_version != remote_version:
-        # Если версии не совпадают, загружаем новый файл
-        await download_file_with_retries(FILE_URL, LOCAL_FILE_PATH)
-        message = f"✅ Обновление обнаружено! Новая версия: {remote_version} успешно загружена.\n\n Перезапускаем Freqtrade..."
-        send_telegram_message(TELEGRAM_TOKEN, CHAT_ID, message)
-        logger.info(f"Обновление загружено. Локальная версия теперь: {remote_version}")
+    if check_error:
+        # Рабочий файл не тронут, Freqtrade продолжает работать на текущей версии
+        logger.warning(f"{prefix}Версия {check_error.version} не прошла проверку стратегии, рабочий файл не заменён.")
+        if remember_rejected_download(target, check_error):
+            await notify_subscribers(f"{prefix}❌ Новая версия {check_error.version} не прошла проверку и не установлена. "
+                                     f"Текущая версия остаётся на месте, Freqtrade не перезапускается: {check_error}")
+        return f"Проверка не пройдена ({check_error.version})"
+
+    if target["versioned"] and remote_version == "Неизвестная версия":
+        logger.warning(f"{prefix}Удалённая версия неизвестна. Обновление не будет выполнено.")
+        await send_telegram_message(TELEGRAM_TOKEN, CHAT_ID, f"{prefix}⚠️ Удалённая версия неизвестна. Проверьте файл вручную.")
+        return "Удалённая версия неизвестна"
+
+    local_sha = await asyncio.to_thread(git_blob_sha, local_path)
+    if not downloaded and rejected and remote_version == rejected["version"]:
+        logger.info(f"{prefix}Удалённая версия {remote_version} уже не прошла проверку стратегии, скачивание пропущено.")
+        return f"Проверка не пройдена ({remote_version})"
+    REJECTED_DOWNLOADS.pop(target["name"], None)  # Удалённый файл изменился после отклонения
+    if not downloaded:
+        logger.info(f"{prefix}Обновлений не обнаружено. Локальная версия: {local_version}")
+        return f"Обновлений нет ({local_version or local_sha[:7]})"
+
+    # Сохраняем новую версию для отката
+    try:
+        await asyncio.to_thread(store_snapshot, target, remote_version if target["versioned"] else None)
+    except OSError as e:
+        logger.error(f"{prefix}Ошибка при сохранении скачанной версии: {e}")
 
-        # После загрузки файла, перезапускаем Freqtrade
+    restart_note = "\n\n Перезапускаем Freqtrade..." if target["reload"] else ""
+    if not target["versioned"]:
+        remote_version = local_sha[:7]
+        message = f"{prefix}✅ Файл изменился на GitHub и был загружен (blob {remote_version}).{restart_note}"
+    elif remote_version == local_version:
+        message = f"{prefix}✅ Файл стратегии изменился на GitHub без смены версии ({remote_version}) и был загружен.{restart_note}"
+    else:
+        message = f"{prefix}✅ Обновление обнаружено! Новая версия: {remote_version} успешно загружена.{restart_note}"
+    UPDATES_TOTAL.labels(target["name"]).inc()
+    await notify_subscribers(message)
+    logger.info(f"{prefix}Обновление загружено. Локальная версия теперь: {remote_version}")
+
+    # После загрузки файла, перезапускаем Freqtrade
+    if target["reload"]:
         await reload_freqtrade(None, None)  # Здесь передаются пустые значения, если не требуется конкретное обновление через Telegram
+    return f"Загружено {remote_version}"
+
+# Последняя проверка каждого отслеживаемого файла по имени: last_check, duration, result, interval, next_check
+TARGET_STATUS = {}
+
+# События, которые будят проверку отслеживаемого файла, по имени
+TARGET_WAKEUP = {}
+
+# Интервал опроса отслеживаемого файла
+def polling_interval(target):
+    """Возвращает, сколько ждать между проверками файла."""
+    # С вебхуком GitHub проверки запускаются пушами, опрос только подстраховывает
+    if GITHUB_WEBHOOK_SECRET:
+        return max(target["interval"], WEBHOOK_FALLBACK_INTERVAL)
+    return target["interval"]
+
+# Интервал проверки по активности коммитов
+def adaptive_interval(target):
+    """Возвращает интервал проверки по времени, прошедшему с последнего коммита в репозиторий."""
+    cache = get_commit_cache(target["repo"])
+    if not cache["by_date"]:
+        interval = target["interval"]
     else:
-        logger.info(f"Обновлений не обнаружено. Локальная версия: {local_version}")
+        newest = cache["by_date"][max(cache["by_date"])][0].date
+        quiet = (datetime.now(pytz.utc) - newest).total_seconds()
+        # Релиз обычно идёт серией исправлений, интервал растёт с периодом затишья
+        interval = POLL_MIN_INTERVAL if quiet < POLL_ACTIVE_WINDOW else quiet * POLL_BACKOFF_FACTOR
+    # Разброс не даёт проверять несколько файлов в один момент
+    interval *= random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+    return int(min(max(interval, POLL_MIN_INTERVAL), POLL_MAX_INTERVAL))
 
-# Асинхронная задача для периодической проверки
-async def periodic_update_check():
-    """Периодически проверяет наличие обновлений."""
+# Когда кэш коммитов репозитория последний раз обновлялся для интервала проверки, по репозиторию
+COMMIT_REFRESHED = {}
+
+# Обновления кэша коммитов в процессе по репозиторию, файлы одного репозитория ждут одну и ту же задачу
+COMMIT_REFRESH_INFLIGHT = {}
+
+# Время между двумя обновлениями кэша коммитов одного репозитория
+def commit_refresh_spacing():
+    """Возвращает, сколько секунд обновлённый кэш коммитов используется для интервала проверки."""
+    spacing = POLL_MIN_INTERVAL
+    remaining, reset = GITHUB_BUDGET["remaining"], GITHUB_BUDGET["reset"]
+    if remaining is not None:
+        window = max(reset - time.time(), 0)
+        repos = len({target["repo"] for target in TARGETS if target["adaptive"]})
+        # Ответ 304 тоже расходует лимит, обновления могут использовать половину запросов сверх резерва
+        usable = (remaining - GITHUB_INTERACTIVE_RESERVE) / 2
+        spacing = max(spacing, window * repos / usable if usable >= 1 else window)
+    return spacing
+
+# Обновляем кэш коммитов для интервала проверки
+async def refresh_commits_for_interval(repo_url):
+    """Обновляет кэш коммитов репозитория не чаще одного раза за commit_refresh_spacing()."""
+    # Файлы одного репозитория ждут одно и то же обновление
+    task = COMMIT_REFRESH_INFLIGHT.get(repo_url)
+    if task is None:
+        if time.monotonic() - COMMIT_REFRESHED.get(repo_url, float("-inf")) < commit_refresh_spacing():
+            return
+        COMMIT_REFRESHED[repo_url] = time.monotonic()
+        task = asyncio.ensure_future(refresh_commit_cache(repo_url))
+        COMMIT_REFRESH_INFLIGHT[repo_url] = task
+        task.add_done_callback(lambda _: COMMIT_REFRESH_INFLIGHT.pop(repo_url, None))
+    await asyncio.shield(task)
+
+# Выбираем интервал до следующей проверки
+async def next_poll_interval(target):
+    """Возвращает, сколько ждать до следующей проверки файла."""
+    if GITHUB_WEBHOOK_SECRET or not target["adaptive"]:
+        return polling_interval(target)
+    try:
+        await refresh_commits_for_interval(target["repo"])
+    except Exception as e:
+        logger.warning(f"Ошибка при получении коммитов для интервала проверки, используем сохранённые: {e}")
+    return adaptive_interval(target)
+
+# Проверяем один отслеживаемый файл в цикле
+async def monitor_target(target, semaphore):
+    """Проверяет отслеживаемый файл со своим интервалом."""
     timezone = pytz.timezone(TIMEZONE)  # Используем часовой пояс из .env
+    prefix = f"[{target['name']}] " if len(TARGETS) > 1 else ""
+    # После перезапуска сохраняется проверка, запланированная до него
+    restored = TARGET_STATUS.get(target["name"])
+    if restored and restored["next_check"] > datetime.now(timezone):
+        logger.info(f"{prefix}Восстановлено из базы состояния, следующая проверка обновлений в: {restored['next_check'].strftime('%d-%m-%Y %H:%M:%S')}")
+        await wait_for_next_check(target, (restored["next_check"] - datetime.now(timezone)).total_seconds())
     while True:
-        await check_for_updates()  # Проверяем обновления
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                result = await check_for_updates(target)  # Проверяем обновления
+            except Exception as e:
+                logger.error(f"{prefix}Непредвиденная ошибка при проверке обновлений: {e}")
+                CHECK_ERRORS.labels(target["name"]).inc()
+                result = f"Ошибка: {e}"
+            duration = time.monotonic() - started
+        CHECK_DURATION.labels(target["name"]).observe(duration)
+        CHECKS_TOTAL.labels(target["name"]).inc()
+
         # Обновляем время следующей проверки с учетом часового пояса
-        next_check_time = datetime.now(timezone) + timedelta(seconds=CHECK_INTERVAL)
-        next_check_time_str = next_check_time.strftime('%d-%m-%Y %H:%M:%S')
-        
+        interval = await next_poll_interval(target)
+        now = datetime.now(timezone)
+        next_check_time = now + timedelta(seconds=interval)
+        TARGET_STATUS[target["name"]] = {
+            "last_check": now,
+            "duration": duration,
+            "result": result,
+            "interval": interval,
+            "next_check": next_check_time,
+        }
+        LAST_CHECK_TIME.labels(target["name"]).set(now.timestamp())
+        NEXT_CHECK_TIME.labels(target["name"]).set(next_check_time.timestamp())
+
         # Выводим время следующей проверки в терминал (Docker)
-        logger.info(f"Следующая проверка обновлений в: {next_check_time_str}")
-        
-        await asyncio.sleep(CHECK_INTERVAL)  # Ждем заданный интервал времени
+        logger.info(f"{prefix}Проверка заняла {duration:.2f} сек. Следующая проверка обновлений через {format_time_interval(interval)} в: {next_check_time.strftime('%d-%m-%Y %H:%M:%S')}")
+        await save_state(target["name"], TARGET_STATUS[target["name"]])
+        await wait_for_next_check(target, interval)
+
+# Ждём следующую проверку отслеживаемого файла
+async def wait_for_next_check(target, interval):
+    """Ждёт заданный интервал или пока push в GitHub не разбудит проверку."""
+    prefix = f"[{target['name']}] " if len(TARGETS) > 1 else ""
+    wakeup = TARGET_WAKEUP.setdefault(target["name"], asyncio.Event())
+    try:
+        await asyncio.wait_for(wakeup.wait(), interval)
+        logger.info(f"{prefix}Проверка обновлений запущена push-событием GitHub.")
+    except asyncio.TimeoutError:
+        pass
+    wakeup.clear()  # Push-события, полученные во время ожидания, покрываются следующей проверкой
+
+# Асинхронная задача для периодической проверки
+async def periodic_update_check():
+    """Периодически и одновременно проверяет наличие обновлений всех отслеживаемых файлов."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHECKS)
+    await asyncio.gather(log_periodic_stats(), *(monitor_target(target, semaphore) for target in TARGETS))
+
+# Измеряем задержку цикла событий
+async def measure_event_loop_lag():
+    """Засыпает на LOOP_LAG_INTERVAL и учитывает, насколько позже цикл проснулся."""
+    loop = asyncio.get_running_loop()
+    LOOP_HEARTBEAT.update(loop=loop, thread=threading.get_ident(), time=time.monotonic())
+    threading.Thread(target=loop_watchdog, name="loop-watchdog", daemon=True).start()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        LOOP_HEARTBEAT["time"] = time.monotonic()
+        LOOP_LAG.observe(max(0.0, loop.time() - started - LOOP_LAG_INTERVAL))
+
+# Последний сигнал цикла событий, записывается measure_event_loop_lag
+LOOP_HEARTBEAT = {"loop": None, "thread": None, "time": None}
+
+# Сообщаем, что блокирует цикл событий
+def loop_watchdog():
+    """Следит за сигналом цикла событий из отдельного потока."""
+    reported = None
+    while True:
+        time.sleep(LOOP_STALL_THRESHOLD / 2)
+        beat = LOOP_HEARTBEAT["time"]
+        stalled = time.monotonic() - beat - LOOP_LAG_INTERVAL
+        if stalled < LOOP_STALL_THRESHOLD or beat == reported:
+            continue
+        reported = beat  # Каждая блокировка логируется один раз
+        LOOP_STALLS.inc()
+        # Стек берётся, пока цикл ещё заблокирован, поэтому он показывает блокирующий код
+        frame = sys._current_frames().get(LOOP_HEARTBEAT["thread"])
+        task = asyncio.current_task(LOOP_HEARTBEAT["loop"])
+        stack = "".join(traceback.format_stack(frame)[-8:]) if frame else ""
+        logger.warning(f"Цикл событий заблокирован на {stalled:.2f} сек. в задаче "
+                       f"{task.get_coro().__qualname__ if task else None}:\n{stack}")
+
+# Периодическая статистика в логах
+async def log_periodic_stats():
+    """Выводит в лог статистику пула соединений и очереди уведомлений с наименьшим интервалом проверки."""
+    interval = min(polling_interval(target) for target in TARGETS)
+    while True:
+        await asyncio.sleep(interval)
+        logger.info(format_http_stats())
+        logger.info(format_notifier_stats())
+
+# Встроенный веб-сервер для webhook'ов GitHub
+WEB_RUNNER = None
+GITHUB_PUSH_COMMIT_LIMIT = 20  # GitHub перечисляет не больше 20 коммитов в push-событии
+
+# Проверяем подпись webhook'а GitHub
+def verify_github_signature(body, signature):
+    """Сверяет заголовок X-Hub-Signature-256 с HMAC тела запроса."""
+    if not GITHUB_WEBHOOK_SECRET or not signature:
+        return False
+    expected = "sha256=" + hmac.new(GITHUB_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    # Сравниваются байты: compare_digest не принимает str с символами не из ASCII
+    return hmac.compare_digest(expected.encode(), signature.encode(errors="surrogateescape"))
+
+# Отслеживаемые файлы, затронутые push-событием
+def targets_touched_by_push(payload):
+    """Возвращает отслеживаемые файлы репозитория, которые были добавлены, изменены или удалены в main."""
+    repo = ((payload.get("repository") or {}).get("full_name") or "").lower()
+    if payload.get("ref") != "refs/heads/main":
+        return []
+    commits = payload.get("commits") or []
+    paths = set()
+    for commit in commits:
+        for key in ("added", "modified", "removed"):
+            paths.update(commit.get(key) or [])
+    # Список коммитов большого push'а обрезается, поэтому проверяются все файлы репозитория
+    truncated = len(commits) >= GITHUB_PUSH_COMMIT_LIMIT
+    return [target for target in TARGETS
+            if target["repo"].lower() == repo and (truncated or target["remote_path"] in paths)]
+
+# Обработчик push-событий GitHub
+async def github_webhook(request):
+    """Проверяет webhook GitHub и будит проверки файлов, затронутых push'ем."""
+    body = await request.read()
+    if not verify_github_signature(body, request.headers.get("X-Hub-Signature-256")):
+        logger.warning(f"Webhook GitHub от {request.remote} отклонён: неверная подпись.")
+        return web.json_response({"error": "invalid signature"}, status=401)
+
+    event = request.headers.get("X-GitHub-Event")
+    if event != "push":
+        logger.info(f"Webhook GitHub '{event}' получен и пропущен.")
+        return web.json_response({"event": event, "triggered": []})
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return web.json_response({"error": "invalid payload"}, status=400)
+    try:
+        triggered = targets_touched_by_push(payload)
+    except (AttributeError, TypeError):
+        return web.json_response({"error": "invalid payload"}, status=400)  # Поля неверного типа
+    for target in triggered:
+        TARGET_WAKEUP.setdefault(target["name"], asyncio.Event()).set()
+    names = [target["name"] for target in triggered]
+    logger.info(f"Push {str(payload.get('after') or '')[:7]} в {payload.get('ref')}, запущены проверки: {names or 'нет'}")
+    return web.json_response({"event": event, "triggered": names}, status=202 if names else 200)
+
+# Обработчик обновлений webhook'а Telegram
+async def telegram_webhook(request):
+    """Проверяет секретный токен обновления Telegram и ставит его в очередь обновлений бота."""
+    # Сравниваются байты: compare_digest не принимает str с символами не из ASCII
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode(errors="surrogateescape")
+    if not hmac.compare_digest(token, TELEGRAM_WEBHOOK_SECRET.encode()):
+        logger.warning(f"Webhook Telegram от {request.remote} отклонён: неверный секретный токен.")
+        return web.json_response({"error": "invalid secret token"}, status=401)
+    application = request.app["application"]
+    try:
+        data = await request.json()
+        update = Update.de_json(data, application.bot) if isinstance(data, dict) else None
+    except (ValueError, TypeError, KeyError, AttributeError):
+        update = None
+    if update is None:
+        return web.json_response({"error": "invalid update"}, status=400)
+    await application.update_queue.put(update)
+    return web.Response()
+
+# Обработчик запроса метрик Prometheus
+async def prometheus_metrics(request):
+    """Возвращает все метрики в текстовом формате Prometheus."""
+    return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+# Веб-приложение со всеми маршрутами
+def create_web_app(application):
+    """Создаёт приложение aiohttp, обслуживаемое на WEBHOOK_PORT."""
+    app = web.Application()
+    app["application"] = application
+    app.router.add_post("/github", github_webhook)
+    app.router.add_post("/telegram", telegram_webhook)
+    app.router.add_get("/metrics", prometheus_metrics)
+    return app
+
+# Запускаем встроенный веб-сервер
+async def start_web_server(application):
+    """Запускает веб-сервер в цикле событий бота."""
+    global WEB_RUNNER
+    if not WEBHOOK_PORT:
+        return
+    WEB_RUNNER = web.AppRunner(create_web_app(application), access_log=None)
+    await WEB_RUNNER.setup()
+    await web.TCPSite(WEB_RUNNER, "0.0.0.0", WEBHOOK_PORT).start()
+    if not GITHUB_WEBHOOK_SECRET:
+        logger.warning("GITHUB_WEBHOOK_SECRET не задан, webhook'и GitHub будут отклоняться.")
+    logger.info(f"Веб-сервер слушает порт {WEBHOOK_PORT}.")
+
+# Останавливаем встроенный веб-сервер
+async def stop_web_server():
+    """Останавливает веб-сервер и закрывает его соединения."""
+    global WEB_RUNNER
+    if WEB_RUNNER is not None:
+        await WEB_RUNNER.cleanup()
+        WEB_RUNNER = None
+
+# Состояние всех отслеживаемых файлов
+def format_target_status():
+    """Возвращает список отслеживаемых файлов с результатом последней проверки."""
+    lines = ["📋 Отслеживаемые файлы:", format_github_budget()]
+    for target in TARGETS:
+        status = TARGET_STATUS.get(target["name"])
+        interval = status["interval"] if status else polling_interval(target)
+        lines.append(f"\n📄 {target['name']} ({target['repo']}/{target['remote_path']})")
+        lines.append(f"🕒 Интервал: {format_time_interval(interval)}{' (адаптивный)' if target['adaptive'] and not GITHUB_WEBHOOK_SECRET else ''}")
+        if status is None:
+            lines.append("⏳ Ещё не проверялся")
+            continue
+        lines.append(f"🔎 Последняя проверка: {status['last_check'].strftime('%d-%m-%Y %H:%M:%S')} ({status['duration']:.2f} сек.)")
+        lines.append(f"📌 Результат: {status['result']}")
+        lines.append(f"⏭️ Следующая проверка: {status['next_check'].strftime('%d-%m-%Y %H:%M:%S')}")
+    return "\n".join(lines)
+
+# Обработчик команды /status и кнопки "📋 Отслеживаемые файлы"
+async def show_status(update: Update, context: CallbackContext):
+    """Показывает состояние всех отслеживаемых файлов."""
+    await log_telegram_message(update)
+    message = format_target_status()
+    if update.callback_query:
+        await update.callback_query.message.reply_text(message)
+    elif update.message:
+        await update.message.reply_text(message)
 
 # Функция обработчика проверки версии
 async def check_version(update: Update, context: CallbackContext):
@@ -191,7 +1744,7 @@ async def check_version(update: Update, context: CallbackContext):
     logger.info("Обработка кнопки 'Проверить версию'.")
 
     # Получаем версию локального файла
-    local_version = extract_version_from_file(LOCAL_FILE_PATH)
+    local_version = await asyncio.to_thread(extract_version_from_file, TARGETS[0]["local_path"])
     logger.info(f"Локальная версия: {local_version}")
 
     # Получаем версию удалённого файла
@@ -229,58 +1782,203 @@ async def check_commits(update: Update, context: CallbackContext):
         logger.info(f"Отправка сообщения: {commits_message}")
         await update.callback_query.message.reply_text(commits_message)
 
-async def get_commits_from_github(repo_url):
-    """Получает коммиты из репозитория на GitHub, сделанные за последнюю дату, когда они были выложены."""
+# Компактная запись о коммите, дата разбирается один раз при первом появлении коммита
+CommitRecord = namedtuple("CommitRecord", ["sha", "date", "message"])
+
+# Кэш коммитов для каждого репозитория: известные SHA, коммиты по датам и ETag последнего запроса
+COMMIT_CACHE = {}
+COMMIT_CACHE_DAYS = 30  # Сколько дней коммитов хранить в памяти
+
+# Получаем кэш коммитов репозитория
+def get_commit_cache(repo_url):
+    """Возвращает кэш коммитов репозитория, создавая пустой при первом обращении."""
+    return COMMIT_CACHE.setdefault(repo_url, {"shas": set(), "by_date": {}, "url": None, "etag": None})
+
+# Запрашиваем только коммиты, которых ещё нет в кэше
+async def refresh_commit_cache(repo_url, interactive=False):
+    """Запрашивает коммиты новее самого нового из кэша, добавляет их в кэш и возвращает их число."""
+    cache = get_commit_cache(repo_url)
 
     # Формируем URL для запроса к API GitHub
     api_url = f"https://api.github.com/repos/{repo_url}/commits?per_page=100"  # Получаем 100 коммитов для анализа
+    if cache["by_date"]:
+        newest = cache["by_date"][max(cache["by_date"])][0].date
+        api_url += f"&since={newest.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+    headers = {}
+    if cache["url"] == api_url and cache["etag"]:
+        headers["If-None-Match"] = cache["etag"]
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            # Отправляем запрос на GitHub API
-            async with session.get(api_url) as response:
-                response.raise_for_status()  # Проверка на успешный статус ответа
+    # Отправляем запрос на GitHub API
+    async with github_api_get(api_url, headers, interactive=interactive) as response:
+        if response.status == 304:
+            return 0
+        response.raise_for_status()  # Проверка на успешный статус ответа
+        commits = await response.json()  # Парсим JSON ответ
+        etag = response.headers.get("ETag")
 
-                commits = await response.json()  # Парсим JSON ответ
+    records = [
+        CommitRecord(commit["sha"], datetime.fromisoformat(commit['commit']['author']['date'].replace('Z', '+00:00')), commit['commit']['message'])
+        for commit in commits
+    ]
+    cache["url"], cache["etag"] = api_url, etag
+    return add_commits_to_cache(repo_url, records)
+
+# Добавляем коммиты в кэш
+def add_commits_to_cache(repo_url, records):
+    """Добавляет коммиты, которых ещё нет в кэше, и возвращает их количество."""
+    cache = get_commit_cache(repo_url)
+    added = 0
+    added_dates = set()
+    for record in records:
+        if record.sha in cache["shas"]:
+            continue  # "since" включает границу, самый новый коммит из кэша приходит снова
+        cache["shas"].add(record.sha)
+        cache["by_date"].setdefault(record.date.date(), []).append(record)
+        added_dates.add(record.date.date())
+        added += 1
 
-                if not commits:
-                    return ["Нет коммитов в репозитории."]
+    # Держим коммиты каждого дня отсортированными по дате в порядке убывания
+    for day in added_dates:
+        cache["by_date"][day].sort(key=lambda record: record.date, reverse=True)
 
-                # Сортируем коммиты по дате в порядке убывания
-                commits.sort(key=lambda x: x['commit']['author']['date'], reverse=True)
+    # Забываем самые старые дни
+    for day in sorted(cache["by_date"])[:-COMMIT_CACHE_DAYS]:
+        for record in cache["by_date"].pop(day):
+            cache["shas"].discard(record.sha)
+    return added
 
-                # Получаем дату последнего коммита
-                last_commit_date = datetime.fromisoformat(commits[0]['commit']['author']['date'].replace('Z', '+00:00')).date()
+# Статус файла и его репозитория для всех обработчиков: (монотонное время, статус) по (репозиторий, путь)
+GITHUB_STATUS_CACHE = {}
 
-                # Извлекаем только те коммиты, которые были сделаны в последний день
-                filtered_commits = [
-                    commit for commit in commits
-                    if datetime.fromisoformat(commit['commit']['author']['date'].replace('Z', '+00:00')).date() == last_commit_date
-                ]
+# Выполняемые запросы статуса GraphQL, одновременные вызовы ждут одну и ту же задачу
+GITHUB_STATUS_INFLIGHT = {}
 
-                # Формируем список коммитов с нужной информацией
-                tz = pytz.timezone(TIMEZONE)
-                commit_list = [
-                    f"{commit['sha'][:7]} {commit['commit']['message']} at {datetime.fromisoformat(commit['commit']['author']['date'].replace('Z', '+00:00')).astimezone(tz).strftime('%H:%M:%S')}"
-                    for commit in filtered_commits
-                ]
+# Версии blob, полученных в статусе GraphQL, по SHA blob; blob никогда не меняется
+BLOB_VERSIONS = {}
 
-                if not commit_list:
-                    return [f"Нет коммитов на {last_commit_date}."]
+# Последние коммиты основной ветки и blob файла одним запросом
+GRAPHQL_STATUS_QUERY = """
+query($owner: String!, $name: String!, $expression: String!, $count: Int!) {
+  repository(owner: $owner, name: $name) {
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          history(first: $count) {
+            nodes { oid messageHeadline authoredDate }
+          }
+        }
+      }
+    }
+    object(expression: $expression) {
+      ... on Blob { oid byteSize }
+    }
+  }
+}
+"""
 
-                # Заголовок с эмодзи, датой и количеством коммитов
-                header = f"📜 Последние коммиты от {last_commit_date} ({len(filtered_commits)} коммитов)"
+# Версия blob
+async def fetch_blob_version(repo_url, blob_sha, interactive=False):
+    """Читает blob потоком в исходном виде только до строки версии."""
+    # Blob адресуется по SHA, версия совпадает со статусом GraphQL, даже если raw-файл ещё прежний
+    api_url = f"https://api.github.com/repos/{repo_url}/git/blobs/{blob_sha}"
+    async with github_api_get(api_url, {"Accept": "application/vnd.github.raw"}, interactive) as response:
+        response.raise_for_status()
+        _, version = await read_until_version(response)
+    return version or "Неизвестная версия"
+
+# Запрашиваем статус файла через GitHub GraphQL
+async def query_github_status(repo_url, file_path, interactive=False):
+    """Получает последние коммиты и SHA blob файла одним запросом."""
+    owner, name = repo_url.split("/", 1)
+    variables = {"owner": owner, "name": name, "expression": f"HEAD:{file_path}", "count": GRAPHQL_COMMIT_COUNT}
+    headers = {"Authorization": f"Bearer {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
+    async with get_http_session().post(GRAPHQL_URL, json={"query": GRAPHQL_STATUS_QUERY, "variables": variables}, headers=headers) as response:
+        response.raise_for_status()
+        result = await response.json()
+    if result.get("errors"):
+        raise RuntimeError(result["errors"][0].get("message", "GraphQL error"))
+    repository = result["data"]["repository"]
+    blob = repository["object"] or {}
+    # Запрашивается только SHA blob, его начало читается, когда появляется новый blob
+    if blob.get("oid") and blob["oid"] not in BLOB_VERSIONS:
+        BLOB_VERSIONS[blob["oid"]] = await fetch_blob_version(repo_url, blob["oid"], interactive)
+    records = [
+        CommitRecord(node["oid"], datetime.fromisoformat(node["authoredDate"].replace('Z', '+00:00')), node["messageHeadline"])
+        for node in repository["defaultBranchRef"]["target"]["history"]["nodes"]
+    ]
+    # Списку последних коммитов не нужен отдельный запрос
+    add_commits_to_cache(repo_url, records)
+    status = {"version": BLOB_VERSIONS.get(blob.get("oid"), "Неизвестная версия"), "blob_sha": blob.get("oid"), "commits": records}
+    GITHUB_STATUS_CACHE[(repo_url, file_path)] = (time.monotonic(), status)
+    logger.info(f"Статус GraphQL {repo_url}/{file_path}: версия {status['version']}, blob {(status['blob_sha'] or '-')[:7]}, коммитов: {len(records)}")
+    return status
 
-                # Возвращаем заголовок и список коммитов
-                return [header] + commit_list
+# Общий статус файла
+async def get_github_status(repo_url, file_path, interactive=False):
+    """Возвращает статус файла из GraphQL или None, если его не удалось получить."""
+    key = (repo_url, file_path)
+    cached = GITHUB_STATUS_CACHE.get(key)
+    if cached and time.monotonic() - cached[0] < VERSION_CACHE_TTL:
+        VERSION_LOOKUPS.labels("memo").inc()
+        return cached[1]
+    task = GITHUB_STATUS_INFLIGHT.get(key)
+    if task is None:
+        VERSION_LOOKUPS.labels("request").inc()
+        task = asyncio.ensure_future(query_github_status(repo_url, file_path, interactive))
+        GITHUB_STATUS_INFLIGHT[key] = task
+        task.add_done_callback(lambda _: GITHUB_STATUS_INFLIGHT.pop(key, None))
+    else:
+        VERSION_LOOKUPS.labels("shared").inc()
+    try:
+        return await asyncio.shield(task)
+    except Exception as e:
+        logger.warning(f"Запрос статуса GraphQL не удался, используется REST API: {e}")
+        return None
 
-        except aiohttp.ClientError as e:
-            logger.error(f"Ошибка при запросе к GitHub API: {e}")
+async def get_commits_from_github(repo_url, interactive=True):
+    """Получает коммиты из репозитория на GitHub, сделанные за последнюю дату, когда они были выложены."""
+    try:
+        # В режиме GraphQL коммиты приходят вместе со статусом, который /start скорее всего уже запросил
+        file_path = next((target["remote_path"] for target in TARGETS if target["repo"] == repo_url), REMOTE_FILE_PATH)
+        if GITHUB_API_MODE == "graphql" and await get_github_status(repo_url, file_path, interactive):
+            logger.info("Коммиты взяты из статуса GraphQL.")
+        else:
+            added = await refresh_commit_cache(repo_url, interactive=interactive)
+            logger.info(f"Получено новых коммитов с GitHub: {added}")
+    except GitHubRateLimitError as e:
+        logger.warning(f"Коммиты берутся из кэша: {e}")
+        if not get_commit_cache(repo_url)["by_date"]:
+            return [f"⏳ Коммиты недоступны: {e}. Попробуйте позже."]
+    except aiohttp.ClientError as e:
+        logger.error(f"Ошибка при запросе к GitHub API: {e}")
+        if not get_commit_cache(repo_url)["by_date"]:
             return ["Ошибка при получении коммитов."]
-        except Exception as e:
-            logger.error(f"Неизвестная ошибка: {e}")
+    except Exception as e:
+        logger.error(f"Неизвестная ошибка: {e}")
+        if not get_commit_cache(repo_url)["by_date"]:
             return ["Не удалось получить данные о коммитах."]
 
+    cache = get_commit_cache(repo_url)
+    if not cache["by_date"]:
+        return ["Нет коммитов в репозитории."]
+
+    # Коммиты, сделанные в последний день
+    last_commit_date = max(cache["by_date"])
+    latest_commits = cache["by_date"][last_commit_date]
+
+    # Формируем список коммитов с нужной информацией
+    tz = pytz.timezone(TIMEZONE)
+    commit_list = [
+        f"{record.sha[:7]} {record.message} at {record.date.astimezone(tz).strftime('%H:%M:%S')}"
+        for record in latest_commits
+    ]
+
+    # Заголовок с эмодзи, датой и количеством коммитов
+    header = f"📜 Последние коммиты от {last_commit_date} ({len(latest_commits)} коммитов)"
+
+    # Возвращаем заголовок и список коммитов
+    return [header] + commit_list
+
 
 # Асинхронная загрузка файла с сервера
 async def download_file(update: Update, context: CallbackContext):
@@ -288,31 +1986,79 @@ async def download_file(update: Update, context: CallbackContext):
     logger.info("Обработка кнопки 'Скачать обновление'.")
     try:
         # Получаем версию локального файла
-        local_version = extract_version_from_file(LOCAL_FILE_PATH)
+        local_version = await asyncio.to_thread(extract_version_from_file, TARGETS[0]["local_path"])
+
+        # Ручная загрузка снимает закрепление после отката
+        if await asyncio.to_thread(unpin_snapshot, TARGETS[0]):
+            logger.info("Автоматические обновления возобновлены после отката.")
         
-        # Получаем версию файла с сервера
-        await download_file_with_retries(FILE_URL, LOCAL_FILE_PATH, retries=1, delay=0) 
-        server_version = extract_version_from_file(LOCAL_FILE_PATH)
+        # Получаем версию файла с сервера и, если она отличается, скачиваем его в том же запросе
+        server_version, downloaded = await download_file_with_retries(TARGETS[0]["url"], TARGETS[0]["local_path"], retries=1, delay=0, known_version=local_version)
         
-        if local_version == server_version:
+        if downloaded:
+            REJECTED_DOWNLOADS.pop(TARGETS[0]["name"], None)
+            await asyncio.to_thread(store_snapshot, TARGETS[0], server_version)
+            message = f"✅  Новая версия ({server_version}) успешно загружена!"
+            logger.info("Новая версия успешно загружена.")
+        elif local_version == server_version:
             # Если версии совпадают, уведомляем, что обновление не требуется
             message = f"Версия локального файла ({local_version}) актуальна. Обновление не требуется.✅"
-            if update.callback_query:  # Проверяем, существует ли callback_query
-                await update.callback_query.message.reply_text(message)
             logger.info("Обновление не требуется. Версия актуальна.")
         else:
-            # Если версии разные, загружаем новую версию
-            await download_file_with_retries(FILE_URL, LOCAL_FILE_PATH)
-            message = f"✅  Новая версия ({server_version}) успешно загружена!"
-            if update.callback_query:  # Проверяем, существует ли callback_query
-                await update.callback_query.message.reply_text(message)
-            logger.info("Новая версия успешно загружена.")
+            message = "⚠️ Удалённая версия неизвестна. Проверьте файл вручную."
+            logger.warning("Удалённая версия неизвестна. Обновление не будет выполнено.")
+        if update.callback_query:  # Проверяем, существует ли callback_query
+            await update.callback_query.message.reply_text(message)
     
+    except StrategyCheckError as e:
+        # Скачанный файл не заменил рабочий
+        remember_rejected_download(TARGETS[0], e)
+        logger.error(f"Версия {e.version} не прошла проверку стратегии: {e}")
+        if update.callback_query:
+            await update.callback_query.message.reply_text(f"❌  Новая версия ({e.version}) не прошла проверку, текущий файл остаётся на месте: {e}")
     except Exception as e:
         logger.error(f"Ошибка при скачивании файла: {e}")
         if update.callback_query:  # Проверяем, существует ли callback_query
             await update.callback_query.message.reply_text(f"❌  Не удалось загрузить файл: {e}")
 
+# Обработчик кнопки "⏪ Откат"
+async def show_snapshots(update: Update, context: CallbackContext):
+    """Показывает сохранённые версии стратегии кнопками."""
+    logger.info("Обработка кнопки 'Откат'.")
+    entries, live_sha256 = await asyncio.to_thread(list_snapshots, TARGETS[0])
+    if not entries:
+        message, reply_markup = "Сохранённых версий пока нет.", None
+    else:
+        tz = pytz.timezone(TIMEZONE)
+        message = f"⏪ Сохранённые версии {TARGETS[0]['name']} ({len(entries)}). Выберите версию для отката:"
+        reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(
+                f"{'✅ ' if entry['sha256'] == live_sha256 else ''}{entry['version']} · "
+                f"{datetime.fromtimestamp(entry['saved_at'], tz).strftime('%d-%m-%Y %H:%M')}",
+                callback_data=f"rollback:{entry['sha256'][:16]}")]
+            for entry in entries
+        ])
+    if update.callback_query:
+        await update.callback_query.message.reply_text(message, reply_markup=reply_markup)
+
+# Обработчик кнопок версий в списке отката
+async def rollback_snapshot(update: Update, context: CallbackContext):
+    """Откатывает стратегию к выбранной сохранённой версии и перезапускает Freqtrade."""
+    sha256_prefix = update.callback_query.data.split(":", 1)[1]
+    logger.info(f"Обработка отката к {sha256_prefix}.")
+    entry = await asyncio.to_thread(rollback_to_snapshot, TARGETS[0], sha256_prefix)
+    if entry is None:
+        await update.callback_query.message.reply_text("❌ Эта версия больше не хранится.")
+        return
+    message = (f"⏪ {TARGETS[0]['name']} откатан к версии {entry['version']} без скачивания.\n"
+               "📌 Автоматические обновления этого файла приостановлены, кнопка 📥 Скачать обновление возобновит их.")
+    check_error = await check_strategy(TARGETS[0])
+    if check_error:
+        message += f"\n\n❌ Файл не прошёл проверку, Freqtrade не перезапускается: {check_error}"
+    await update.callback_query.message.reply_text(message)
+    if not check_error:
+        await reload_freqtrade(update, context)
+
 # Функция для преобразования времени в удобный формат
 def format_time_interval(seconds):
     """Преобразует интервал времени в формат 'часы:минуты:секунды'."""
@@ -333,18 +2079,28 @@ async def start(update: Update, context: CallbackContext):
     logger.info("Бот получил команду /start")
 
     # Получаем версию локального файла
-    local_version = extract_version_from_file(LOCAL_FILE_PATH)
+    local_version = await asyncio.to_thread(extract_version_from_file, TARGETS[0]["local_path"])
     
     # Логируем версию локального файла
     logger.info(f"Локальная версия: {local_version}")
     
-    # Получаем версию файла с сервера
-    try:
-        server_file_content = await fetch_file_content(REPO_URL, REMOTE_FILE_PATH)
-        server_version = extract_version_from_content(server_file_content)
-    except Exception as e:
-        logger.error(f"Ошибка при скачивании файла для получения версии: {e}")
-        server_version = "Не удалось получить версию с сервера"
+    # Последняя известная версия отвечает сразу, даже сохранённая до перезапуска; более старая обновляется в фоне
+    memo = VERSION_MEMO.get(TARGETS[0]["url"])
+    server_note = ""
+    if memo and time.monotonic() - memo[0] >= VERSION_CACHE_TTL:
+        server_version = memo[1]
+        checked_at = datetime.now(pytz.timezone(TIMEZONE)) - timedelta(seconds=time.monotonic() - memo[0])
+        server_note = f" (проверена {checked_at.strftime('%d-%m-%Y %H:%M:%S')})"
+        refresh = asyncio.create_task(check_remote_version())
+        BACKGROUND_TASKS.add(refresh)
+        refresh.add_done_callback(BACKGROUND_TASKS.discard)
+    else:
+        # Версия, полученная менее VERSION_CACHE_TTL секунд назад, отвечает без запроса
+        try:
+            server_version = await check_remote_version()
+        except Exception as e:
+            logger.error(f"Ошибка при скачивании файла для получения версии: {e}")
+            server_version = "Не удалось получить версию с сервера"
     
     # Логируем версию с сервера
     logger.info(f"Версия на сервере: {server_version}")
@@ -356,7 +2112,9 @@ async def start(update: Update, context: CallbackContext):
         version_status = f"📥 Обнаружена новая версия на GitHub: {server_version}"
 
     # Преобразуем интервал в более удобный формат
-    formatted_check_interval = format_time_interval(CHECK_INTERVAL)
+    status = TARGET_STATUS.get(TARGETS[0]["name"])
+    formatted_check_interval = format_time_interval(status["interval"] if status else polling_interval(TARGETS[0]))
+    next_check = status["next_check"].strftime('%d-%m-%Y %H:%M:%S') if status else "после первой проверки"
     
     # Формируем стартовое сообщение
     start_message = (
@@ -365,14 +2123,17 @@ async def start(update: Update, context: CallbackContext):
         "Этот бот создан для мониторинга обновлений стратегии NostalgiaForInfinityX5.\n\n"
         f"📊  Стартовая информация:\n"
         f"📂  Версия локального файла: {local_version}\n"
-        f"🌐  Версия на сервере: {server_version}\n"
+        f"🌐  Версия на сервере: {server_version}{server_note}\n"
         f"{version_status}\n"
-        f"🕒  Интервал проверки обновлений: {formatted_check_interval}\n\n"
+        f"🕒  Интервал проверки обновлений: {formatted_check_interval}\n"
+        f"⏭️  Следующая проверка обновлений: {next_check}\n\n"
         "📌 Основные функции:\n"
         "1️⃣ Проверка актуальной версии файла.\n"
         "2️⃣ Загрузка обновлений стратегии.\n"
         "3️⃣ Отображение последних коммитов из GitHub.\n"
-        "4️⃣ Перезапуск Freqtrade после обновления.\n\n"
+        "4️⃣ Перезапуск Freqtrade после обновления.\n"
+        f"5️⃣ Состояние отслеживаемых файлов ({len(TARGETS)}).\n"
+        "6️⃣ Откат к сохранённой версии без скачивания.\n\n"
         "Используйте кнопки ниже для управления."
     )
 
@@ -381,28 +2142,283 @@ async def start(update: Update, context: CallbackContext):
         [InlineKeyboardButton("🔍 Проверить версию файла", callback_data='check_version')],
         [InlineKeyboardButton("📥 Скачать обновление", callback_data='download_file')],
         [InlineKeyboardButton("📜 Последние коммиты", callback_data='check_commits')],
-        [InlineKeyboardButton("🔄 Перезапустить Freqtrade", callback_data='reload_freqtrade')]
+        [InlineKeyboardButton("🔄 Перезапустить Freqtrade", callback_data='reload_freqtrade')],
+        [InlineKeyboardButton("📋 Отслеживаемые файлы", callback_data='show_status')],
+        [InlineKeyboardButton("⏪ Откат", callback_data='rollback')]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     if update.message:
         await update.message.reply_text(start_message, reply_markup=reply_markup)
 
+# Соединение с базой состояния, открывается при первом обращении
+STATE_CONNECTION = None
+
+# Соединение используется рабочими потоками совместно
+STATE_LOCK = threading.Lock()
+
+# Чаты, которые получают уведомления об обновлениях в дополнение к CHAT_ID
+SUBSCRIBERS = set()
+
+# Таблицы базы состояния
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checks (
+    id INTEGER PRIMARY KEY,
+    target TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    result TEXT NOT NULL,
+    interval INTEGER NOT NULL,
+    next_check REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS checks_target ON checks (target, id);
+CREATE TABLE IF NOT EXISTS remote_files (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, version TEXT);
+CREATE TABLE IF NOT EXISTS remote_versions (url TEXT PRIMARY KEY, version TEXT NOT NULL, checked_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS remote_trees (url TEXT PRIMARY KEY, etag TEXT, shas TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS commits (repo TEXT NOT NULL, sha TEXT NOT NULL, date TEXT NOT NULL, message TEXT NOT NULL, PRIMARY KEY (repo, sha));
+CREATE TABLE IF NOT EXISTS commit_requests (repo TEXT PRIMARY KEY, url TEXT, etag TEXT);
+CREATE TABLE IF NOT EXISTS subscriptions (chat_id TEXT PRIMARY KEY, subscribed_at REAL NOT NULL);
+"""
+
+# Открываем базу состояния
+def get_state_connection():
+    """Возвращает соединение с STATE_DB, создавая таблицы при первом обращении."""
+    global STATE_CONNECTION
+    if STATE_CONNECTION is None:
+        os.makedirs(os.path.dirname(os.path.abspath(STATE_DB)), exist_ok=True)
+        connection = sqlite3.connect(STATE_DB, check_same_thread=False)
+        # WAL не блокирует читателей, NORMAL сбрасывает на диск только на контрольных точках, для кэша этого достаточно
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(STATE_SCHEMA)
+        STATE_CONNECTION = connection
+    return STATE_CONNECTION
+
+# Читаем состояние, сохранённое до перезапуска
+def read_state():
+    """Возвращает все строки, нужные для тёплого старта. Выполняется в рабочем потоке."""
+    with STATE_LOCK:
+        connection = get_state_connection()
+        return {
+            "checks": connection.execute(
+                "SELECT target, checked_at, duration, result, interval, next_check FROM checks "
+                "WHERE id IN (SELECT MAX(id) FROM checks GROUP BY target)").fetchall(),
+            "remote_files": connection.execute("SELECT url, etag, last_modified, version FROM remote_files").fetchall(),
+            "remote_versions": connection.execute("SELECT url, version, checked_at FROM remote_versions").fetchall(),
+            "remote_trees": connection.execute("SELECT url, etag, shas FROM remote_trees").fetchall(),
+            "commits": connection.execute("SELECT repo, sha, date, message FROM commits").fetchall(),
+            "commit_requests": connection.execute("SELECT repo, url, etag FROM commit_requests").fetchall(),
+            "subscriptions": connection.execute("SELECT chat_id FROM subscriptions").fetchall(),
+        }
+
+# Прогреваем кэши из базы состояния
+async def load_state():
+    """Восстанавливает последние проверки, ETag, удалённые версии, SHA blob, коммиты и подписки."""
+    try:
+        state = await asyncio.to_thread(read_state)
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка при чтении базы состояния {STATE_DB}: {e}")
+        return
+    timezone = pytz.timezone(TIMEZONE)
+    for name, checked_at, duration, result, interval, next_check in state["checks"]:
+        TARGET_STATUS[name] = {
+            "last_check": datetime.fromtimestamp(checked_at, timezone),
+            "duration": duration,
+            "result": result,
+            "interval": int(interval),  # В прежних базах столбец был REAL
+            "next_check": datetime.fromtimestamp(next_check, timezone),
+        }
+    for url, etag, last_modified, version in state["remote_files"]:
+        REMOTE_FILE_CACHE[url] = {"etag": etag, "last_modified": last_modified, "version": version}
+    for url, version, checked_at in state["remote_versions"]:
+        # В памятке хранится монотонное время, возраст сохранённой версии переносится через перезапуск
+        VERSION_MEMO[url] = (time.monotonic() - max(0.0, time.time() - checked_at), version)
+    for url, etag, shas in state["remote_trees"]:
+        REMOTE_TREE_CACHE[url] = {"etag": etag, "shas": json.loads(shas)}
+    commits = {}
+    for repo, sha, date, message in state["commits"]:
+        commits.setdefault(repo, []).append(CommitRecord(sha, datetime.fromisoformat(date), message))
+    for repo, records in commits.items():
+        add_commits_to_cache(repo, records)
+    for repo, url, etag in state["commit_requests"]:
+        cache = get_commit_cache(repo)
+        cache["url"], cache["etag"] = url, etag
+    SUBSCRIBERS.update(chat_id for chat_id, in state["subscriptions"])
+    logger.info(f"Состояние восстановлено из {STATE_DB}: файлов {len(state['checks'])}, удалённых версий {len(state['remote_files'])}, "
+                f"коммитов {len(state['commits'])}, подписчиков {len(SUBSCRIBERS)}")
+
+# Записываем состояние в базу
+def write_state(remote_files, remote_versions, remote_trees, commits, commit_requests, check):
+    """Заменяет строки кэшей и добавляет проверку в историю одной транзакцией. Выполняется в рабочем потоке."""
+    with STATE_LOCK:
+        connection = get_state_connection()
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO remote_files VALUES (?, ?, ?, ?)", remote_files)
+            connection.executemany("INSERT OR REPLACE INTO remote_versions VALUES (?, ?, ?)", remote_versions)
+            connection.executemany("INSERT OR REPLACE INTO remote_trees VALUES (?, ?, ?)", remote_trees)
+            connection.execute("DELETE FROM commits")  # Кэш коммитов забывает старые дни, строки тоже
+            connection.executemany("INSERT INTO commits VALUES (?, ?, ?, ?)", commits)
+            connection.executemany("INSERT OR REPLACE INTO commit_requests VALUES (?, ?, ?)", commit_requests)
+            if check:
+                connection.execute(
+                    "INSERT INTO checks (target, checked_at, duration, result, interval, next_check) VALUES (?, ?, ?, ?, ?, ?)", check)
+                connection.execute(
+                    "DELETE FROM checks WHERE target = ? AND id NOT IN "
+                    "(SELECT id FROM checks WHERE target = ? ORDER BY id DESC LIMIT ?)", (check[0], check[0], CHECK_HISTORY_LIMIT))
+
+# Сохраняем состояние после проверки
+async def save_state(target_name=None, status=None):
+    """Копирует кэши в цикле событий и записывает их в базу состояния в рабочем потоке."""
+    remote_files = [(url, entry.get("etag"), entry.get("last_modified"), entry["version"]) for url, entry in REMOTE_FILE_CACHE.items()]
+    remote_versions = [(url, version, time.time() - (time.monotonic() - received)) for url, (received, version) in VERSION_MEMO.items()]
+    remote_trees = [(url, entry["etag"], json.dumps(entry["shas"])) for url, entry in REMOTE_TREE_CACHE.items()]
+    commits = [(repo, record.sha, record.date.isoformat(), record.message)
+               for repo, cache in COMMIT_CACHE.items() for records in cache["by_date"].values() for record in records]
+    commit_requests = [(repo, cache["url"], cache["etag"]) for repo, cache in COMMIT_CACHE.items()]
+    check = None
+    if status:
+        check = (target_name, status["last_check"].timestamp(), status["duration"], status["result"],
+                 status["interval"], status["next_check"].timestamp())
+    try:
+        await asyncio.to_thread(write_state, remote_files, remote_versions, remote_trees, commits, commit_requests, check)
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка при записи базы состояния {STATE_DB}: {e}")
+
+# Подписываем чат на уведомления об обновлениях или отписываем его
+def write_subscription(chat_id, subscribed):
+    """Добавляет чат в таблицу подписок или удаляет его. Выполняется в рабочем потоке."""
+    with STATE_LOCK:
+        connection = get_state_connection()
+        with connection:
+            if subscribed:
+                connection.execute("INSERT OR REPLACE INTO subscriptions VALUES (?, ?)", (chat_id, time.time()))
+            else:
+                connection.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+
+# Последние проверки из базы состояния
+def read_check_history(limit):
+    """Возвращает последние проверки всех файлов, начиная с самой новой. Выполняется в рабочем потоке."""
+    with STATE_LOCK:
+        return get_state_connection().execute(
+            "SELECT target, checked_at, duration, result FROM checks ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+# Отправляем уведомление об обновлении всем подписчикам
+async def notify_subscribers(message):
+    """Ставит сообщение в очередь для CHAT_ID и каждого подписанного чата."""
+    for chat_id in {str(CHAT_ID)} | SUBSCRIBERS:
+        await send_telegram_message(TELEGRAM_TOKEN, chat_id, message)
+
+# Обработчик команд /subscribe и /unsubscribe
+async def subscribe(update: Update, context: CallbackContext):
+    """Подписывает чат на уведомления об обновлениях или отписывает его."""
+    await log_telegram_message(update)
+    chat_id = str(update.effective_chat.id)
+    subscribed = update.message.text.split()[0].split("@")[0] == "/subscribe"
+    try:
+        await asyncio.to_thread(write_subscription, chat_id, subscribed)
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка при сохранении подписки {chat_id}: {e}")
+        await update.message.reply_text(f"❌ Не удалось сохранить подписку: {e}")
+        return
+    if subscribed:
+        SUBSCRIBERS.add(chat_id)
+        await update.message.reply_text("🔔 Этот чат будет получать уведомления об обновлениях стратегии. /unsubscribe — отписаться.")
+    else:
+        SUBSCRIBERS.discard(chat_id)
+        await update.message.reply_text("🔕 Этот чат больше не будет получать уведомления об обновлениях стратегии.")
+
+# Обработчик команды /history
+async def show_history(update: Update, context: CallbackContext):
+    """Показывает последние проверки, сохранённые в базе состояния."""
+    await log_telegram_message(update)
+    try:
+        rows = await asyncio.to_thread(read_check_history, 10)
+    except sqlite3.Error as e:
+        await update.message.reply_text(f"❌ Не удалось прочитать историю проверок: {e}")
+        return
+    if not rows:
+        await update.message.reply_text("Проверок пока не было.")
+        return
+    timezone = pytz.timezone(TIMEZONE)
+    lines = ["🗒️ Последние проверки:"]
+    for name, checked_at, duration, result in rows:
+        lines.append(f"{datetime.fromtimestamp(checked_at, timezone).strftime('%d-%m-%Y %H:%M:%S')} {name}: {result} ({duration:.2f} сек.)")
+    await update.message.reply_text("\n".join(lines))
+
+# Фоновые задачи бота; те, что ещё работают, отменяются при его остановке
+BACKGROUND_TASKS = set()
+
+# Выполняется в цикле событий бота перед получением обновлений
+async def on_startup(application: Application):
+    """Создаёт общую HTTP-сессию, восстанавливает сохранённое состояние, удаляет прерванные загрузки, сохраняет текущие файлы для отката, запускает отправку уведомлений, веб-сервер и фоновую проверку обновлений."""
+    get_http_session()
+    start_telegram_notifier()
+    await start_web_server(application)
+    await load_state()
+    await asyncio.to_thread(remove_stale_downloads)
+    await snapshot_live_files()
+    # Обычные задачи asyncio: приложение ещё не запущено, и его задачи не дожидались бы
+    BACKGROUND_TASKS.add(asyncio.create_task(measure_event_loop_lag()))
+    BACKGROUND_TASKS.add(asyncio.create_task(periodic_update_check()))
+
+# Запускаем бота с webhook'ом Telegram
+async def run_telegram_webhook(application: Application):
+    """Получает обновления на /telegram встроенного веб-сервера вместо длинного опроса."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    # Запуск в порядке run_polling, run_webhook запустил бы собственный сервер
+    await application.initialize()
+    await on_startup(application)
+    try:
+        await application.bot.set_webhook(TELEGRAM_WEBHOOK_URL, secret_token=TELEGRAM_WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES)
+        await application.start()
+        logger.info(f"Webhook Telegram установлен на {TELEGRAM_WEBHOOK_URL}.")
+        await stop.wait()
+    finally:
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        await on_shutdown(application)
+
+# Выполняется при остановке бота
+async def on_shutdown(application: Application):
+    """Отменяет фоновые задачи, останавливает веб-сервер, отправляет сообщения из очереди Telegram, сохраняет состояние и закрывает общую HTTP-сессию."""
+    for task in BACKGROUND_TASKS:
+        task.cancel()
+    await asyncio.gather(*BACKGROUND_TASKS, return_exceptions=True)
+    BACKGROUND_TASKS.clear()
+    await stop_web_server()
+    await stop_telegram_notifier()
+    await save_state()
+    if HTTP_SESSION is not None and not HTTP_SESSION.closed:
+        await HTTP_SESSION.close()
+    logger.info(format_http_stats())
+
 def main():
     """Основная функция для запуска бота и периодической проверки обновлений."""
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = Application.builder().token(TELEGRAM_TOKEN).post_init(on_startup).post_shutdown(on_shutdown).build()
 
     # Добавляем все обработчики
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("status", show_status))
+    application.add_handler(CommandHandler(["subscribe", "unsubscribe"], subscribe))
+    application.add_handler(CommandHandler("history", show_history))
     application.add_handler(CallbackQueryHandler(check_version, pattern='check_version'))
     application.add_handler(CallbackQueryHandler(download_file, pattern='download_file'))
     application.add_handler(CallbackQueryHandler(check_commits, pattern='check_commits'))
     application.add_handler(CallbackQueryHandler(reload_freqtrade, pattern='reload_freqtrade'))
+    application.add_handler(CallbackQueryHandler(show_status, pattern='show_status'))
+    application.add_handler(CallbackQueryHandler(show_snapshots, pattern='^rollback$'))
+    application.add_handler(CallbackQueryHandler(rollback_snapshot, pattern='^rollback:'))
 
-    # Запускаем фоновую задачу для проверки обновлений
-    asyncio.get_event_loop().create_task(periodic_update_check())
-
-    # Запускаем Telegram бота
+    # Запускаем Telegram бота, для webhook'а нужны веб-сервер и публичный адрес
+    if TELEGRAM_MODE == "webhook" and WEBHOOK_PORT and TELEGRAM_WEBHOOK_URL:
+        asyncio.run(run_telegram_webhook(application))
+        return
+    if TELEGRAM_MODE == "webhook":
+        logger.warning("Для TELEGRAM_MODE=webhook нужны WEBHOOK_PORT и TELEGRAM_WEBHOOK_URL, используется длинный опрос.")
     application.run_polling()
 
 if __name__ == "__main__":
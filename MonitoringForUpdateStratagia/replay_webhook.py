@@ -0,0 +1,52 @@
+#replay_webhook.py
+# Replays a recorded GitHub webhook payload or a Telegram update against the bot's web server.
+# Usage: python replay_webhook.py Example.push.json [--event push] [--url http://localhost:8000/github]
+#        python replay_webhook.py Example.update.json --telegram [--url http://localhost:8000/telegram]
+from dotenv import load_dotenv
+import urllib.request
+import urllib.error
+import argparse
+import hashlib
+import hmac
+import os
+
+# Loading environment variables from .env
+load_dotenv()
+
+def main():
+    """Signs the payload with GITHUB_WEBHOOK_SECRET and posts it like GitHub does.
+
+    With --telegram the payload is a Telegram Update and is posted with TELEGRAM_WEBHOOK_SECRET like Telegram does."""
+    parser = argparse.ArgumentParser(description="Replay a recorded GitHub webhook payload or a Telegram update.")
+    parser.add_argument("payload", help="JSON file with the payload (GitHub: Settings > Webhooks > Recent Deliveries)")
+    parser.add_argument("--event", default="push", help="value of the X-GitHub-Event header")
+    parser.add_argument("--telegram", action="store_true", help="post a Telegram Update to /telegram")
+    parser.add_argument("--url")
+    parser.add_argument("--secret")
+    args = parser.parse_args()
+
+    with open(args.payload, "rb") as f:
+        body = f.read()
+    if args.telegram:
+        url = args.url or f"http://localhost:{os.getenv('WEBHOOK_PORT', '8000')}/telegram"
+        headers = {
+            "Content-Type": "application/json",
+            "X-Telegram-Bot-Api-Secret-Token": args.secret or os.getenv("TELEGRAM_WEBHOOK_SECRET", ""),
+        }
+    else:
+        url = args.url or f"http://localhost:{os.getenv('WEBHOOK_PORT', '8000')}/github"
+        secret = args.secret or os.getenv("GITHUB_WEBHOOK_SECRET", "")
+        headers = {
+            "Content-Type": "application/json",
+            "X-GitHub-Event": args.event,
+            "X-Hub-Signature-256": "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest(),
+        }
+    request = urllib.request.Request(url, data=body, method="POST", headers=headers)
+    try:
+        with urllib.request.urlopen(request) as response:
+            print(response.status, response.read().decode())
+    except urllib.error.HTTPError as e:
+        print(e.code, e.read().decode())
+
+if __name__ == "__main__":
+    main()